@@ -0,0 +1,77 @@
+"""create_jobs_table
+
+Revision ID: c4a7d2e9f1b3
+Revises: b1fbfb201ed2
+Create Date: 2026-10-18 10:12:04.518342
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c4a7d2e9f1b3"
+down_revision: Union[str, None] = "b1fbfb201ed2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "jobs",
+        sa.Column("id", sa.UUID(), autoincrement=False, nullable=False),
+        sa.Column("user_id", sa.UUID(), autoincrement=False, nullable=False),
+        sa.Column("service_type", sa.TEXT(), autoincrement=False, nullable=False),
+        sa.Column(
+            "status",
+            sa.TEXT(),
+            server_default=sa.text("'queued'"),
+            autoincrement=False,
+            nullable=False,
+        ),
+        sa.Column("content_type", sa.TEXT(), autoincrement=False, nullable=False),
+        sa.Column("image_input", postgresql.BYTEA(), autoincrement=False, nullable=False),
+        sa.Column("image_output", postgresql.BYTEA(), autoincrement=False, nullable=True),
+        sa.Column("error", sa.TEXT(), autoincrement=False, nullable=True),
+        sa.Column("status_code", sa.INTEGER(), autoincrement=False, nullable=True),
+        sa.Column(
+            "attempts",
+            sa.INTEGER(),
+            server_default=sa.text("0"),
+            autoincrement=False,
+            nullable=False,
+        ),
+        sa.Column(
+            "created_at",
+            postgresql.TIMESTAMP(timezone=True),
+            server_default=sa.text("now()"),
+            autoincrement=False,
+            nullable=False,
+        ),
+        sa.Column(
+            "started_at",
+            postgresql.TIMESTAMP(timezone=True),
+            autoincrement=False,
+            nullable=True,
+        ),
+        sa.Column(
+            "finished_at",
+            postgresql.TIMESTAMP(timezone=True),
+            autoincrement=False,
+            nullable=True,
+        ),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], name="jobs_user_id_fkey"),
+        sa.PrimaryKeyConstraint("id", name="jobs_pkey"),
+    )
+    op.create_index(
+        "jobs_status_created_at_idx", "jobs", ["status", "created_at"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("jobs_status_created_at_idx", table_name="jobs")
+    op.drop_table("jobs")
@@ -0,0 +1,212 @@
+"""partition_tracking_by_month
+
+Revision ID: e7b3c1f0a9d4
+Revises: c4a7d2e9f1b3
+Create Date: 2026-10-18 16:05:41.208315
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e7b3c1f0a9d4"
+down_revision: Union[str, None] = "c4a7d2e9f1b3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Creates the partition holding a UTC month of tracking, bounds are UTC midnights
+CREATE_PARTITION_FUNCTION = """
+CREATE OR REPLACE FUNCTION tracking_ensure_partition(month date) RETURNS text AS $$
+DECLARE
+    start_date date := date_trunc('month', month)::date;
+    partition_name text := 'tracking_' || to_char(start_date, 'YYYY_MM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF tracking FOR VALUES FROM (%L) TO (%L)',
+        partition_name,
+        start_date::timestamp AT TIME ZONE 'UTC',
+        (start_date + interval '1 month')::timestamp AT TIME ZONE 'UTC'
+    );
+    RETURN partition_name;
+END
+$$ LANGUAGE plpgsql
+"""
+
+# One partition per month from the oldest row to two months ahead
+CREATE_PARTITIONS = """
+SELECT tracking_ensure_partition(month::date)
+FROM generate_series(
+    date_trunc('month', COALESCE(
+        (SELECT min(created_at) FROM tracking_unpartitioned), now()
+    ) AT TIME ZONE 'UTC'),
+    date_trunc('month', GREATEST(
+        (SELECT max(created_at) FROM tracking_unpartitioned), now() + interval '2 month'
+    ) AT TIME ZONE 'UTC'),
+    interval '1 month'
+) AS month
+"""
+
+COPY_TRACKING = """
+INSERT INTO tracking (
+    id, user_id, image, image_input, image_output, service_type, response,
+    status_code, credits, response_time, created_at
+)
+SELECT
+    id, user_id, COALESCE(image_input, ''), image_input, image_output, service_type,
+    response, status_code, credits, response_time,
+    COALESCE(created_at, response_time, now())
+FROM tracking_unpartitioned
+"""
+
+BACKFILL_USAGE = """
+INSERT INTO tracking_usage_daily (user_id, day, service_type, calls, credits, errors)
+SELECT
+    user_id,
+    (created_at AT TIME ZONE 'UTC')::date,
+    service_type,
+    count(*),
+    COALESCE(sum(credits), 0),
+    count(*) FILTER (WHERE status_code >= 400)
+FROM tracking
+WHERE user_id IS NOT NULL AND service_type IS NOT NULL
+GROUP BY 1, 2, 3
+"""
+
+
+def upgrade() -> None:
+    # The partitioned table replaces tracking, existing rows are copied over
+    op.rename_table("tracking", "tracking_unpartitioned")
+    op.execute("ALTER INDEX tracking_pkey RENAME TO tracking_unpartitioned_pkey")
+    op.create_table(
+        "tracking",
+        sa.Column("id", sa.UUID(), autoincrement=False, nullable=False),
+        sa.Column("user_id", sa.UUID(), autoincrement=False, nullable=True),
+        sa.Column("image", sa.TEXT(), autoincrement=False, nullable=True),
+        sa.Column("image_input", sa.TEXT(), autoincrement=False, nullable=True),
+        sa.Column("image_output", sa.TEXT(), autoincrement=False, nullable=True),
+        sa.Column("service_type", sa.TEXT(), autoincrement=False, nullable=True),
+        sa.Column("credits", sa.INTEGER(), autoincrement=False, nullable=True),
+        sa.Column(
+            "response_time",
+            postgresql.TIMESTAMP(timezone=True),
+            server_default=sa.text("now()"),
+            autoincrement=False,
+            nullable=True,
+        ),
+        sa.Column("status_code", sa.INTEGER(), autoincrement=False, nullable=True),
+        sa.Column("response", sa.TEXT(), autoincrement=False, nullable=True),
+        sa.Column(
+            "created_at",
+            postgresql.TIMESTAMP(timezone=True),
+            server_default=sa.text("now()"),
+            autoincrement=False,
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(
+            ["user_id"], ["users.id"], name="tracking_user_id_fkey"
+        ),
+        # The partition key has to be part of the primary key
+        sa.PrimaryKeyConstraint("id", "created_at", name="tracking_pkey"),
+        postgresql_partition_by="RANGE (created_at)",
+    )
+    # Created on the parent, every partition gets its own copy
+    op.create_index(
+        "tracking_user_id_created_at_idx",
+        "tracking",
+        ["user_id", "created_at"],
+        unique=False,
+    )
+    op.execute(CREATE_PARTITION_FUNCTION)
+    op.execute(CREATE_PARTITIONS)
+    op.execute(COPY_TRACKING)
+    op.drop_table("tracking_unpartitioned")
+
+    op.create_table(
+        "tracking_usage_daily",
+        sa.Column("user_id", sa.UUID(), autoincrement=False, nullable=False),
+        sa.Column("day", sa.DATE(), autoincrement=False, nullable=False),
+        sa.Column("service_type", sa.TEXT(), autoincrement=False, nullable=False),
+        sa.Column(
+            "calls",
+            sa.INTEGER(),
+            server_default=sa.text("0"),
+            autoincrement=False,
+            nullable=False,
+        ),
+        sa.Column(
+            "credits",
+            sa.INTEGER(),
+            server_default=sa.text("0"),
+            autoincrement=False,
+            nullable=False,
+        ),
+        sa.Column(
+            "errors",
+            sa.INTEGER(),
+            server_default=sa.text("0"),
+            autoincrement=False,
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(
+            ["user_id"], ["users.id"], name="tracking_usage_daily_user_id_fkey"
+        ),
+        sa.PrimaryKeyConstraint(
+            "user_id", "day", "service_type", name="tracking_usage_daily_pkey"
+        ),
+    )
+    op.execute(BACKFILL_USAGE)
+
+
+def downgrade() -> None:
+    op.drop_table("tracking_usage_daily")
+    op.rename_table("tracking", "tracking_partitioned")
+    op.execute("ALTER INDEX tracking_pkey RENAME TO tracking_partitioned_pkey")
+    op.create_table(
+        "tracking",
+        sa.Column("id", sa.UUID(), autoincrement=False, nullable=False),
+        sa.Column("user_id", sa.UUID(), autoincrement=False, nullable=True),
+        sa.Column("image_input", sa.TEXT(), autoincrement=False, nullable=True),
+        sa.Column("image_output", sa.TEXT(), autoincrement=False, nullable=True),
+        sa.Column("service_type", sa.TEXT(), autoincrement=False, nullable=True),
+        sa.Column("credits", sa.INTEGER(), autoincrement=False, nullable=True),
+        sa.Column(
+            "response_time",
+            postgresql.TIMESTAMP(timezone=True),
+            server_default=sa.text("now()"),
+            autoincrement=False,
+            nullable=True,
+        ),
+        sa.Column("status_code", sa.INTEGER(), autoincrement=False, nullable=True),
+        sa.Column("response", sa.TEXT(), autoincrement=False, nullable=True),
+        sa.Column(
+            "created_at",
+            postgresql.TIMESTAMP(timezone=True),
+            server_default=sa.text("now()"),
+            autoincrement=False,
+            nullable=True,
+        ),
+        sa.ForeignKeyConstraint(
+            ["user_id"], ["users.id"], name="tracking_user_id_fkey"
+        ),
+        sa.PrimaryKeyConstraint("id", name="tracking_pkey"),
+    )
+    op.execute(
+        """
+        INSERT INTO tracking (
+            id, user_id, image_input, image_output, service_type, credits,
+            response_time, status_code, response, created_at
+        )
+        SELECT
+            id, user_id, image_input, image_output, service_type, credits,
+            response_time, status_code, response, created_at
+        FROM tracking_partitioned
+        """
+    )
+    # Dropping the parent drops every partition
+    op.drop_table("tracking_partitioned")
+    op.execute("DROP FUNCTION tracking_ensure_partition(date)")
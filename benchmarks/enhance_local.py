@@ -0,0 +1,119 @@
+"""
+Benchmark of /enhance-photo-local/: the former four ImageEnhance passes + PNG encode
+against the fused engine in src/services/enhance.py.
+Each variant runs in its own process and peak memory is the VmHWM growth (Linux only).
+
+Usage: python benchmarks/enhance_local.py [image_path] [--repeat N]
+Without an image a synthetic 12 MP (4000x3000) JPEG photo is generated.
+"""
+
+import argparse
+import io
+import multiprocessing
+import os
+import sys
+import time
+
+from PIL import Image, ImageChops, ImageEnhance, ImageFilter, ImageStat
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.enhance import enhance_image, enhance_image_bytes  # noqa: E402
+
+
+def legacy_enhance(image: Image.Image) -> Image.Image:
+    image = ImageEnhance.Brightness(image).enhance(1.2)
+    image = ImageEnhance.Contrast(image).enhance(1.5)
+    image = ImageEnhance.Sharpness(image).enhance(2.0)
+    return ImageEnhance.Color(image).enhance(1.5)
+
+
+def legacy_enhance_bytes(image_bytes: bytes) -> bytes:
+    image = legacy_enhance(Image.open(io.BytesIO(image_bytes)))
+    img_byte_arr = io.BytesIO()
+    image.save(img_byte_arr, format="PNG")
+    return io.BytesIO(img_byte_arr.getvalue()).getvalue()
+
+
+def fused_enhance_bytes(image_bytes: bytes) -> bytes:
+    return enhance_image_bytes(image_bytes)[0]
+
+
+def synthetic_photo(width=4000, height=3000) -> bytes:
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 24)
+    image = Image.merge(
+        "RGB",
+        (
+            gradient,
+            gradient.transpose(Image.Transpose.ROTATE_180),
+            ImageChops.add(gradient.filter(ImageFilter.GaussianBlur(8)), noise, 2.0),
+        ),
+    )
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+def read_status_kib(field: str) -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def run_variant(name, image_bytes, repeat, results):
+    function = {"legacy": legacy_enhance_bytes, "fused": fused_enhance_bytes}[name]
+    # Reset the peak RSS high-water mark (Linux) so only this run is measured
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    baseline = read_status_kib("VmRSS")
+    started = time.process_time()
+    for _ in range(repeat):
+        function(image_bytes)
+    cpu = (time.process_time() - started) / repeat
+    peak = read_status_kib("VmHWM") - baseline
+    results[name] = (cpu, peak / 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("image", nargs="?")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    if args.image:
+        with open(args.image, "rb") as f:
+            image_bytes = f.read()
+    else:
+        image_bytes = synthetic_photo()
+
+    image = Image.open(io.BytesIO(image_bytes))
+    print(f"image: {image.size[0]}x{image.size[1]} {image.format}, {len(image_bytes)} bytes")
+
+    manager = multiprocessing.Manager()
+    results = manager.dict()
+    for name in ("legacy", "fused"):
+        process = multiprocessing.Process(
+            target=run_variant, args=(name, image_bytes, args.repeat, results)
+        )
+        process.start()
+        process.join()
+    for name in ("legacy", "fused"):
+        cpu, rss = results[name]
+        print(f"{name:>7}: {cpu * 1000:8.1f} ms CPU/call, peak memory +{rss:7.1f} MiB")
+    print(f"speedup: {results['legacy'][0] / results['fused'][0]:.1f}x CPU")
+
+    # Pixel difference of the enhancement itself, before encoding
+    image = image.convert("RGB")
+    difference = ImageChops.difference(legacy_enhance(image), enhance_image(image))
+    stats = ImageStat.Stat(difference)
+    print(
+        "difference vs legacy: max "
+        f"{max(high for _, high in difference.getextrema())} levels, mean "
+        f"{sum(stats.mean) / len(stats.mean):.3f} levels"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Microbenchmark of the statement work UserQuery does per call before asyncpg sees
+it: building the statement with literal values and looking it up in SQLAlchemy's
+compiled cache, against the prebuilt bindparam statements in src/queries/users.py.
+No database is needed, statements are compiled for the asyncpg dialect the same
+way Connection.execute does.
+
+Usage: python benchmarks/user_queries.py [--calls N]
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.dialects.postgresql.asyncpg import dialect as asyncpg_dialect  # noqa: E402
+from sqlalchemy.util import LRUCache  # noqa: E402
+
+from src.database.database import ALL_COLUMNS  # noqa: E402
+from src.models.user import users  # noqa: E402
+from src.queries.users import AUTHENTICATE_USER_QUERY, update_query_for  # noqa: E402
+
+DIALECT = asyncpg_dialect()
+EMAIL = "user@example.com"
+
+
+def compile_statement(statement, params, cache):
+    # What Connection.execute does before handing the SQL to the driver
+    statement._compile_w_cache(
+        dialect=DIALECT,
+        compiled_cache=cache,
+        column_keys=sorted(params or ()),
+        for_executemany=False,
+        schema_translate_map=None,
+    )
+
+
+def inline_select(cache):
+    compile_statement(users.select().where(users.c.email == EMAIL), None, cache)
+
+
+def prebuilt_select(cache):
+    compile_statement(AUTHENTICATE_USER_QUERY, {"email": EMAIL}, cache)
+
+
+def inline_update(cache):
+    user = {"email": EMAIL, "otp": 123456, "otp_expiration_time": datetime.now(timezone.utc)}
+    statement = (
+        users.update()
+        .where(users.c.email == user["email"], users.c.deleted_at.is_(None))
+        .values(user)
+        .returning(ALL_COLUMNS)
+    )
+    compile_statement(statement, None, cache)
+
+
+def prebuilt_update(cache):
+    user = {"email": EMAIL, "otp": 123456, "otp_expiration_time": datetime.now(timezone.utc)}
+    statement, params = update_query_for(user, active_only=True)
+    compile_statement(statement, params, cache)
+
+
+def run(function, calls: int) -> float:
+    cache = LRUCache(500)
+    function(cache)  # warm the compiled cache
+    started = time.perf_counter()
+    for _ in range(calls):
+        function(cache)
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    for name, inline, prebuilt in (
+        ("select", inline_select, prebuilt_select),
+        ("update", inline_update, prebuilt_update),
+    ):
+        built = run(inline, args.calls)
+        reused = run(prebuilt, args.calls)
+        print(f"{name} built per call : {built:8.2f} us/call")
+        print(f"{name} prebuilt       : {reused:8.2f} us/call ({built / reused:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
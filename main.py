@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from urllib.error import HTTPError
 
 from fastapi import FastAPI, status
@@ -5,16 +6,51 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
 from src.controllers.auth import AuthenticationRouter
+from src.controllers.jobs import JobsRouter
+from src.controllers.metrics import MetricsRouter
 from src.controllers.preprocessing import PreprocessingRouter
 from src.controllers.user import UserRouter
+from src.database.database import async_engine
+from src.helpers.rate_limit import RateLimitMiddleware
+from src.queries.user_cache import user_cache
+from src.services.credits import credit_ledger
+from src.services.outbox import email_outbox, email_templates
+from src.services.process_pool import image_process_pool
+from src.services.tracking import tracking_recorder
+from src.services.upstream import upstream_client
 from src.utils.config import DEBUG, DESCRIPTION, HOST, LOG_LEVEL, PORT, PROJECT_NAME
 
-app = FastAPI(title=PROJECT_NAME, description=DESCRIPTION)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open shared resources once per worker and release them on shutdown
+    await upstream_client.start()
+    image_process_pool.start()
+    await user_cache.start()
+    tracking_recorder.start()
+    email_templates.load()
+    email_outbox.start()
+    credit_ledger.start()
+    yield
+    await credit_ledger.close()
+    await email_outbox.close()
+    await tracking_recorder.close()
+    await user_cache.close()
+    await image_process_pool.close()
+    await upstream_client.close()
+    await async_engine.dispose()
+
+
+app = FastAPI(title=PROJECT_NAME, description=DESCRIPTION, lifespan=lifespan)
 # Including routers in the main app
 app.include_router(PreprocessingRouter, prefix="/preprocessing", tags=["Preprocessing"])
 app.include_router(UserRouter, prefix="/user", tags=["User"])
 app.include_router(AuthenticationRouter, prefix="/auth", tags=["Authentication"])
+app.include_router(JobsRouter, prefix="/jobs", tags=["Jobs"])
+app.include_router(MetricsRouter, prefix="/metrics", tags=["Metrics"])
 
+# Added before CORS so CORS wraps it and 429 responses still carry its headers
+app.add_middleware(RateLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Update this with your frontend origin
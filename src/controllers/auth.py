@@ -2,7 +2,9 @@ from fastapi import APIRouter, Depends, status
 from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordBearer
 
+from src.helpers.helpers import busy_response
 from src.services.auth import Authentication_Services
+from src.services.passwords import PasswordHashRejected
 from src.types.auth import Login, LoginResponse, VerifyAccountResponse, VerifyOTP
 from src.types.user import DefaultResponse, Signup
 
@@ -18,8 +20,10 @@ async def create_user(data: Signup) -> JSONResponse:
     endpoint = "signup"
     try:
         obj_Operations = Authentication_Services(endpoint=endpoint)
-        content, status_code = obj_Operations.signup(user=data)
+        content, status_code = await obj_Operations.signup(user=data)
         return JSONResponse(status_code=status_code, content=content)
+    except PasswordHashRejected as e:
+        return busy_response(e)
     except Exception:
         content = {
             "detail": f"Internal server error occurred in the {endpoint} endpoint."
@@ -36,7 +40,7 @@ async def verify_account(token) -> JSONResponse:
     endpoint = "verify-account"
     # try:
     obj_Operations = Authentication_Services(endpoint=endpoint)
-    content, status_code = obj_Operations.account_verification(token=token)
+    content, status_code = await obj_Operations.account_verification(token=token)
     return JSONResponse(status_code=status_code, content=content)
 
 
@@ -54,8 +58,10 @@ async def login(data: Login) -> JSONResponse:
     endpoint = "login"
     try:
         obj_Operations = Authentication_Services(endpoint=endpoint)
-        content, status_code = obj_Operations.login(data=data)
+        content, status_code = await obj_Operations.login(data=data)
         return JSONResponse(status_code=status_code, content=content)
+    except PasswordHashRejected as e:
+        return busy_response(e)
     except Exception:
         content = {
             "detail": f"Internal server error occurred in the {endpoint} endpoint."
@@ -70,8 +76,10 @@ async def verify_account_request(data: Login) -> JSONResponse:
     endpoint = "verify-account-request"
     try:
         obj_Operations = Authentication_Services(endpoint=endpoint)
-        content, status_code = obj_Operations.verify_account_request(data=data)
+        content, status_code = await obj_Operations.verify_account_request(data=data)
         return JSONResponse(status_code=status_code, content=content)
+    except PasswordHashRejected as e:
+        return busy_response(e)
     except Exception:
         content = {
             "detail": f"Internal server error occurred in the {endpoint} endpoint."
@@ -85,7 +93,7 @@ async def verify_account_request(data: Login) -> JSONResponse:
 async def verify_otp(data: VerifyOTP) -> JSONResponse:
     endpoint = "verify-otp"
     obj_Operations = Authentication_Services(endpoint=endpoint)
-    content, status_code = obj_Operations.verify_otp(
+    content, status_code = await obj_Operations.verify_otp(
         email=data.email, user_otp=data.user_otp
     )
     return JSONResponse(status_code=status_code, content=content)
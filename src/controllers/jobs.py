@@ -0,0 +1,68 @@
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, File, UploadFile, status
+from fastapi.responses import JSONResponse, Response
+
+from src.helpers.helpers import get_current_user
+from src.services.jobs import Jobs_Services
+from src.services.transcode import sniff_media_type
+from src.services.validate import IMAGE_MEDIA_TYPES, image_type_validate
+
+JobsRouter = APIRouter()
+
+
+@JobsRouter.post("/{operation}/")
+async def submit_job(
+    operation: str,
+    image: UploadFile = File(...),
+    current_user: dict = Depends(get_current_user),
+) -> JSONResponse:
+    endpoint = "submit-job"
+    try:
+        # Validate the image from its magic bytes and header
+        image_format, _ = image_type_validate(image)
+        # Read the image data
+        image_data = await image.read()
+        # Queue the job, a worker process runs it
+        obj_Operations = Jobs_Services(endpoint=endpoint)
+        content, status_code = await obj_Operations.submit_job(
+            current_user["sub"], operation, image_data, IMAGE_MEDIA_TYPES[image_format]
+        )
+        return JSONResponse(status_code=status_code, content=content)
+    except Exception:
+        content = {"detail": f"Error in {endpoint} endpoint."}
+        return JSONResponse(content=content, status_code=status.HTTP_409_CONFLICT)
+
+
+@JobsRouter.get("/{job_id}/")
+async def job_status(
+    job_id: UUID, current_user: dict = Depends(get_current_user)
+) -> JSONResponse:
+    endpoint = "job-status"
+    try:
+        obj_Operations = Jobs_Services(endpoint=endpoint)
+        content, status_code = await obj_Operations.job_status(
+            current_user["sub"], job_id
+        )
+        return JSONResponse(status_code=status_code, content=content)
+    except Exception:
+        content = {"detail": f"Error in {endpoint} endpoint."}
+        return JSONResponse(content=content, status_code=status.HTTP_409_CONFLICT)
+
+
+@JobsRouter.get("/{job_id}/result/")
+async def job_result(job_id: UUID, current_user: dict = Depends(get_current_user)):
+    endpoint = "job-result"
+    try:
+        obj_Operations = Jobs_Services(endpoint=endpoint)
+        content, status_code = await obj_Operations.job_result(
+            current_user["sub"], job_id
+        )
+        if status_code != status.HTTP_200_OK:
+            return JSONResponse(status_code=status_code, content=content)
+        # Return the image, typed from its bytes like the synchronous routes
+        media_type = sniff_media_type(content.image_output, content.content_type)
+        return Response(content.image_output, media_type=media_type)
+    except Exception:
+        content = {"detail": f"Error in {endpoint} endpoint."}
+        return JSONResponse(content=content, status_code=status.HTTP_409_CONFLICT)
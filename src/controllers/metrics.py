@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
+
+from src.helpers.helpers import require_metrics_token
+from src.helpers.metrics import collect_metrics
+
+MetricsRouter = APIRouter()
+
+
+@MetricsRouter.get("/", dependencies=[Depends(require_metrics_token)])
+async def read_metrics() -> JSONResponse:
+    return JSONResponse(content=collect_metrics())
@@ -1,36 +1,179 @@
-from io import BytesIO
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, File, UploadFile, status
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi import APIRouter, Depends, File, Query, Request, UploadFile, status
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
-from src.helpers.helpers import get_current_user
-from src.services.preprocessing import Preprocessing_Services
-from src.services.validate import image_type_validate
+from src.helpers.helpers import busy_response, get_current_user
+from src.helpers.rate_limit import rate_limiter
+from src.services.batch import Batch_Services
+from src.services.credits import InsufficientCredits
+from src.services.enhance import (
+    DEFAULT_BRIGHTNESS,
+    DEFAULT_COLOR,
+    DEFAULT_CONTRAST,
+    DEFAULT_SHARPNESS,
+)
+from src.services.limiter import LimiterRejected
+from src.services.preprocessing import (
+    Preprocessing_Services,
+    operation_credits,
+    upstream_operations,
+)
+from src.services.process_pool import ProcessPoolRejected
+from src.services.tracking import tracking_recorder
+from src.services.validate import IMAGE_MEDIA_TYPES, image_type_validate
+from src.services.transcode import MAX_EFFORT, negotiate_format
+from src.utils.config import BATCH_MAX_FILES, TRANSCODE_EFFORT, TRANSCODE_QUALITY
 
 PreprocessingRouter = APIRouter()
 
+# Tracked for a streamed response the client stopped reading (nginx's convention)
+CLIENT_CLOSED_REQUEST = 499
+
+# Manifest error of the batch files refused by the rate limit (429)
+RATE_LIMITED_ERROR = "Too many requests, retry later."
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    # Match the result ETag against the client's If-None-Match header. Only
+    # concrete tags count, "*" would answer 304 for any upload to these POST routes.
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in tags or f"W/{etag}" in tags
+
+
+def upload_report_headers(report: Optional[dict]) -> dict:
+    # What optimizing the upload saved this request, when it was optimized for it
+    if report is None:
+        return {}
+    return {
+        "X-Upload-Bytes-Saved": str(report["bytes_saved"]),
+        "X-Upload-Optimize-Ms": f"{report['seconds'] * 1000:.1f}",
+    }
+
+
+def output_options(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(avif|webp|jpe?g|png)$"),
+    quality: int = Query(TRANSCODE_QUALITY, ge=1, le=100),
+    effort: int = Query(TRANSCODE_EFFORT, ge=0, le=MAX_EFFORT),
+) -> Optional[dict]:
+    # Response format from the format query parameter or the Accept header
+    output_format = negotiate_format(request.headers.get("accept"), format)
+    if output_format is None:
+        return None
+    return {"format": output_format, "quality": quality, "effort": effort}
+
+
+def credits_response(error: InsufficientCredits) -> JSONResponse:
+    # Rejected before the upload, the API would have refused it with 4001
+    return JSONResponse(
+        content={"detail": str(error)}, status_code=status.HTTP_402_PAYMENT_REQUIRED
+    )
+
+
+async def upstream_image_response(
+    request: Request,
+    image: UploadFile,
+    endpoint: str,
+    stream: bool = False,
+    output: Optional[dict] = None,
+    email: Optional[str] = None,
+) -> Response:
+    # Validate the image from its magic bytes and header
+    image_format, _ = image_type_validate(image)
+    image_name = image.filename or "image"
+
+    def track(image_key, output_key, status_code, credits=0, response="OK"):
+        # Queued in memory, written to the tracking table in batches
+        tracking_recorder.record(
+            endpoint, status_code, credits, image_key, image_name, output_key, response, email
+        )
+
+    if stream:
+        # Pipe the upload to the API and relay its response without buffering
+        operation_object = Preprocessing_Services(endpoint=endpoint, image_bytes=None)
+        try:
+            body, media_type = await operation_object.stream(
+                image, IMAGE_MEDIA_TYPES[image_format]
+            )
+        except InsufficientCredits as e:
+            track(image_name, "stream", status.HTTP_402_PAYMENT_REQUIRED, response=str(e))
+            return credits_response(e)
+        except LimiterRejected as e:
+            track(image_name, "stream", status.HTTP_503_SERVICE_UNAVAILABLE, response=str(e))
+            return busy_response(e)
+        except Exception as e:
+            track(image_name, "stream", status.HTTP_409_CONFLICT, response=str(e))
+            raise
+
+        async def tracked_body():
+            # Tracked once the body is relayed or fails. The credits were committed
+            # when the API answered, so they are recorded whatever happens next.
+            status_code, response = status.HTTP_200_OK, "OK"
+            try:
+                async for chunk in body:
+                    yield chunk
+            except Exception as e:
+                status_code, response = status.HTTP_409_CONFLICT, str(e)
+                raise
+            except BaseException:
+                # Cancelled or closed when the client disconnects mid-stream
+                status_code, response = CLIENT_CLOSED_REQUEST, "Client disconnected"
+                raise
+            finally:
+                await body.aclose()
+                track(image_name, "stream", status_code, operation_credits[endpoint], response)
+
+        return StreamingResponse(tracked_body(), media_type=media_type)
+    # Read the image data
+    image_data = await image.read()
+    # Apply the operation mapped to the endpoint, repeated images hit the cache
+    operation_object = Preprocessing_Services(endpoint=endpoint, image_bytes=image_data)
+    etag = operation_object.output_etag(output)
+    headers = {"ETag": etag, "Vary": "Accept"}
+    if is_not_modified(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    # Tracking refers to the upload and the response by their result cache keys
+    image_key = operation_object.cache_key
+    output_key = operation_object.output_key(output)
+    try:
+        content, cached = await operation_object.process()
+    except InsufficientCredits as e:
+        track(image_key, output_key, status.HTTP_402_PAYMENT_REQUIRED, response=str(e))
+        return credits_response(e)
+    except LimiterRejected as e:
+        track(image_key, output_key, status.HTTP_503_SERVICE_UNAVAILABLE, response=str(e))
+        return busy_response(e)
+    except Exception as e:
+        track(image_key, output_key, status.HTTP_409_CONFLICT, response=str(e))
+        raise
+    # Results served from the cache cost no upstream credits
+    track(image_key, output_key, status.HTTP_200_OK, 0 if cached else operation_credits[endpoint])
+    headers["X-Cache"] = "HIT" if cached else "MISS"
+    headers.update(upload_report_headers(operation_object.upload_report))
+    # Transcode to the negotiated format off the event loop
+    content, media_type = await operation_object.render(
+        content, output, IMAGE_MEDIA_TYPES[image_format]
+    )
+    # Return the image
+    return Response(content, media_type=media_type, headers=headers)
+
 
 @PreprocessingRouter.post("/enhance-photo/")
 async def enhance_photo(
-    image: UploadFile = File(...), current_user: dict = Depends(get_current_user)
+    request: Request,
+    image: UploadFile = File(...),
+    stream: bool = False,
+    output: Optional[dict] = Depends(output_options),
+    current_user: dict = Depends(get_current_user),
 ):
     endpoint = "enhance-photo"
     try:
-        # Validate Image type
-        image_type_validate(image)
-
-        # Read the image data
-        image_data = await image.read()
-
-        # Apply the photo enhancer function
-        operation_object = Preprocessing_Services(
-            endpoint=endpoint, image_bytes=image_data
-        )
-        enhanced_image_data = operation_object.photo_enhancer()
-
-        # Return the enhanced image
-        return StreamingResponse(
-            BytesIO(enhanced_image_data), media_type=image.content_type
+        return await upstream_image_response(
+            request, image, endpoint, stream, output, current_user["sub"]
         )
     except Exception:
         content = {"detail": f"Error in {endpoint} endpoint."}
@@ -39,20 +182,17 @@ async def enhance_photo(
 
 @PreprocessingRouter.post("/remove-background/")
 async def remove_background(
-    image: UploadFile = File(...), current_user: dict = Depends(get_current_user)
+    request: Request,
+    image: UploadFile = File(...),
+    stream: bool = False,
+    output: Optional[dict] = Depends(output_options),
+    current_user: dict = Depends(get_current_user),
 ):
     endpoint = "remove-background"
     # try:
-    # Validate Image type
-    image_type_validate(image)
-    # Read the image data
-    image_data = await image.read()
-    # Apply the remove background function
-    operation_object = Preprocessing_Services(endpoint=endpoint, image_bytes=image_data)
-    content = operation_object.remove_background()
-
-    # Return the image
-    return StreamingResponse(BytesIO(content), media_type=image.content_type)
+    return await upstream_image_response(
+            request, image, endpoint, stream, output, current_user["sub"]
+        )
 
 
 # except Exception:
@@ -62,21 +202,17 @@ async def remove_background(
 
 @PreprocessingRouter.post("/photo-colorizer/")
 async def photo_colorizer(
-    image: UploadFile = File(...), current_user: dict = Depends(get_current_user)
+    request: Request,
+    image: UploadFile = File(...),
+    stream: bool = False,
+    output: Optional[dict] = Depends(output_options),
+    current_user: dict = Depends(get_current_user),
 ):
     endpoint = "photo-colorizer"
     try:
-        # Validate Image type
-        image_type_validate(image)
-        # Read the image data
-        image_data = await image.read()
-        # Apply the photo colorizer function
-        operation_object = Preprocessing_Services(
-            endpoint=endpoint, image_bytes=image_data
+        return await upstream_image_response(
+            request, image, endpoint, stream, output, current_user["sub"]
         )
-        content = operation_object.photo_colorizer()
-        # Return the image
-        return StreamingResponse(BytesIO(content), media_type=image.content_type)
     except Exception:
         content = {"detail": f"Error in {endpoint} endpoint."}
         return JSONResponse(content=content, status_code=status.HTTP_409_CONFLICT)
@@ -84,21 +220,17 @@ async def photo_colorizer(
 
 @PreprocessingRouter.post("/face-extraction/")
 async def face_extraction(
-    image: UploadFile = File(...), current_user: dict = Depends(get_current_user)
+    request: Request,
+    image: UploadFile = File(...),
+    stream: bool = False,
+    output: Optional[dict] = Depends(output_options),
+    current_user: dict = Depends(get_current_user),
 ):
     endpoint = "face-extraction"
     try:
-        # Validate Image type
-        image_type_validate(image)
-        # Read the image data
-        image_data = await image.read()
-        # Apply the face extraction function
-        operation_object = Preprocessing_Services(
-            endpoint=endpoint, image_bytes=image_data
+        return await upstream_image_response(
+            request, image, endpoint, stream, output, current_user["sub"]
         )
-        content = operation_object.segment_face_and_hair()
-        # Return the image
-        return StreamingResponse(BytesIO(content), media_type=image.content_type)
     except Exception:
         content = {"detail": f"Error in {endpoint} endpoint."}
         return JSONResponse(content=content, status_code=status.HTTP_409_CONFLICT)
@@ -106,21 +238,55 @@ async def face_extraction(
 
 @PreprocessingRouter.post("/photo-color-correction/")
 async def photo_color_correction(
-    image: UploadFile = File(...), current_user: dict = Depends(get_current_user)
+    request: Request,
+    image: UploadFile = File(...),
+    stream: bool = False,
+    output: Optional[dict] = Depends(output_options),
+    current_user: dict = Depends(get_current_user),
 ):
     endpoint = "photo-color-correction"
     try:
-        # Validate Image type
-        image_type_validate(image)
-        # Read the image data
-        image_data = await image.read()
-        # Apply the photo color correction function
-        operation_object = Preprocessing_Services(
-            endpoint=endpoint, image_bytes=image_data
+        return await upstream_image_response(
+            request, image, endpoint, stream, output, current_user["sub"]
+        )
+    except Exception:
+        content = {"detail": f"Error in {endpoint} endpoint."}
+        return JSONResponse(content=content, status_code=status.HTTP_409_CONFLICT)
+
+
+@PreprocessingRouter.post("/batch/{operation}/")
+async def batch_process(
+    request: Request,
+    operation: str,
+    images: List[UploadFile] = File(...),
+    output: Optional[dict] = Depends(output_options),
+    current_user: dict = Depends(get_current_user),
+):
+    endpoint = "batch"
+    if operation not in upstream_operations:
+        content = {"detail": f"Unsupported operation {operation}."}
+        return JSONResponse(content=content, status_code=status.HTTP_404_NOT_FOUND)
+    if len(images) > BATCH_MAX_FILES:
+        content = {"detail": f"A batch accepts at most {BATCH_MAX_FILES} images."}
+        return JSONResponse(
+            content=content, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+    try:
+        operation_object = Batch_Services(
+            endpoint=operation, output=output, email=current_user["sub"]
+        )
+        files = await operation_object.read_files(images)
+        # The route cost paid for one image, every other file is charged the same
+        # cost and the ones the rate limit buckets can't pay for are refused
+        accepted = sum(file is not None for _, _, file, _ in files)
+        allowed = 1 + rate_limiter.charge_units(request.scope, accepted - 1)
+        files = operation_object.refuse_files(files, allowed, RATE_LIMITED_ERROR)
+        # Stream the ZIP archive as the results complete
+        return StreamingResponse(
+            operation_object.stream_zip(files),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{operation}.zip"'},
         )
-        content = operation_object.photo_color_correction()
-        # Return the image
-        return StreamingResponse(BytesIO(content), media_type=image.content_type)
     except Exception:
         content = {"detail": f"Error in {endpoint} endpoint."}
         return JSONResponse(content=content, status_code=status.HTTP_409_CONFLICT)
@@ -128,21 +294,19 @@ async def photo_color_correction(
 
 @PreprocessingRouter.post("/create-mask-image/")
 async def create_mask_image(
-    image: UploadFile = File(...), current_user: dict = Depends(get_current_user)
+    image: UploadFile = File(...),
+    output: Optional[dict] = Depends(output_options),
+    current_user: dict = Depends(get_current_user),
 ):
     endpoint = "create-mask-image"
     try:
-        # Validate Image type
-        image_type_validate(image)
-        # Read the image data
-        image_data = await image.read()
-        # Apply the create mask function
-        operation_object = Preprocessing_Services(
-            endpoint=endpoint, image_bytes=image_data
-        )
-        content = operation_object.create_mask_image()
+        # Validate Image type, the mask only needs the size parsed from the header
+        _, size = image_type_validate(image)
+        # Apply the create mask function, the upload body is never read
+        operation_object = Preprocessing_Services(endpoint=endpoint, image_bytes=None)
+        content, media_type = await operation_object.create_mask_image(size, output)
         # Return the image
-        return StreamingResponse(content, media_type=image.content_type)
+        return Response(content, media_type=media_type, headers={"Vary": "Accept"})
     except Exception:
         content = {"detail": f"Error in {endpoint} endpoint."}
         return JSONResponse(content=content, status_code=status.HTTP_409_CONFLICT)
@@ -150,7 +314,13 @@ async def create_mask_image(
 
 @PreprocessingRouter.post("/enhance-photo-local/")
 async def enhance_image_local(
-    image: UploadFile = File(...), current_user: dict = Depends(get_current_user)
+    image: UploadFile = File(...),
+    brightness: float = Query(DEFAULT_BRIGHTNESS, ge=0, le=5),
+    contrast: float = Query(DEFAULT_CONTRAST, ge=0, le=5),
+    sharpness: float = Query(DEFAULT_SHARPNESS, ge=0, le=5),
+    color: float = Query(DEFAULT_COLOR, ge=0, le=5),
+    output: Optional[dict] = Depends(output_options),
+    current_user: dict = Depends(get_current_user),
 ):
     endpoint = "enhance-photo-local"
     try:
@@ -162,9 +332,13 @@ async def enhance_image_local(
         operation_object = Preprocessing_Services(
             endpoint=endpoint, image_bytes=image_data
         )
-        content = operation_object.enhance_image_local()
+        content, media_type = await operation_object.enhance_image_local(
+            brightness, contrast, sharpness, color, output
+        )
         # Return the image
-        return StreamingResponse(content, media_type=image.content_type)
+        return Response(content, media_type=media_type, headers={"Vary": "Accept"})
+    except ProcessPoolRejected as e:
+        return busy_response(e)
     except Exception:
         content = {"detail": f"Error in {endpoint} endpoint."}
         return JSONResponse(content=content, status_code=status.HTTP_409_CONFLICT)
@@ -1,8 +1,12 @@
+from datetime import date
+from typing import Optional
+
 from fastapi import APIRouter, Depends, status
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
 
-from src.helpers.helpers import get_current_user
+from src.helpers.helpers import busy_response, get_current_user
+from src.services.passwords import PasswordHashRejected
 from src.services.user import User_Services
 from src.types.user import DefaultResponse, ResetPassword, UpdatePassword, User
 
@@ -14,7 +18,7 @@ async def read_info(current_user: dict = Depends(get_current_user)) -> JSONRespo
     endpoint = "user-info"
     try:
         obj_Operations = User_Services(endpoint=endpoint)
-        content, status_code = obj_Operations.UserInfo(email=current_user["sub"])
+        content, status_code = await obj_Operations.UserInfo(email=current_user["sub"])
         return JSONResponse(
             status_code=status_code, content=jsonable_encoder(User(**dict(content)))
         )
@@ -29,7 +33,7 @@ async def read_info(current_user: dict = Depends(get_current_user)) -> JSONRespo
 async def forget_password(data: ResetPassword) -> JSONResponse:
     endpoint = "forget-password"
     obj_Operations = User_Services(endpoint=endpoint)
-    content, status_code = obj_Operations.forget_password(data.email)
+    content, status_code = await obj_Operations.forget_password(data.email)
     return JSONResponse(status_code=status_code, content=content)
 
 
@@ -40,14 +44,12 @@ async def update_password(
     endpoint = "update-password"
     try:
         obj_Operations = User_Services(endpoint=endpoint)
-        content, status_code = obj_Operations.UserInfo(current_user["sub"])
-        if status_code == 200:
-            content, status_code = obj_Operations.UpdateUserPassword(
-                current_user["sub"], user_req
-            )
-            return JSONResponse(status_code=status_code, content=content)
-        else:
-            return JSONResponse(status_code=status_code, content=content)
+        content, status_code = await obj_Operations.UpdateUserPassword(
+            current_user["sub"], user_req
+        )
+        return JSONResponse(status_code=status_code, content=content)
+    except PasswordHashRejected as e:
+        return busy_response(e)
     except Exception:
         content = {
             "detail": f"Internal server error occurred in the {endpoint} endpoint."
@@ -64,14 +66,12 @@ async def update_password_by_otp(
     endpoint = "update-password"
     try:
         obj_Operations = User_Services(endpoint=endpoint)
-        content, status_code = obj_Operations.UserInfo(current_user["sub"])
-        if status_code == 200:
-            content, status_code = obj_Operations.UpdateUserPasswordByOTP(
-                current_user["sub"], user_req
-            )
-            return JSONResponse(status_code=status_code, content=content)
-        else:
-            return JSONResponse(status_code=status_code, content=content)
+        content, status_code = await obj_Operations.UpdateUserPasswordByOTP(
+            current_user["sub"], user_req
+        )
+        return JSONResponse(status_code=status_code, content=content)
+    except PasswordHashRejected as e:
+        return busy_response(e)
     except Exception:
         content = {
             "detail": f"Internal server error occurred in the {endpoint} endpoint."
@@ -86,12 +86,8 @@ async def delete_account(
     endpoint = "delete-account"
     try:
         obj_Operations = User_Services(endpoint=endpoint)
-        content, status_code = obj_Operations.UserInfo(user_req.email)
-        if status_code == 200:
-            content, status_code = obj_Operations.DeleteUser(user_req.email)
-            return JSONResponse(status_code=status_code, content=content)
-        else:
-            return JSONResponse(status_code=status_code, content=content)
+        content, status_code = await obj_Operations.DeleteUser(user_req.email)
+        return JSONResponse(status_code=status_code, content=content)
     except Exception:
         content = {
             "detail": f"Internal server error occurred in the {endpoint} endpoint."
@@ -105,7 +101,25 @@ async def credit_balance(current_user: dict = Depends(get_current_user)):
     try:
         # Apply the photo enhancer function
         operation_object = User_Services(endpoint=endpoint)
-        content, status_code = operation_object.fetch_credit_balance()
+        content, status_code = await operation_object.fetch_credit_balance()
+        return JSONResponse(status_code=status_code, content=content)
+    except Exception:
+        content = {"detail": f"Error in {endpoint} endpoint."}
+        return JSONResponse(content=content, status_code=status.HTTP_409_CONFLICT)
+
+
+@UserRouter.get("/usage-summary/", tags=["User"])
+async def usage_summary(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    current_user: dict = Depends(get_current_user),
+) -> JSONResponse:
+    endpoint = "usage-summary"
+    try:
+        obj_Operations = User_Services(endpoint=endpoint)
+        content, status_code = await obj_Operations.usage_summary(
+            current_user["sub"], start, end
+        )
         return JSONResponse(status_code=status_code, content=content)
     except Exception:
         content = {"detail": f"Error in {endpoint} endpoint."}
@@ -1,17 +1,53 @@
-from src.database.database import engine
+import asyncio
+from contextlib import asynccontextmanager
 
+import asyncpg
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 
-def execute_all(query_statement):
-    with engine.begin() as conn:
-        result = conn.execute(query_statement).fetchall()
+from src.database.database import async_engine
+from src.database.pool import pool_monitor
+
+# Errors of an unreachable or dropped database rather than of the statement or its
+# data, retrying the same statement later can succeed. Driver calls made on the
+# raw connection (COPY) raise asyncpg's own errors instead of SQLAlchemy's.
+DATABASE_UNAVAILABLE_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    PoolTimeoutError,
+    OperationalError,
+    InterfaceError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+)
+
+
+@asynccontextmanager
+async def transaction():
+    # Checkout wait (including pre-ping) is recorded before the query runs
+    started = pool_monitor.checkout_started()
+    try:
+        conn = await async_engine.connect()
+    except PoolTimeoutError:
+        pool_monitor.checkout_timed_out()
+        raise
+    pool_monitor.checkout_finished(started)
+    async with conn:
+        async with conn.begin():
+            yield conn
+
+
+async def execute_all(query_statement, params=None):
+    async with transaction() as conn:
+        result = (await conn.execute(query_statement, params)).fetchall()
         if not result:
             return False
         return result
 
 
-def execute_one(query_statement):
-    with engine.begin() as conn:
-        result = conn.execute(query_statement).first()
+async def execute_one(query_statement, params=None):
+    async with transaction() as conn:
+        result = (await conn.execute(query_statement, params)).first()
         if not result:
             return False
         return result
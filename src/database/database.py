@@ -2,13 +2,35 @@ import uuid
 from datetime import datetime
 
 from sqlalchemy import MetaData, create_engine, func
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.sql.elements import literal_column
 
-from src.utils.config import get_database_url
-
-# Create sqlalchemy database engine
+from src.utils.config import (
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    get_async_database_url,
+    get_database_url,
+)
+
+# Pool settings shared by both engines
+POOL_OPTIONS = dict(
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
+
+# Create sqlalchemy database engine, kept sync for Alembic
 DB_URL = get_database_url()
-engine = create_engine(DB_URL)
+engine = create_engine(DB_URL, **POOL_OPTIONS)
+
+# Async engine (asyncpg) used by the application queries
+ASYNC_DB_URL = get_async_database_url()
+async_engine = create_async_engine(ASYNC_DB_URL, **POOL_OPTIONS)
 
 
 # create metadata bind from engine
@@ -0,0 +1,77 @@
+import time
+from bisect import bisect_left
+
+from sqlalchemy import event
+
+from src.database.database import async_engine
+from src.helpers.metrics import register_metrics
+
+# Upper bounds in seconds of the checkout wait histogram, the last bucket is open
+WAIT_BUCKETS = (0.001, 0.01, 0.1, 1.0)
+
+
+class PoolMonitor:
+    """
+    Live statistics of an engine's connection pool for /metrics.
+    Pool occupancy is read from the pool itself, connection churn from pool
+    events, and the time spent waiting for a connection is recorded by
+    execute_one/execute_all around each checkout.
+    """
+
+    def __init__(self, engine):
+        self.pool = engine.pool
+        self.counters = {
+            "connects": 0,
+            "invalidated": 0,
+            "timeouts": 0,
+            "checkouts": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS) + 1)
+        event.listen(engine.sync_engine, "connect", self._on_connect)
+        event.listen(engine.sync_engine, "invalidate", self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self.counters["connects"] += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        # Stale connections found by pre-ping or dropped mid-query
+        self.counters["invalidated"] += 1
+
+    def checkout_started(self) -> float:
+        return time.perf_counter()
+
+    def checkout_finished(self, started: float):
+        wait = time.perf_counter() - started
+        self.counters["checkouts"] += 1
+        self.counters["wait_seconds_total"] += wait
+        if wait > self.counters["wait_seconds_max"]:
+            self.counters["wait_seconds_max"] = wait
+        self.wait_buckets[bisect_left(WAIT_BUCKETS, wait)] += 1
+
+    def checkout_timed_out(self):
+        self.counters["timeouts"] += 1
+
+    def stats(self) -> dict:
+        checkouts = self.counters["checkouts"]
+        labels = [f"le_{bound}" for bound in WAIT_BUCKETS] + [f"gt_{WAIT_BUCKETS[-1]}"]
+        return {
+            "size": self.pool.size(),
+            "checked_out": self.pool.checkedout(),
+            "checked_in": self.pool.checkedin(),
+            # QueuePool counts overflow from -pool_size, only connections past the size matter
+            "overflow": max(0, self.pool.overflow()),
+            **self.counters,
+            "wait_seconds_total": round(self.counters["wait_seconds_total"], 6),
+            "wait_seconds_avg": round(
+                self.counters["wait_seconds_total"] / checkouts if checkouts else 0.0, 6
+            ),
+            "wait_seconds_max": round(self.counters["wait_seconds_max"], 6),
+            "wait_histogram": dict(zip(labels, self.wait_buckets)),
+        }
+
+
+# Monitor of the async engine used by the application queries
+pool_monitor = PoolMonitor(async_engine)
+register_metrics("database_pool", pool_monitor.stats)
@@ -23,8 +23,9 @@ CREATE INDEX ON "users" ("first_name");
 CREATE INDEX ON "users" ("last_name");
 
 CREATE Table "tracking" (
-    "id" UUID PRIMARY KEY,
+    "id" UUID NOT NULL,
     "user_id" UUID,
+    "image" TEXT,
     "image_input" TEXT,
     "image_output" TEXT,
     "service_type" TEXT,
@@ -32,14 +33,72 @@ CREATE Table "tracking" (
     "response_time" TIMESTAMPTZ DEFAULT Now(),
     "status_code" int,
     "response" TEXT,
-    "created_at" TIMESTAMPTZ DEFAULT Now()
-);
+    "created_at" TIMESTAMPTZ NOT NULL DEFAULT Now(),
+    PRIMARY KEY ("id", "created_at")
+) PARTITION BY RANGE ("created_at");
 
 ALTER TABLE
     "tracking"
 ADD
     FOREIGN KEY ("user_id") REFERENCES "users" ("id");
 
+CREATE INDEX ON "tracking" ("user_id", "created_at");
+
+-- One partition per UTC month, created ahead of time by the tracking recorder
+CREATE OR REPLACE FUNCTION tracking_ensure_partition(month date) RETURNS text AS $$
+DECLARE
+    start_date date := date_trunc('month', month)::date;
+    partition_name text := 'tracking_' || to_char(start_date, 'YYYY_MM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF tracking FOR VALUES FROM (%L) TO (%L)',
+        partition_name,
+        start_date::timestamp AT TIME ZONE 'UTC',
+        (start_date + interval '1 month')::timestamp AT TIME ZONE 'UTC'
+    );
+    RETURN partition_name;
+END
+$$ LANGUAGE plpgsql;
+
+SELECT tracking_ensure_partition(Now()::date);
+
+CREATE Table "tracking_usage_daily" (
+    "user_id" UUID NOT NULL,
+    "day" DATE NOT NULL,
+    "service_type" TEXT NOT NULL,
+    "calls" int NOT NULL DEFAULT 0,
+    "credits" int NOT NULL DEFAULT 0,
+    "errors" int NOT NULL DEFAULT 0,
+    PRIMARY KEY ("user_id", "day", "service_type")
+);
+
+ALTER TABLE
+    "tracking_usage_daily"
+ADD
+    FOREIGN KEY ("user_id") REFERENCES "users" ("id");
+
 SET timezone = 'UTC';
 
-CREATE INDEX ON "users" ("id");
\ No newline at end of file
+CREATE INDEX ON "users" ("id");
+CREATE Table "jobs" (
+    "id" UUID PRIMARY KEY,
+    "user_id" UUID NOT NULL,
+    "service_type" TEXT NOT NULL,
+    "status" TEXT NOT NULL DEFAULT 'queued',
+    "content_type" TEXT NOT NULL,
+    "image_input" BYTEA NOT NULL,
+    "image_output" BYTEA,
+    "error" TEXT,
+    "status_code" int,
+    "attempts" int NOT NULL DEFAULT 0,
+    "created_at" TIMESTAMPTZ NOT NULL DEFAULT Now(),
+    "started_at" TIMESTAMPTZ DEFAULT null,
+    "finished_at" TIMESTAMPTZ DEFAULT null
+);
+
+ALTER TABLE
+    "jobs"
+ADD
+    FOREIGN KEY ("user_id") REFERENCES "users" ("id");
+
+CREATE INDEX ON "jobs" ("status", "created_at");
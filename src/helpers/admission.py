@@ -0,0 +1,50 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class BoundedAdmission:
+    """
+    Admission control in front of a fixed set of workers (threads, processes).
+    At most workers + queue_size callers are admitted at once, the rest wait up
+    to timeout for a place and are then rejected with the owner's exception.
+
+    Usage:
+        async with admission.admit():
+            await run_on_a_worker()
+    """
+
+    def __init__(self, workers, queue_size, timeout, rejected_error, rejected_message):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.rejected_error = rejected_error
+        self.rejected_message = rejected_message
+        # Created on first use, inside the running event loop
+        self._semaphore = None
+        self.pending = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def admit(self):
+        """Holds one place for the duration of the block."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers + self.queue_size)
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise self.rejected_error(self.rejected_message)
+        self.pending += 1
+        try:
+            yield
+        finally:
+            self.pending -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "rejected": self.rejected,
+            "workers": self.workers,
+            "running": min(self.pending, self.workers),
+            "queued": max(0, self.pending - self.workers),
+        }
@@ -1,11 +1,14 @@
-from typing import Any, Dict
+import hmac
+from typing import Any, Dict, Optional
 
-from fastapi import HTTPException, Security, status
+from fastapi import Header, HTTPException, Security, status
+from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from pydantic import BaseModel
 
-from src.utils.config import ALGORITHM, SECRET_KEY
+from src.helpers.token_cache import token_cache
+from src.utils.config import ALGORITHM, METRICS_TOKEN, SECRET_KEY
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login", scheme_name="JWT")
 
@@ -19,7 +22,12 @@ def decode_access_token(token: str):
 
 
 async def get_current_user(token: str = Security(oauth2_scheme)):
-    payload = decode_access_token(token)
+    # Tokens already verified are served from the cache until their exp
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = decode_access_token(token)
+        if payload:
+            token_cache.set(token, payload)
     if not payload:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -29,6 +37,28 @@ async def get_current_user(token: str = Security(oauth2_scheme)):
     return payload  # Or load user from payload data, e.g., email or user ID
 
 
+def require_metrics_token(x_metrics_token: Optional[str] = Header(None)):
+    # Metrics expose balances, cache sizes and queue depths, only the scraper may read them
+    if (
+        not METRICS_TOKEN
+        or not x_metrics_token
+        or not hmac.compare_digest(x_metrics_token.encode(), METRICS_TOKEN.encode())
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid metrics token",
+        )
+
+
+def busy_response(error: Exception) -> JSONResponse:
+    # A bounded queue (upstream, process pool, password hashing) is full, ask the client to retry later
+    return JSONResponse(
+        content={"detail": str(error)},
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": "5"},
+    )
+
+
 # Helper function to convert Pydantic models to dictionaries
 def model_to_dict(obj: BaseModel) -> Dict[str, Any]:
     result = obj.__dict__
@@ -0,0 +1,14 @@
+from typing import Any, Callable, Dict
+
+# name -> callable returning a JSON-serializable snapshot of the component stats
+_metrics_providers: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+
+def register_metrics(name: str, provider: Callable[[], Dict[str, Any]]):
+    """Registers a stats provider to be reported by the /metrics endpoint."""
+    _metrics_providers[name] = provider
+
+
+def collect_metrics() -> Dict[str, Any]:
+    """Collects a snapshot from every registered provider."""
+    return {name: provider() for name, provider in _metrics_providers.items()}
@@ -0,0 +1,293 @@
+import math
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import status
+from fastapi.responses import JSONResponse
+from starlette.datastructures import MutableHeaders
+
+from src.helpers.helpers import decode_access_token
+from src.helpers.metrics import register_metrics
+from src.helpers.token_cache import token_cache
+from src.utils.config import (
+    RATE_LIMIT_ENABLED,
+    RATE_LIMIT_EXEMPT_PATHS,
+    RATE_LIMIT_IDLE_SECONDS,
+    RATE_LIMIT_IP_CAPACITY,
+    RATE_LIMIT_IP_RATE,
+    RATE_LIMIT_MAX_BUCKETS,
+    RATE_LIMIT_ROUTE_COSTS,
+    RATE_LIMIT_SHARDS,
+    RATE_LIMIT_TRUST_FORWARDED,
+    RATE_LIMIT_USER_CAPACITY,
+    RATE_LIMIT_USER_RATE,
+)
+
+# Idle buckets evicted at most per check, keeps every check O(1)
+EVICTIONS_PER_CHECK = 2
+
+
+def parse_route_costs(rules: str) -> list:
+    """
+    Parses "[METHOD ]prefix=cost" rules separated by commas.
+    Returns:
+        list: (method or None, prefix, cost), longest prefix first.
+    """
+    costs = []
+    for rule in filter(None, (rule.strip() for rule in rules.split(","))):
+        route, cost = rule.rsplit("=", 1)
+        method, _, prefix = route.strip().rpartition(" ")
+        costs.append((method.upper() or None, prefix, float(cost)))
+    return sorted(costs, key=lambda item: len(item[1]), reverse=True)
+
+
+class TokenBucketStore:
+    """
+    Token buckets keyed by ("user", sub) or ("ip", address), spread over shards.
+    Each shard keeps its buckets from least to most recently used, so the idle
+    ones are found at the front and evicted a few at a time on every check.
+    A bucket is [tokens, last refill] and is refilled lazily when it is used.
+    """
+
+    def __init__(
+        self,
+        shards=RATE_LIMIT_SHARDS,
+        max_buckets=RATE_LIMIT_MAX_BUCKETS,
+        idle_seconds=RATE_LIMIT_IDLE_SECONDS,
+    ):
+        self._shards = [OrderedDict() for _ in range(max(shards, 1))]
+        self.max_per_shard = max(max_buckets // len(self._shards), 1)
+        self.idle_seconds = idle_seconds
+        self.evictions = 0
+
+    def _bucket(self, key, capacity: float, rate: float, now: float) -> list:
+        shard = self._shards[hash(key) % len(self._shards)]
+        bucket = shard.get(key)
+        if bucket is None:
+            bucket = shard[key] = [capacity, now]
+        else:
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            shard.move_to_end(key)
+        for _ in range(EVICTIONS_PER_CHECK):
+            oldest_key, oldest = next(iter(shard.items()))
+            if oldest_key == key:
+                break
+            if len(shard) <= self.max_per_shard and now - oldest[1] < self.idle_seconds:
+                break
+            del shard[oldest_key]
+            self.evictions += 1
+        return bucket
+
+    def take(self, limits, cost: float, now: Optional[float] = None) -> dict:
+        """
+        Takes cost tokens from every bucket in limits, or from none of them.
+        Parameters:
+            limits (list): (key, capacity, rate) of each bucket the request is charged to.
+            cost (float): Tokens the request costs, capped at the bucket capacity.
+        Returns:
+            dict: allowed, and limit, remaining, reset (seconds until full) and
+                retry_after (seconds until allowed) of the most restrictive bucket.
+        """
+        now = time.monotonic() if now is None else now
+        buckets = [
+            (self._bucket(key, capacity, rate, now), capacity, rate)
+            for key, capacity, rate in limits
+        ]
+        allowed = all(bucket[0] >= min(cost, capacity) for bucket, capacity, _ in buckets)
+        if allowed:
+            for bucket, capacity, _ in buckets:
+                bucket[0] -= min(cost, capacity)
+        # Reported bucket: the one that denied the request, or the one closest to empty
+        bucket, capacity, rate = min(
+            buckets, key=lambda item: (item[0][0] - min(cost, item[1])) / item[2]
+        )
+        return {
+            "allowed": allowed,
+            "limit": capacity,
+            "remaining": bucket[0],
+            "reset": (capacity - bucket[0]) / rate,
+            "retry_after": 0 if allowed else (min(cost, capacity) - bucket[0]) / rate,
+        }
+
+    def take_up_to(self, limits, cost: float, count: int, now: Optional[float] = None) -> int:
+        """
+        Takes cost tokens per unit for as many of count units as every bucket in
+        limits can pay for.
+        Returns:
+            int: The number of units paid for, from 0 to count.
+        """
+        now = time.monotonic() if now is None else now
+        buckets = [
+            (self._bucket(key, capacity, rate, now), min(cost, capacity))
+            for key, capacity, rate in limits
+        ]
+        granted = min([count] + [int(bucket[0] // unit) for bucket, unit in buckets])
+        for bucket, unit in buckets:
+            bucket[0] -= granted * unit
+        return granted
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+
+class RateLimiter:
+    """
+    Charges each request its route cost in the bucket of its user (the sub of a
+    valid bearer token) and in the bucket of its client IP. The request is let
+    through only when both buckets can pay, so one account can't take a
+    worker's upstream capacity and one address can't hammer /auth/login/.
+    Buckets live in memory, so the limits apply per worker process.
+    """
+
+    def __init__(
+        self,
+        enabled=RATE_LIMIT_ENABLED,
+        user_capacity=RATE_LIMIT_USER_CAPACITY,
+        user_rate=RATE_LIMIT_USER_RATE,
+        ip_capacity=RATE_LIMIT_IP_CAPACITY,
+        ip_rate=RATE_LIMIT_IP_RATE,
+        route_costs=RATE_LIMIT_ROUTE_COSTS,
+        exempt_paths=RATE_LIMIT_EXEMPT_PATHS,
+        trust_forwarded=RATE_LIMIT_TRUST_FORWARDED,
+        store=None,
+    ):
+        self.enabled = enabled
+        self.user_capacity = user_capacity
+        self.user_rate = user_rate
+        self.ip_capacity = ip_capacity
+        self.ip_rate = ip_rate
+        self.route_costs = parse_route_costs(route_costs)
+        self.exempt_paths = tuple(path.strip() for path in exempt_paths.split(",") if path.strip())
+        self.trust_forwarded = trust_forwarded
+        self.store = store or TokenBucketStore()
+        self.counters = {
+            "allowed": 0,
+            "limited": 0,
+            "limited_users": 0,
+            "limited_ips": 0,
+            "limited_units": 0,
+        }
+
+    def exempt(self, path: str) -> bool:
+        return path.startswith(self.exempt_paths)
+
+    def cost(self, method: str, path: str) -> float:
+        for rule_method, prefix, cost in self.route_costs:
+            if path.startswith(prefix) and rule_method in (None, method):
+                return cost
+        return 1
+
+    def client_ip(self, scope, headers: dict) -> str:
+        forwarded = headers.get(b"x-forwarded-for")
+        if self.trust_forwarded and forwarded:
+            return forwarded.decode("latin-1").rsplit(",", 1)[-1].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    @staticmethod
+    def user_subject(headers: dict) -> Optional[str]:
+        # Same cache as get_current_user, an invalid token is limited by IP only
+        scheme, _, token = headers.get(b"authorization", b"").decode("latin-1").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return None
+        payload = token_cache.get(token)
+        if payload is None:
+            payload = decode_access_token(token)
+            if not payload:
+                return None
+            token_cache.set(token, payload)
+        return payload.get("sub")
+
+    def limits(self, scope):
+        """Returns the (key, capacity, rate) buckets a request is charged to and its user."""
+        headers = dict(scope["headers"])
+        limits = [(("ip", self.client_ip(scope, headers)), self.ip_capacity, self.ip_rate)]
+        subject = self.user_subject(headers)
+        if subject is not None:
+            limits.append((("user", subject), self.user_capacity, self.user_rate))
+        return limits, subject
+
+    def check(self, scope) -> dict:
+        limits, subject = self.limits(scope)
+        decision = self.store.take(limits, self.cost(scope["method"], scope["path"]))
+        if decision["allowed"]:
+            self.counters["allowed"] += 1
+        else:
+            self.counters["limited"] += 1
+            self.counters["limited_users" if subject is not None else "limited_ips"] += 1
+        return decision
+
+    def charge_units(self, scope, count: int) -> int:
+        """
+        Charges units of work a request fans out to beyond the one its route cost
+        covered (the extra files of a batch), each at the route cost.
+        Returns:
+            int: How many of the count units were paid for, the rest must be refused.
+        """
+        if count <= 0 or not self.enabled or self.exempt(scope["path"]):
+            return max(count, 0)
+        limits, _ = self.limits(scope)
+        granted = self.store.take_up_to(
+            limits, self.cost(scope["method"], scope["path"]), count
+        )
+        self.counters["limited_units"] += count - granted
+        return granted
+
+    def stats(self) -> dict:
+        return {**self.counters, "buckets": len(self.store), "evictions": self.store.evictions}
+
+
+def rate_limit_headers(decision: dict) -> dict:
+    headers = {
+        "RateLimit-Limit": str(math.floor(decision["limit"])),
+        "RateLimit-Remaining": str(math.floor(decision["remaining"])),
+        "RateLimit-Reset": str(math.ceil(decision["reset"])),
+    }
+    if not decision["allowed"]:
+        headers["Retry-After"] = str(max(math.ceil(decision["retry_after"]), 1))
+    return headers
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware answering 429 with Retry-After when the rate limiter denies
+    a request. Responses of the routes it checks carry the RateLimit-* headers.
+    """
+
+    def __init__(self, app, limiter=None):
+        self.app = app
+        self.limiter = limiter or rate_limiter
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not self.limiter.enabled
+            or self.limiter.exempt(scope["path"])
+        ):
+            await self.app(scope, receive, send)
+            return
+        headers = rate_limit_headers(self.limiter.check(scope))
+        if "Retry-After" in headers:
+            response = JSONResponse(
+                content={"detail": "Too many requests, retry later."},
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers=headers,
+            )
+            await response(scope, receive, send)
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                response_headers = MutableHeaders(scope=message)
+                for name, value in headers.items():
+                    response_headers.append(name, value)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+# Shared limiter behind RateLimitMiddleware
+rate_limiter = RateLimiter()
+register_metrics("rate_limit", rate_limiter.stats)
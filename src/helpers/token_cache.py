@@ -0,0 +1,87 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from src.helpers.metrics import register_metrics
+from src.utils.config import TOKEN_CACHE_ENABLED, TOKEN_CACHE_MAX_ITEMS
+
+
+class TokenCache:
+    """
+    Bounded LRU cache of verified bearer tokens -> decoded payload.
+    Only tokens that passed signature and claim checks are stored, each entry
+    expires at the token's own exp, and tokens without exp are never cached.
+    Keys are digests of the token so the cache doesn't keep bearer secrets around.
+    """
+
+    def __init__(self, enabled=TOKEN_CACHE_ENABLED, max_items=TOKEN_CACHE_MAX_ITEMS):
+        self.enabled = enabled
+        self.max_items = max_items
+        # key -> (payload, exp), ordered from least to most recently used
+        self._entries = OrderedDict()
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "evictions": 0,
+            "revoked": 0,
+        }
+
+    @staticmethod
+    def make_key(token: str) -> bytes:
+        return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        key = self.make_key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.counters["misses"] += 1
+            return None
+        payload, exp = entry
+        if exp <= time.time():
+            del self._entries[key]
+            self.counters["expired"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.counters["hits"] += 1
+        # Callers get their own copy, a mutation must not leak into later requests
+        return dict(payload)
+
+    def set(self, token: str, payload: dict):
+        """Stores the payload of a token that was just verified."""
+        exp = payload.get("exp")
+        if not self.enabled or not isinstance(exp, (int, float)):
+            return
+        key = self.make_key(token)
+        self._entries[key] = (dict(payload), exp)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_items:
+            self._entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def revoke(self, token: str):
+        """Revocation hook: drops one token so its next use is verified again."""
+        if self._entries.pop(self.make_key(token), None) is not None:
+            self.counters["revoked"] += 1
+
+    def revoke_subject(self, subject: str):
+        """Revocation hook: drops every cached token issued to a subject (sub claim)."""
+        keys = [
+            key
+            for key, (payload, _) in self._entries.items()
+            if payload.get("sub") == subject
+        ]
+        for key in keys:
+            del self._entries[key]
+        self.counters["revoked"] += len(keys)
+
+    def stats(self) -> dict:
+        return {**self.counters, "items": len(self._entries)}
+
+
+# Shared cache in front of get_current_user
+token_cache = TokenCache()
+register_metrics("token_cache", token_cache.stats)
@@ -0,0 +1,50 @@
+from sqlalchemy import (
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    Table,
+)
+from sqlalchemy.dialects.postgresql import UUID
+
+from src.database.database import default_now, metaData, new_uuid
+
+# Job status values, a job moves queued -> running -> succeeded | failed
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+jobs = Table(
+    "jobs",
+    metaData,
+    Column(
+        "id",
+        UUID(as_uuid=True),
+        primary_key=True,
+        nullable=False,
+        default=new_uuid,
+        index=True,
+    ),
+    Column(
+        "user_id",
+        UUID(as_uuid=True),
+        ForeignKey("users.id", name="fk_jobs_users"),
+        nullable=False,
+    ),
+    Column("service_type", String, nullable=False),
+    Column("status", String, nullable=False, default=JOB_QUEUED),
+    Column("content_type", String, nullable=False),
+    Column("image_input", LargeBinary, nullable=False),
+    Column("image_output", LargeBinary, nullable=True),
+    Column("error", String, nullable=True),
+    Column("status_code", Integer, nullable=True),
+    Column("attempts", Integer, nullable=False, default=0),
+    Column("created_at", DateTime(timezone=True), nullable=False, **default_now),
+    Column("started_at", DateTime(timezone=True), nullable=True),
+    Column("finished_at", DateTime(timezone=True), nullable=True),
+    Index("jobs_status_created_at_idx", "status", "created_at"),
+)
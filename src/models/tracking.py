@@ -1,15 +1,26 @@
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, Table
+from sqlalchemy import (
+    Column,
+    Date,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    PrimaryKeyConstraint,
+    String,
+    Table,
+)
 from sqlalchemy.dialects.postgresql import UUID
 
 from src.database.database import default_now, metaData, new_uuid, now
 
+# Range partitioned by month on created_at, partitions are created ahead of time
+# by tracking_ensure_partition() (see the partition_tracking_by_month migration)
 tracking = Table(
     "tracking",
     metaData,
     Column(
         "id",
         UUID(as_uuid=True),
-        primary_key=True,
         nullable=False,
         default=new_uuid,
         index=True,
@@ -27,6 +38,29 @@ tracking = Table(
     Column("response", String, nullable=False),
     Column("status_code", Integer, nullable=False),
     Column("credits", Integer, nullable=False),
-    Column("response_time", DateTime, nullable=False, onupdate=now, **default_now),
-    Column("created_at", DateTime, nullable=False, onupdate=now, **default_now),
+    Column("response_time", DateTime(timezone=True), nullable=False, onupdate=now, **default_now),
+    Column("created_at", DateTime(timezone=True), nullable=False, **default_now),
+    # The partition key has to be part of the primary key
+    PrimaryKeyConstraint("id", "created_at", name="tracking_pkey"),
+    Index("tracking_user_id_created_at_idx", "user_id", "created_at"),
+    postgresql_partition_by="RANGE (created_at)",
+)
+
+# Calls, credits and failed calls per user, UTC day and service type, kept up to
+# date in the same transaction as every tracking batch so usage never scans tracking
+tracking_usage_daily = Table(
+    "tracking_usage_daily",
+    metaData,
+    Column(
+        "user_id",
+        UUID(as_uuid=True),
+        ForeignKey("users.id", name="fk_tracking_usage_daily_users"),
+        nullable=False,
+    ),
+    Column("day", Date, nullable=False),
+    Column("service_type", String, nullable=False),
+    Column("calls", Integer, nullable=False, default=0),
+    Column("credits", Integer, nullable=False, default=0),
+    Column("errors", Integer, nullable=False, default=0),
+    PrimaryKeyConstraint("user_id", "day", "service_type", name="tracking_usage_daily_pkey"),
 )
@@ -0,0 +1,151 @@
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql import select
+
+from src.database.connection import execute_all, execute_one
+from src.models.jobs import JOB_FAILED, JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, jobs
+
+# Stored on jobs whose last attempt was lost with its worker
+STALE_JOB_ERROR = "The worker running this job stopped before it finished."
+
+# Columns returned when polling a job, the image payloads are left out
+JOB_STATUS_COLUMNS = (
+    jobs.c.id,
+    jobs.c.service_type,
+    jobs.c.status,
+    jobs.c.error,
+    jobs.c.status_code,
+    jobs.c.attempts,
+    jobs.c.created_at,
+    jobs.c.started_at,
+    jobs.c.finished_at,
+)
+
+
+class JobQuery:
+    @staticmethod
+    async def add_job(job_data: dict):
+        try:
+            query = jobs.insert().values(dict(job_data)).returning(*JOB_STATUS_COLUMNS)
+            return await execute_one(query)
+        except IntegrityError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Could not submit job",
+            )
+
+    @staticmethod
+    async def get_job(job_id, user_id):
+        query = select(*JOB_STATUS_COLUMNS).where(
+            jobs.c.id == job_id, jobs.c.user_id == user_id
+        )
+        return await execute_one(query)
+
+    @staticmethod
+    async def get_job_result(job_id, user_id):
+        query = select(jobs.c.status, jobs.c.content_type, jobs.c.image_output).where(
+            jobs.c.id == job_id, jobs.c.user_id == user_id
+        )
+        return await execute_one(query)
+
+    @staticmethod
+    async def claim_job(visibility_timeout: int, max_attempts: int):
+        """
+        Atomically claims the oldest runnable job for this worker.
+        Other workers skip rows locked here (FOR UPDATE SKIP LOCKED), so each job is
+        handed to exactly one worker. Jobs left running longer than the visibility
+        timeout by a crashed worker become claimable again.
+        Returns:
+            Row or False: The claimed job, False when the queue is empty.
+        """
+        stale_before = datetime.now(timezone.utc) - timedelta(seconds=visibility_timeout)
+        next_job = (
+            select(jobs.c.id)
+            .where(
+                jobs.c.attempts < max_attempts,
+                or_(
+                    jobs.c.status == JOB_QUEUED,
+                    and_(jobs.c.status == JOB_RUNNING, jobs.c.started_at < stale_before),
+                ),
+            )
+            .order_by(jobs.c.created_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        query = (
+            jobs.update()
+            .where(jobs.c.id == next_job)
+            .values(
+                status=JOB_RUNNING,
+                started_at=datetime.now(timezone.utc),
+                attempts=jobs.c.attempts + 1,
+            )
+            .returning(
+                jobs.c.id,
+                jobs.c.user_id,
+                jobs.c.service_type,
+                jobs.c.content_type,
+                jobs.c.image_input,
+                jobs.c.attempts,
+            )
+        )
+        return await execute_one(query)
+
+    @staticmethod
+    async def fail_stale_jobs(visibility_timeout: int, max_attempts: int) -> int:
+        """
+        Marks failed the jobs left running past the visibility timeout on their
+        last attempt. claim_job no longer hands them out, so without this they
+        would show as running forever.
+        Returns:
+            int: The number of jobs marked failed.
+        """
+        now = datetime.now(timezone.utc)
+        query = (
+            jobs.update()
+            .where(
+                jobs.c.status == JOB_RUNNING,
+                jobs.c.attempts >= max_attempts,
+                jobs.c.started_at < now - timedelta(seconds=visibility_timeout),
+            )
+            .values(
+                status=JOB_FAILED,
+                error=STALE_JOB_ERROR,
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                finished_at=now,
+            )
+            .returning(jobs.c.id)
+        )
+        return len(await execute_all(query) or ())
+
+    @staticmethod
+    async def complete_job(job_id, image_output: bytes, status_code: int):
+        query = (
+            jobs.update()
+            .where(jobs.c.id == job_id)
+            .values(
+                status=JOB_SUCCEEDED,
+                image_output=image_output,
+                status_code=status_code,
+                error=None,
+                finished_at=datetime.now(timezone.utc),
+            )
+            .returning(jobs.c.id)
+        )
+        return await execute_one(query)
+
+    @staticmethod
+    async def fail_job(job_id, error: str, status_code: int, retry: bool = False):
+        values = dict(error=error, status_code=status_code)
+        if retry:
+            # Back in the queue, claim_job stops handing it out after max attempts
+            values.update(status=JOB_QUEUED, started_at=None)
+        else:
+            values.update(status=JOB_FAILED, finished_at=datetime.now(timezone.utc))
+        query = jobs.update().where(jobs.c.id == job_id).values(values).returning(jobs.c.id)
+        return await execute_one(query)
+
@@ -0,0 +1,109 @@
+from sqlalchemy import Date, bindparam, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import select
+
+from src.database.connection import execute_all, execute_one, transaction
+from src.models.tracking import tracking, tracking_usage_daily
+from src.models.user import users
+
+# Columns written by add_tracking_batch, in the order of the row tuples
+TRACKING_BATCH_COLUMNS = (
+    "id",
+    "user_id",
+    "image",
+    "image_input",
+    "image_output",
+    "service_type",
+    "response",
+    "status_code",
+    "credits",
+    "response_time",
+    "created_at",
+)
+USER_IDS_QUERY = select(users.c.email, users.c.id).where(
+    users.c.email.in_(bindparam("emails", expanding=True))
+)
+ENSURE_PARTITION_QUERY = select(func.tracking_ensure_partition(bindparam("month", type_=Date)))
+
+# Adds a batch's totals to the daily rollup rows, creating the missing ones
+usage_insert = insert(tracking_usage_daily)
+UPSERT_USAGE_QUERY = usage_insert.on_conflict_do_update(
+    constraint="tracking_usage_daily_pkey",
+    set_={
+        "calls": tracking_usage_daily.c.calls + usage_insert.excluded.calls,
+        "credits": tracking_usage_daily.c.credits + usage_insert.excluded.credits,
+        "errors": tracking_usage_daily.c.errors + usage_insert.excluded.errors,
+    },
+)
+USAGE_QUERY = (
+    select(
+        tracking_usage_daily.c.day,
+        tracking_usage_daily.c.service_type,
+        tracking_usage_daily.c.calls,
+        tracking_usage_daily.c.credits,
+        tracking_usage_daily.c.errors,
+    )
+    .select_from(
+        tracking_usage_daily.join(users, users.c.id == tracking_usage_daily.c.user_id)
+    )
+    .where(
+        users.c.email == bindparam("email"),
+        tracking_usage_daily.c.day >= bindparam("start"),
+        tracking_usage_daily.c.day <= bindparam("end"),
+    )
+    .order_by(tracking_usage_daily.c.day, tracking_usage_daily.c.service_type)
+)
+
+
+class TrackingQuery:
+    @staticmethod
+    async def add_tracking(tracking_data: dict):
+        query = tracking.insert().values(dict(tracking_data)).returning(tracking.c.id)
+        return await execute_one(query)
+
+    @staticmethod
+    async def get_user_ids(emails) -> dict:
+        """Returns email -> user id for the emails that exist, in one query."""
+        rows = await execute_all(USER_IDS_QUERY, {"emails": list(emails)})
+        return {row.email: row.id for row in rows or ()}
+
+    @staticmethod
+    async def add_tracking_batch(rows, usage):
+        """
+        Writes many tracking rows in one round trip, with COPY on asyncpg and a
+        multi-row INSERT on other drivers, and adds their totals to the daily
+        usage rollup in the same transaction.
+        Parameters:
+            rows (list): Tuples of values in TRACKING_BATCH_COLUMNS order.
+            usage (list): tracking_usage_daily rows (dicts) to add, sorted by key
+                so concurrent batches lock them in the same order.
+        """
+        async with transaction() as conn:
+            # The asyncpg adapter sends BEGIN with the first statement run through
+            # SQLAlchemy, so the upsert goes first: a COPY sent before it on the
+            # driver connection would commit on its own, apart from the rollup.
+            if usage:
+                await conn.execute(UPSERT_USAGE_QUERY, usage)
+            raw_connection = await conn.get_raw_connection()
+            driver_connection = raw_connection.driver_connection
+            if hasattr(driver_connection, "copy_records_to_table"):
+                await driver_connection.copy_records_to_table(
+                    tracking.name, records=rows, columns=TRACKING_BATCH_COLUMNS
+                )
+            else:
+                await conn.execute(
+                    tracking.insert(),
+                    [dict(zip(TRACKING_BATCH_COLUMNS, row)) for row in rows],
+                )
+
+    @staticmethod
+    async def ensure_partitions(months):
+        """Creates the monthly tracking partitions of the given dates if they are missing."""
+        async with transaction() as conn:
+            for month in months:
+                await conn.execute(ENSURE_PARTITION_QUERY, {"month": month})
+
+    @staticmethod
+    async def get_usage(email, start, end):
+        """Returns the daily usage rows of a user between two dates, read from the rollup only."""
+        return await execute_all(USAGE_QUERY, {"email": email, "start": start, "end": end})
@@ -0,0 +1,116 @@
+import time
+from collections import OrderedDict
+
+from src.helpers.metrics import register_metrics
+from src.utils.config import USER_CACHE_ENABLED, USER_CACHE_MAX_ITEMS, USER_CACHE_TTL
+
+# Row shapes cached per email, an invalidation drops each of them by key
+USER_CACHE_SHAPES = ("auth", "profile")
+
+
+class UserCacheInvalidator:
+    """
+    Spreads invalidations to the other API workers.
+    The default only covers this process, the TTL bounds how long another worker
+    can serve a stale row. A cross-worker backend (Postgres LISTEN/NOTIFY, Redis
+    pub/sub, ...) subclasses it: publish() sends the email out and the backend
+    calls the callback given to start() for every email it receives.
+    """
+
+    async def start(self, callback):
+        pass
+
+    async def publish(self, email: str):
+        pass
+
+    async def close(self):
+        pass
+
+
+class UserCache:
+    """
+    Read-through TTL cache of user rows keyed by email, in front of UserQuery.
+    Each query shape (e.g. the profile columns, the full row used to log in) is
+    cached separately because callers read rows by position. Writes invalidate
+    every shape of the email, missing users are never cached.
+    """
+
+    def __init__(
+        self,
+        enabled=USER_CACHE_ENABLED,
+        ttl=USER_CACHE_TTL,
+        max_items=USER_CACHE_MAX_ITEMS,
+        invalidator=None,
+    ):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_items = max_items
+        self.invalidator = invalidator or UserCacheInvalidator()
+        # (shape, email) -> (row, expires_at), least recently used first
+        self._rows = OrderedDict()
+        # email -> [loads in flight, invalidations seen], kept only while loads of
+        # the email are in flight. A load that saw an invalidation isn't stored.
+        self._loading = {}
+        self.counters = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+    async def get_or_load(self, shape: str, email: str, loader):
+        """
+        Returns the cached row for (shape, email), or awaits loader() and caches
+        a truthy result for ttl seconds. shape is one of USER_CACHE_SHAPES.
+        """
+        if not self.enabled:
+            return await loader()
+        key = (shape, email)
+        entry = self._rows.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            self._rows.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry[0]
+        self.counters["misses"] += 1
+        loading = self._loading.setdefault(email, [0, 0])
+        loading[0] += 1
+        invalidations = loading[1]
+        try:
+            row = await loader()
+        finally:
+            loading[0] -= 1
+            if not loading[0]:
+                del self._loading[email]
+        if row and invalidations == loading[1]:
+            self._store(key, row)
+        return row
+
+    def _store(self, key, row):
+        self._rows[key] = (row, time.monotonic() + self.ttl)
+        self._rows.move_to_end(key)
+        while len(self._rows) > self.max_items:
+            self._rows.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def evict(self, email: str):
+        """Drops every cached shape of an email in this process."""
+        loading = self._loading.get(email)
+        if loading is not None:
+            loading[1] += 1
+        for shape in USER_CACHE_SHAPES:
+            self._rows.pop((shape, email), None)
+        self.counters["invalidations"] += 1
+
+    async def invalidate(self, email: str):
+        """Drops an email here and tells the other workers to drop it too."""
+        self.evict(email)
+        await self.invalidator.publish(email)
+
+    async def start(self):
+        await self.invalidator.start(self.evict)
+
+    async def close(self):
+        await self.invalidator.close()
+
+    def stats(self) -> dict:
+        return {**self.counters, "items": len(self._rows)}
+
+
+# Shared cache used by UserQuery, started and closed by the app lifespan
+user_cache = UserCache()
+register_metrics("user_cache", user_cache.stats)
@@ -1,18 +1,100 @@
 from fastapi import HTTPException, status
+from sqlalchemy import bindparam
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.sql import select
 
 from src.database.connection import execute_one
 from src.database.database import ALL_COLUMNS
 from src.models.user import users
+from src.queries.user_cache import user_cache
+
+# Statements are built once with bind parameters, so every call reuses the same
+# statement object and SQLAlchemy's compiled cache entry instead of rebuilding
+# and recompiling it. Bind names of SET/VALUES columns can't be column names.
+AUTHENTICATE_USER_QUERY = users.select().where(users.c.email == bindparam("email"))
+USER_DATA_QUERY = select(
+    users.c.first_name,
+    users.c.last_name,
+    users.c.email,
+    users.c.profiles,
+    users.c.otp,
+    users.c.otp_expiration_time,
+    users.c.is_verified,
+).where(users.c.email == bindparam("email"))
+USER_ID_QUERY = select(users.c.id).where(users.c.email == bindparam("email"))
+
+# Columns written by signup, always the full set so there is one INSERT statement
+SIGNUP_COLUMNS = (
+    "first_name",
+    "last_name",
+    "email",
+    "password",
+    "profiles",
+    "otp",
+    "is_verified",
+)
+ADD_USER_IF_ABSENT_QUERY = (
+    insert(users)
+    .values({column: bindparam(f"new_{column}") for column in SIGNUP_COLUMNS})
+    .on_conflict_do_nothing(index_elements=[users.c.email])
+    .returning(ALL_COLUMNS)
+)
+
+# Mutation type -> the fixed set of columns it updates (the user is matched by email)
+USER_MUTATIONS = {
+    "verify": ("is_verified",),
+    "reset_otp": ("otp", "otp_expiration_time"),
+    "password": ("password",),
+    "password_by_otp": ("password", "otp", "is_verified"),
+    "soft_delete": ("deleted_at", "is_verified"),
+}
+
+
+def build_update_query(columns, active_only: bool):
+    """UPDATE users SET <columns> WHERE email = :match_email [AND deleted_at IS NULL] RETURNING *."""
+    conditions = [users.c.email == bindparam("match_email")]
+    if active_only:
+        conditions.append(users.c.deleted_at.is_(None))
+    return (
+        users.update()
+        .where(*conditions)
+        .values({column: bindparam(f"new_{column}") for column in sorted(columns)})
+        .returning(ALL_COLUMNS)
+    )
+
+
+# (columns, active_only) -> prebuilt UPDATE, filled for every mutation type at import
+_update_queries = {
+    (frozenset(columns), active_only): build_update_query(columns, active_only)
+    for columns in USER_MUTATIONS.values()
+    for active_only in (False, True)
+}
+
+
+def update_query_for(user: dict, active_only: bool):
+    """
+    Returns the prebuilt UPDATE for the columns in user (besides email) and its
+    parameters. A column set outside USER_MUTATIONS is built once and kept, the
+    sets come from code so their number stays small.
+    """
+    columns = frozenset(user) - {"email"}
+    key = (columns, active_only)
+    query = _update_queries.get(key)
+    if query is None:
+        query = _update_queries[key] = build_update_query(columns, active_only)
+    params = {f"new_{column}": user[column] for column in columns}
+    params["match_email"] = user["email"]
+    return query, params
 
 
 class UserQuery:
-    def authenticate_user(
+    async def authenticate_user(
         email: str,
     ) -> bool:
-        query = users.select().where(users.c.email == email)
-        row = execute_one(query)  # Ensure execute_one is designed for async
+        row = await user_cache.get_or_load(
+            "auth", email, lambda: execute_one(AUTHENTICATE_USER_QUERY, {"email": email})
+        )
         if not row:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -21,33 +103,11 @@ class UserQuery:
         return row
 
     @staticmethod
-    def check_user(user_data: dict):
+    async def get_user_data(email):
         try:
-            query = users.select().where(users.c.email == user_data["email"])
-            result = execute_one(query)
-            # if the result return empty or false this mean the user not exist
-            if not result:
-                return True
-            return False
-        except IntegrityError:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Email not exist",
+            result = await user_cache.get_or_load(
+                "profile", email, lambda: execute_one(USER_DATA_QUERY, {"email": email})
             )
-
-    @staticmethod
-    def get_user_data(email):
-        try:
-            query = select(
-                users.c.first_name,
-                users.c.last_name,
-                users.c.email,
-                users.c.profiles,
-                users.c.otp,
-                users.c.otp_expiration_time,
-                users.c.is_verified
-            ).where(users.c.email == email)
-            result = execute_one(query)
             if not result:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
@@ -61,15 +121,22 @@ class UserQuery:
             )
 
     @staticmethod
-    def update_user_data(user: dict):
-        try:
-            query = (
-                users.update()
-                .where(users.c.email == user["email"])
-                .values(dict(user))
-                .returning(ALL_COLUMNS)
+    async def get_user_id(email):
+        result = await execute_one(USER_ID_QUERY, {"email": email})
+        if not result:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not exist",
             )
-            result = execute_one(query)
+        return result.id
+
+    @staticmethod
+    async def update_user_data(user: dict):
+        try:
+            query, params = update_query_for(user, active_only=False)
+            result = await execute_one(query, params)
+            # Covers profile and password changes and soft deletes (deleted_at)
+            await user_cache.invalidate(user["email"])
             if not result:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
@@ -83,12 +150,33 @@ class UserQuery:
             )
 
     @staticmethod
-    def add_user_to_database(user_data: dict):
+    async def update_active_user(user: dict):
+        """
+        Updates a user that exists and isn't soft deleted, in one statement.
+        Returns:
+            Row or False: The updated row, False when no active user has that email.
+        """
+        query, params = update_query_for(user, active_only=True)
+        result = await execute_one(query, params)
+        if result:
+            await user_cache.invalidate(user["email"])
+        return result
+
+    @staticmethod
+    async def add_user_if_absent(user_data: dict):
+        """
+        Inserts a user unless the email is already registered, in one statement
+        (INSERT ... ON CONFLICT DO NOTHING), so concurrent signups can't race.
+        Parameters:
+            user_data (dict): The SIGNUP_COLUMNS values, missing ones are stored as NULL.
+        Returns:
+            Row or False: The new user, False when the email already exists.
+        """
         try:
-            query = users.insert().values(dict(user_data)).returning(ALL_COLUMNS)
-            # Assuming insert_object is async and returns the new primary key.
-            # You need to pass the query, not just values, and must be awaited if it's async.
-            new_user_data = execute_one(query)
+            params = {f"new_{column}": user_data.get(column) for column in SIGNUP_COLUMNS}
+            new_user_data = await execute_one(ADD_USER_IF_ABSENT_QUERY, params)
+            if new_user_data:
+                await user_cache.invalidate(user_data["email"])
             return new_user_data
         except IntegrityError:
             raise HTTPException(
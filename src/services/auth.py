@@ -3,17 +3,17 @@ import time
 from datetime import datetime, timedelta, timezone
 
 from fastapi import HTTPException, status
-from jinja2 import Environment, FileSystemLoader
 from jose import JWTError, jwt
 
 from src.queries.users import UserQuery
 from src.services.base import Base_Services
+from src.services.outbox import email_templates
+from src.services.passwords import password_hasher
 from src.utils.config import (
     ACCESS_TOKEN_EXPIRE_HOURS,
     ACCESS_TOKEN_EXPIRE_MINUTES,
     ALGORITHM,
     SECRET_KEY,
-    TEMPLATES_PATH,
     VERIFY_TEMPLATE,
     VERIFY_TOKEN_EXPIRE_MINUTES,
     Domain_BASE_URL,
@@ -25,19 +25,17 @@ class Authentication_Services(Base_Services):
         super().__init__()
         self.endpoint = endpoint
 
-    def signup(self, user):
+    async def signup(self, user):
         # Prepare user Data
         user_data = user.dict()
-        user_data["password"] = self.pwd_context.hash(
+        user_data["password"] = await password_hasher.hash(
             user.password
         )  # Hash the password
         user_data["otp"] = random.randint(100000, 999999)
         user_data["is_verified"] = False
-        # check if user exists.
-        user_result = UserQuery.check_user(user_data)
+        # Add user to database unless the email is taken, in one statement.
+        user_result = await UserQuery.add_user_if_absent(user_data)
         if user_result:
-            # Add user to database.
-            _ = UserQuery.add_user_to_database(user_data)
             # Create Activation Token
             expires_delta = timedelta(minutes=VERIFY_TOKEN_EXPIRE_MINUTES)
             payload = {"email": user_data["email"], "otp": user_data["otp"]}
@@ -62,25 +60,16 @@ class Authentication_Services(Base_Services):
             "verification_link": verification_link,
             "expire_minutes": VERIFY_TOKEN_EXPIRE_MINUTES,
         }
-        try:
-            # Set up the Jinja2 environment with the directory containing the HTML file
-            env = Environment(loader=FileSystemLoader(TEMPLATES_PATH))
-            # Load the HTML template
-            template = env.get_template(VERIFY_TEMPLATE)
-            # Render the template with the data
-            rendered_html = template.render(data)
-        except FileNotFoundError:
-            print("The email template file was not found.")
-            return
-        try:
-            self.send_email(
-                recipient_email=recipient_email,
-                subject=subject,
-                html_content=rendered_html,
-            )
-        except Exception as e:
-            print(f"An error occurred: {e}")
+        # Render the template compiled at startup
+        rendered_html = email_templates.render(VERIFY_TEMPLATE, data)
+        if rendered_html is None:
             return
+        # Queue the email, it is sent after the response
+        self.send_email(
+            recipient_email=recipient_email,
+            subject=subject,
+            html_content=rendered_html,
+        )
 
     def create_access_token(self, data: dict, expires_delta: timedelta = None):
         # to_encode = data.copy()
@@ -106,9 +95,9 @@ class Authentication_Services(Base_Services):
                 detail="Oops! Your token has expired.",
             )
 
-    def account_verification(self, token: str):
+    async def account_verification(self, token: str):
         payload = self.decode_access_token(token)
-        user = UserQuery.get_user_data(payload["email"])
+        user = await UserQuery.get_user_data(payload["email"])
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST, detail="Token not found."
@@ -128,7 +117,7 @@ class Authentication_Services(Base_Services):
         user_data = dict()
         user_data["is_verified"] = True
         user_data["email"] = user.email
-        _ = UserQuery.update_user_data(user_data)
+        _ = await UserQuery.update_user_data(user_data)
         content = self.create_token(user.email)
         content["detail"] = "Account verified successfully."
         return content, status.HTTP_202_ACCEPTED
@@ -141,25 +130,15 @@ class Authentication_Services(Base_Services):
         # Check if the difference is less than 900 seconds (15 minutes)
         return difference < 0
 
-    def login(self, data):
-        user_data = UserQuery.authenticate_user(email=data.email)
-        if not self.pwd_context.verify(data.password, user_data.password):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Incorrect username or password",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+    async def login(self, data):
+        user_data = await UserQuery.authenticate_user(email=data.email)
+        await self.check_password(data.password, user_data)
         content = self.create_token(email=data.email)
         return content, status.HTTP_202_ACCEPTED
 
-    def verify_account_request(self, data):
-        user_data = UserQuery.authenticate_user(email=data.email)
-        if not self.pwd_context.verify(data.password, user_data.password):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Incorrect username or password",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+    async def verify_account_request(self, data):
+        user_data = await UserQuery.authenticate_user(email=data.email)
+        await self.check_password(data.password, user_data)
         if not user_data.is_verified:
             expires_delta = timedelta(minutes=VERIFY_TOKEN_EXPIRE_MINUTES)
             payload = {"email": user_data.email, "otp": user_data.otp}
@@ -173,6 +152,26 @@ class Authentication_Services(Base_Services):
             "details: Please Check your Email to Confirm your Account"
         }, status.HTTP_200_OK
 
+    async def check_password(self, password, user_data):
+        """
+        Verifies a password off the event loop, upgrading the stored hash when
+        it was made with another bcrypt cost.
+        Raises:
+            HTTPException: If the password doesn't match.
+            PasswordHashRejected: If the hashing queue is full.
+        """
+        verified, new_hash = await password_hasher.verify(password, user_data.password)
+        if not verified:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Incorrect username or password",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        if new_hash:
+            await UserQuery.update_user_data(
+                {"email": user_data.email, "password": new_hash}
+            )
+
     def create_token(self, email):
         expires_delta = timedelta(
             hours=ACCESS_TOKEN_EXPIRE_HOURS, minutes=ACCESS_TOKEN_EXPIRE_MINUTES
@@ -205,9 +204,9 @@ class Authentication_Services(Base_Services):
         content = {"access_token": new_token, "token_type": "bearer"}
         return content, status.HTTP_202_ACCEPTED
 
-    def verify_otp(self, email, user_otp):
+    async def verify_otp(self, email, user_otp):
         # Retrieve the user by email
-        user = UserQuery.get_user_data(email=email)
+        user = await UserQuery.get_user_data(email=email)
         # date_format = "%Y-%m-%d %H:%M:%S.%f%z"
         # otp_expiration_time = datetime.strptime(
         #     str(user.otp_expiration_time), date_format
@@ -229,7 +228,7 @@ class Authentication_Services(Base_Services):
             user_data = dict()
             user_data["is_verified"] = True
             user_data["email"] = email
-            UserQuery.update_user_data(user_data)
+            await UserQuery.update_user_data(user_data)
             content = self.create_token(email)
             content["detail"] = "Account verified successfully."
             return content, status.HTTP_202_ACCEPTED
@@ -1,44 +1,23 @@
-import smtplib
 import uuid
 from datetime import datetime, timezone
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
 from pathlib import Path
 
-from passlib.context import CryptContext
 from PIL import Image
 
-from src.utils.config import (
-    EMAIL_SENDER_ADDRESS,
-    EMAIL_SENDER_PASSWORD,
-    EMAIL_SMTP_PORT,
-    EMAIL_SMTP_SERVER,
-)
+from src.services.outbox import email_outbox
+from src.services.passwords import password_hasher
 
 
 class Base_Services:
     def __init__(
         self,
     ):
-        self.pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-        # Function to send email (customize with your SMTP settings)
+        # Shared context, hashing itself goes through password_hasher off the event loop
+        self.pwd_context = password_hasher.context
 
     def send_email(self, recipient_email, subject, html_content=None, body=""):
-        msg = MIMEMultipart("alternative")
-        msg["Subject"] = subject
-        msg["From"] = EMAIL_SENDER_ADDRESS
-        msg["To"] = recipient_email
-
-        # Attach HTML content using MIMEText
-        if html_content:
-            msg.attach(MIMEText(html_content, "html"))
-
-        server = smtplib.SMTP(EMAIL_SMTP_SERVER, EMAIL_SMTP_PORT)
-        server.starttls()
-        server.login(EMAIL_SENDER_ADDRESS, EMAIL_SENDER_PASSWORD)
-        server.send_message(msg)
-        server.quit()
+        # Queued in the outbox, the background senders deliver it over pooled SMTP connections
+        return email_outbox.send(recipient_email, subject, html_content)
 
     def read_image(image_path) -> Image:
         """
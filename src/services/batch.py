@@ -0,0 +1,162 @@
+import asyncio
+import io
+import json
+import os
+import tempfile
+import zipfile
+
+from fastapi import HTTPException, status
+
+from src.services.preprocessing import (
+    Preprocessing_Services,
+    failure_status_code,
+    operation_credits,
+)
+from src.services.tracking import tracking_recorder
+from src.services.validate import image_type_validate
+from src.utils.config import BATCH_CONCURRENCY
+
+
+class ZipSink(io.RawIOBase):
+    """Unseekable write target, zipfile then writes entries with data descriptors."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class Batch_Services:
+    """
+    Runs one preprocessing operation over many images and streams the results back
+    as a ZIP archive built on the fly, followed by a manifest.json of per-file status.
+    """
+
+    def __init__(self, endpoint, concurrency=BATCH_CONCURRENCY, output=None, email=None):
+        self.endpoint = endpoint
+        # Owner of the batch, each file is recorded in tracking as its own call
+        self.email = email
+        # Negotiated output format applied to every result, None keeps the API's format
+        self.output = output
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def read_files(self, images):
+        """
+        Validates the uploads and takes their spooled files over, each one is only
+        read when its operation runs so the batch is never held in memory at once.
+        Returns:
+            list: (index, name, file, error) per upload, file is None when rejected.
+        """
+        files = []
+        for index, image in enumerate(images):
+            name = f"{index:04d}_{os.path.basename(image.filename or 'image')}"
+            try:
+                image_type_validate(image)
+            except HTTPException as e:
+                files.append((index, name, None, e.detail))
+                continue
+            # Uploads are closed once the route returns, before the archive is
+            # streamed, so the form is left an empty file to close instead
+            files.append((index, name, image.file, None))
+            image.file = tempfile.SpooledTemporaryFile()
+        return files
+
+    def refuse_files(self, files, allowed: int, error: str):
+        """
+        Keeps the first allowed valid files, the others are refused with error
+        and their uploads closed.
+        Returns:
+            list: files with the refused ones turned into rejected entries.
+        """
+        kept = []
+        for index, name, file, file_error in files:
+            if file is not None:
+                if allowed <= 0:
+                    file.close()
+                    kept.append((index, name, None, error))
+                    continue
+                allowed -= 1
+            kept.append((index, name, file, file_error))
+        return kept
+
+    async def run_one(self, index, name, file, error):
+        entry = {"index": index, "file": name}
+        if error is not None:
+            return None, {**entry, "status": "rejected", "error": error}
+        async with self.semaphore:
+            try:
+                image_data = await asyncio.to_thread(file.read)
+            finally:
+                file.close()
+            operation_object = Preprocessing_Services(
+                endpoint=self.endpoint, image_bytes=image_data
+            )
+            image_key = operation_object.cache_key
+            output_key = operation_object.output_key(self.output)
+            try:
+                content, cached = await operation_object.process()
+            except Exception as e:
+                status_code = failure_status_code(e)
+                tracking_recorder.record(
+                    self.endpoint, status_code, 0, image_key, name, output_key, str(e), self.email
+                )
+                return None, {**entry, "status": "failed", "error": str(e)}
+            credits = 0 if cached else operation_credits[self.endpoint]
+            tracking_recorder.record(
+                self.endpoint, status.HTTP_200_OK, credits, image_key, name, output_key, email=self.email
+            )
+            content, _ = await operation_object.render(content, self.output)
+        entry = {**entry, "status": "succeeded", "cached": cached}
+        if operation_object.upload_report is not None:
+            report = operation_object.upload_report
+            entry["upload"] = {**report, "seconds": round(report["seconds"], 3)}
+        return content, entry
+
+    async def stream_zip(self, files):
+        """
+        Yields the ZIP archive chunk by chunk, each result is written as soon as it
+        completes and then released, so at most the results of the running
+        operations are held in memory.
+        """
+        sink = ZipSink()
+        archive = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED)
+        pending = {asyncio.ensure_future(self.run_one(*file)) for file in files}
+        manifest = []
+        try:
+            while pending:
+                # Finished tasks are dropped as soon as their result is written,
+                # a task keeps its result bytes for as long as it is referenced
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                while done:
+                    content, entry = done.pop().result()
+                    if content is not None:
+                        archive.writestr(entry["file"], content)
+                    manifest.append(entry)
+                    content = None
+                yield sink.pop()
+            manifest.sort(key=lambda item: item["index"])
+            archive.writestr(
+                "manifest.json",
+                json.dumps({"operation": self.endpoint, "files": manifest}, indent=2),
+            )
+            archive.close()
+            yield sink.pop()
+        finally:
+            # Client went away, stop the remaining operations and release their uploads
+            for task in pending:
+                task.cancel()
+            for _, _, file, _ in files:
+                if file is not None:
+                    file.close()
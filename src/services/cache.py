@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from src.helpers.metrics import register_metrics
+from src.utils.config import (
+    RESULT_CACHE_DISK_BYTES,
+    RESULT_CACHE_DISK_PATH,
+    RESULT_CACHE_ENABLED,
+    RESULT_CACHE_MAX_ITEM_BYTES,
+    RESULT_CACHE_MEMORY_BYTES,
+    RESULT_CACHE_MEMORY_ITEMS,
+)
+
+
+class ResultCache:
+    """
+    Content-addressed cache of preprocessing results.
+    Entries are keyed on hash(operation + image bytes) and kept in two tiers:
+    a bounded in-memory LRU and a size-capped directory on disk.
+    """
+
+    def __init__(
+        self,
+        enabled=RESULT_CACHE_ENABLED,
+        memory_items=RESULT_CACHE_MEMORY_ITEMS,
+        memory_bytes=RESULT_CACHE_MEMORY_BYTES,
+        disk_path=RESULT_CACHE_DISK_PATH,
+        disk_bytes=RESULT_CACHE_DISK_BYTES,
+        max_item_bytes=RESULT_CACHE_MAX_ITEM_BYTES,
+    ):
+        self.enabled = enabled
+        self.memory_items = memory_items
+        self.memory_bytes = memory_bytes
+        self.disk_path = Path(disk_path)
+        self.disk_bytes = disk_bytes
+        self.max_item_bytes = max_item_bytes
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        # key -> file size, ordered from least to most recently used
+        self._disk_index = None
+        self._disk_size = 0
+        # Disk reads and writes run in worker threads and share the index
+        self._disk_lock = threading.Lock()
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+        }
+
+    @staticmethod
+    def make_key(operation: str, image_bytes: bytes) -> str:
+        """Builds the cache key from the operation name and the image content."""
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(operation.encode())
+        digest.update(b"\0")
+        digest.update(image_bytes)
+        return digest.hexdigest()
+
+    @staticmethod
+    def make_etag(key: str) -> str:
+        """Strong ETag for a result, identical for identical operation and image."""
+        return f'"{key}"'
+
+    async def get(self, key: str) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.counters["memory_hits"] += 1
+            return data
+        data = await asyncio.to_thread(self._disk_read, key)
+        if data is not None:
+            self.counters["disk_hits"] += 1
+            self._memory_store(key, data)
+            return data
+        self.counters["misses"] += 1
+        return None
+
+    async def set(self, key: str, data: bytes):
+        if not self.enabled or len(data) > self.max_item_bytes:
+            return
+        self.counters["stores"] += 1
+        self._memory_store(key, data)
+        await asyncio.to_thread(self._disk_write, key, data)
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "memory_items": len(self._memory),
+            "memory_bytes": self._memory_size,
+            "disk_items": len(self._disk_index or ()),
+            "disk_bytes": self._disk_size,
+        }
+
+    def _memory_store(self, key, data):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory and (
+            len(self._memory) > self.memory_items
+            or self._memory_size > self.memory_bytes
+        ):
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+            self.counters["evictions"] += 1
+
+    def _file_path(self, key) -> Path:
+        return self.disk_path / key[:2] / key
+
+    def _load_disk_index(self):
+        # Rebuild the LRU order from file modification times on first use
+        self._disk_index = OrderedDict()
+        self._disk_size = 0
+        if not self.disk_path.is_dir():
+            return
+        files = []
+        for path in self.disk_path.glob("*/*"):
+            if "." in path.name:
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, path.name, stat.st_size))
+        for _, key, size in sorted(files):
+            self._disk_index[key] = size
+            self._disk_size += size
+
+    def _disk_read(self, key) -> Optional[bytes]:
+        with self._disk_lock:
+            if self._disk_index is None:
+                self._load_disk_index()
+            if key not in self._disk_index:
+                return None
+            self._disk_index.move_to_end(key)
+        path = self._file_path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            # Removed by another worker sharing the same directory
+            with self._disk_lock:
+                self._disk_size -= self._disk_index.pop(key, 0)
+            return None
+        return data
+
+    def _disk_write(self, key, data):
+        with self._disk_lock:
+            if self._disk_index is None:
+                self._load_disk_index()
+            if key in self._disk_index:
+                return
+        path = self._file_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{key}.{os.getpid()}-{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to write result cache entry. Error: {e}")
+            return
+        evicted_keys = []
+        with self._disk_lock:
+            if key not in self._disk_index:
+                self._disk_index[key] = len(data)
+                self._disk_size += len(data)
+            while self._disk_index and self._disk_size > self.disk_bytes:
+                evicted_key, size = self._disk_index.popitem(last=False)
+                self._disk_size -= size
+                self.counters["evictions"] += 1
+                evicted_keys.append(evicted_key)
+        for evicted_key in evicted_keys:
+            try:
+                self._file_path(evicted_key).unlink()
+            except FileNotFoundError:
+                pass
+
+
+# Shared cache in front of the upstream preprocessing operations
+result_cache = ResultCache()
+register_metrics("result_cache", result_cache.stats)
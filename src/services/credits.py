@@ -0,0 +1,198 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from src.helpers.metrics import register_metrics
+from src.services.upstream import UpstreamError, upstream_client
+from src.utils.config import (
+    CREDIT_BALANCE_TTL,
+    CREDIT_LEDGER_ENABLED,
+    CREDIT_RECONCILE_INTERVAL,
+)
+
+# Cutout API subscription endpoint and the error code of a call it couldn't pay for
+SUBSCRIPTION_ENDPOINT = "/api/v1/mySubscription"
+INSUFFICIENT_CREDITS_CODE = 4001
+
+
+class InsufficientCredits(Exception):
+    """Raised when the credits left can't cover a call, before anything is uploaded."""
+
+
+class CreditLedger:
+    """
+    Local view of the cutout API credit balance (one balance for the API key).
+    available = upstream balance - credits committed since it was fetched
+    - credits reserved by calls in flight.
+    Each upstream call reserves its credits up front and commits them when it
+    succeeds or releases them when it fails, so concurrent calls can't overspend
+    and doomed calls are rejected before the upload. A background task replaces
+    the balance with the upstream one every reconcile_interval seconds, which
+    also accounts for the other workers' spending.
+    While the balance has never been fetched calls are let through, the API
+    still refuses them with 4001, which zeroes the local balance until the next
+    reconciliation.
+
+    Usage:
+        async with credit_ledger.reserve(credits):
+            await call_upstream()
+    """
+
+    def __init__(
+        self,
+        enabled=CREDIT_LEDGER_ENABLED,
+        ttl=CREDIT_BALANCE_TTL,
+        reconcile_interval=CREDIT_RECONCILE_INTERVAL,
+    ):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.reconcile_interval = reconcile_interval
+        self.balance = None
+        self.reserved = 0
+        self.committed = 0
+        self._fetched_at = None
+        self._refresh_lock = asyncio.Lock()
+        self._task = None
+        self.counters = {
+            "refreshes": 0,
+            "failed_refreshes": 0,
+            "reserved": 0,
+            "committed": 0,
+            "released": 0,
+            "rejected": 0,
+            "last_drift": 0,
+        }
+
+    @property
+    def available(self):
+        """Credits left for new calls, None while the balance is unknown."""
+        if self.balance is None:
+            return None
+        return self.balance - self.committed - self.reserved
+
+    def check(self, credits: int):
+        """
+        Raises:
+            InsufficientCredits: If the known balance can't cover credits.
+        """
+        available = self.available
+        if self.enabled and available is not None and available < credits:
+            self.counters["rejected"] += 1
+            raise InsufficientCredits(
+                f"Insufficient credits: {credits} needed, {max(available, 0)} available."
+            )
+
+    @asynccontextmanager
+    async def reserve(self, credits: int):
+        """
+        Holds credits for the duration of an upstream call, committed when the
+        block succeeds and released when it raises.
+        Raises:
+            InsufficientCredits: If the known balance can't cover credits.
+        """
+        if not self.enabled:
+            yield
+            return
+        self.check(credits)
+        self.reserved += credits
+        self.counters["reserved"] += credits
+        try:
+            yield
+        except UpstreamError as e:
+            self._release(credits)
+            if e.code == INSUFFICIENT_CREDITS_CODE:
+                # The API knows better, nothing is spendable until the next refresh
+                self.balance = self.committed + self.reserved
+            raise
+        except BaseException:
+            self._release(credits)
+            raise
+        self.reserved -= credits
+        self.committed += credits
+        self.counters["committed"] += credits
+
+    def _release(self, credits: int):
+        self.reserved -= credits
+        self.counters["released"] += credits
+
+    async def refresh(self):
+        """
+        Replaces the balance with the upstream one, one request at a time.
+        Raises:
+            UpstreamError: If the subscription can't be fetched.
+        """
+        async with self._refresh_lock:
+            # Spending committed before the request is part of the fetched balance
+            committed = self.committed
+            try:
+                response = await upstream_client.get_json(SUBSCRIPTION_ENDPOINT)
+                balance = int(response["data"]["monthBalance"])
+            except (KeyError, TypeError, ValueError) as e:
+                self.counters["failed_refreshes"] += 1
+                raise UpstreamError(f"Unexpected subscription response: {e!r}")
+            except UpstreamError:
+                self.counters["failed_refreshes"] += 1
+                raise
+            if self.balance is not None:
+                # How far the local estimate was from the upstream balance
+                self.counters["last_drift"] = self.balance - committed - balance
+            self.balance = balance
+            self.committed -= committed
+            self._fetched_at = time.monotonic()
+            self.counters["refreshes"] += 1
+
+    async def get_balance(self) -> dict:
+        """
+        Returns the balance, refreshed from upstream when older than ttl.
+        A stale balance is served when the refresh fails.
+        Raises:
+            UpstreamError: If the balance was never fetched and the refresh fails.
+        """
+        if self._fetched_at is None or time.monotonic() - self._fetched_at > self.ttl:
+            try:
+                await self.refresh()
+            except UpstreamError:
+                if self.balance is None:
+                    raise
+        age = None
+        if self._fetched_at is not None:
+            age = round(time.monotonic() - self._fetched_at, 1)
+        return {
+            "credits": self.balance - self.committed,
+            "reserved": self.reserved,
+            "age_seconds": age,
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Failed to reconcile the credit balance. Error: {e}")
+            await asyncio.sleep(self.reconcile_interval)
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "balance": self.balance,
+            "available": self.available,
+            "in_flight_reserved": self.reserved,
+        }
+
+
+# Shared ledger, reconciled in the background from the app lifespan and the job worker
+credit_ledger = CreditLedger()
+register_metrics("credit_ledger", credit_ledger.stats)
@@ -0,0 +1,89 @@
+from fastapi import status
+from fastapi.encoders import jsonable_encoder
+
+from src.models.jobs import JOB_SUCCEEDED
+from src.queries.jobs import JobQuery
+from src.queries.users import UserQuery
+from src.services.base import Base_Services
+from src.services.preprocessing import (
+    Preprocessing_Services,
+    failure_status_code,
+    operation_credits,
+    upstream_operations,
+)
+from src.services.tracking import tracking_recorder
+from src.utils.config import JOB_MAX_ATTEMPTS
+
+
+class Jobs_Services(Base_Services):
+    def __init__(self, endpoint):
+        super().__init__()
+        self.endpoint = endpoint
+
+    async def submit_job(self, email, operation, image_bytes, content_type):
+        if operation not in upstream_operations:
+            return {"detail": f"Unsupported operation {operation}."}, status.HTTP_404_NOT_FOUND
+        job_data = dict()
+        job_data["user_id"] = await UserQuery.get_user_id(email)
+        job_data["service_type"] = operation
+        job_data["content_type"] = content_type
+        job_data["image_input"] = image_bytes
+        job = await JobQuery.add_job(job_data)
+        content = {"job_id": str(job.id), "status": job.status}
+        return content, status.HTTP_202_ACCEPTED
+
+    async def job_status(self, email, job_id):
+        user_id = await UserQuery.get_user_id(email)
+        job = await JobQuery.get_job(job_id, user_id)
+        if not job:
+            return {"detail": "Job doesn't Exist."}, status.HTTP_404_NOT_FOUND
+        return jsonable_encoder(dict(job._mapping)), status.HTTP_200_OK
+
+    async def job_result(self, email, job_id):
+        """
+        Returns:
+            tuple: The job row (status, content_type, image_output) or an error
+            content, and the status code.
+        """
+        user_id = await UserQuery.get_user_id(email)
+        job = await JobQuery.get_job_result(job_id, user_id)
+        if not job:
+            return {"detail": "Job doesn't Exist."}, status.HTTP_404_NOT_FOUND
+        if job.status != JOB_SUCCEEDED:
+            return {"detail": f"Job is {job.status}."}, status.HTTP_409_CONFLICT
+        return job, status.HTTP_200_OK
+
+
+async def execute_job(job):
+    """
+    Runs a claimed job through the preprocessing pipeline (cache, coalescing and
+    the upstream limiter), stores its result and records the call in tracking.
+    Failed jobs go back to the queue until they reach JOB_MAX_ATTEMPTS.
+    """
+    operation_object = Preprocessing_Services(
+        image_bytes=job.image_input, endpoint=job.service_type
+    )
+    try:
+        content, cached = await operation_object.process()
+    except Exception as e:
+        status_code = failure_status_code(e)
+        retry = job.attempts < JOB_MAX_ATTEMPTS
+        await JobQuery.fail_job(job.id, str(e), status_code, retry)
+        response, credits = str(e), 0
+    else:
+        status_code = status.HTTP_200_OK
+        await JobQuery.complete_job(job.id, content, status_code)
+        # Results served from the cache cost no upstream credits
+        response = "OK"
+        credits = 0 if cached else operation_credits[job.service_type]
+
+    tracking_recorder.record(
+        job.service_type,
+        status_code,
+        credits,
+        str(job.id),
+        f"jobs/{job.id}/input",
+        f"jobs/{job.id}/result",
+        response,
+        user_id=job.user_id,
+    )
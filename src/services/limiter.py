@@ -0,0 +1,158 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from src.helpers.metrics import register_metrics
+from src.utils.config import (
+    UPSTREAM_LIMIT_BACKOFF,
+    UPSTREAM_LIMIT_INITIAL,
+    UPSTREAM_LIMIT_LATENCY_TOLERANCE,
+    UPSTREAM_LIMIT_MAX,
+    UPSTREAM_LIMIT_MIN,
+    UPSTREAM_LIMIT_QUEUE_SIZE,
+    UPSTREAM_LIMIT_QUEUE_TIMEOUT,
+)
+
+
+class LimiterRejected(Exception):
+    """Raised when a request can't get an upstream slot within the queue bounds."""
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limiter for one upstream operation.
+    The in-flight limit grows by 1/limit per healthy call while the limit is in use,
+    shrinks a little when latency drifts above the baseline and is cut by the
+    backoff factor when the API reports overload. Calls over the limit wait in a
+    bounded FIFO queue.
+
+    Usage:
+        async with limiter.slot():
+            await call_upstream()
+    """
+
+    def __init__(
+        self,
+        name,
+        initial=UPSTREAM_LIMIT_INITIAL,
+        min_limit=UPSTREAM_LIMIT_MIN,
+        max_limit=UPSTREAM_LIMIT_MAX,
+        backoff=UPSTREAM_LIMIT_BACKOFF,
+        latency_tolerance=UPSTREAM_LIMIT_LATENCY_TOLERANCE,
+        max_queue=UPSTREAM_LIMIT_QUEUE_SIZE,
+        max_wait=UPSTREAM_LIMIT_QUEUE_TIMEOUT,
+    ):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.baseline_latency = None
+        self._waiters = deque()
+        self.counters = {"completed": 0, "overloads": 0, "rejected": 0}
+
+    @asynccontextmanager
+    async def slot(self):
+        """Holds one in-flight slot and feeds the call outcome back into the limit."""
+        await self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        except BaseException as exc:
+            if getattr(exc, "overloaded", False):
+                self._on_overload()
+            raise
+        else:
+            self._on_success(time.monotonic() - started)
+        finally:
+            self.release()
+
+    async def acquire(self):
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.counters["rejected"] += 1
+            raise LimiterRejected(f"Upstream queue for {self.name} is full.")
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # The slot is handed over by release() before the waiter is resolved
+            await asyncio.wait_for(waiter, self.max_wait)
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            self.counters["rejected"] += 1
+            raise LimiterRejected(f"Timed out waiting for an upstream {self.name} slot.")
+        except asyncio.CancelledError:
+            # Give the slot back if it was handed over just before the cancellation
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._discard(waiter)
+            raise
+
+    def _discard(self, waiter):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake_waiters()
+
+    def _wake_waiters(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def _on_success(self, latency):
+        self.counters["completed"] += 1
+        if self.baseline_latency is None or latency < self.baseline_latency:
+            self.baseline_latency = latency
+        else:
+            # Drift slowly towards recent latency so the baseline follows the workload
+            self.baseline_latency += (latency - self.baseline_latency) * 0.01
+        if latency <= self.baseline_latency * self.latency_tolerance:
+            # Only grow while the current limit is actually being used
+            if self.in_flight >= int(self.limit):
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        else:
+            self.limit = max(self.min_limit, self.limit * 0.95)
+
+    def _on_overload(self):
+        self.counters["overloads"] += 1
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "baseline_latency": self.baseline_latency,
+        }
+
+
+upstream_limiters = {}
+
+
+def get_upstream_limiter(operation: str) -> AdaptiveLimiter:
+    """Returns the limiter of an upstream operation, creating it on first use."""
+    limiter = upstream_limiters.get(operation)
+    if limiter is None:
+        limiter = upstream_limiters[operation] = AdaptiveLimiter(operation)
+    return limiter
+
+
+register_metrics(
+    "upstream_limiters",
+    lambda: {name: limiter.stats() for name, limiter in upstream_limiters.items()},
+)
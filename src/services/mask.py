@@ -0,0 +1,79 @@
+import asyncio
+import io
+from collections import OrderedDict
+
+from PIL import Image
+
+from src.helpers.metrics import register_metrics
+from src.services.transcode import encode_image
+from src.utils.config import MASK_CACHE_ITEMS
+
+
+def encode_mask(width: int, height: int, format: str = "png"):
+    """
+    Encodes an all-black mask. PNG masks are 1-bit, one bit per pixel instead of
+    three bytes, and a run of zero bits compresses to almost nothing. Other
+    output formats get a grayscale mask.
+    Returns:
+        tuple: The encoded mask bytes and their media type.
+    """
+    if format != "png":
+        return encode_image(Image.new("L", (width, height), 0), format)
+    output = io.BytesIO()
+    Image.new("1", (width, height), 0).save(output, format="PNG", optimize=True)
+    return output.getvalue(), "image/png"
+
+
+class MaskCache:
+    """
+    LRU cache of encoded black masks keyed by (width, height, format).
+    Uploads from the same camera models share a handful of sizes, so most
+    requests only need the size parsed by the upload validator and a dictionary
+    lookup, the upload itself is never read.
+    """
+
+    def __init__(self, max_items=MASK_CACHE_ITEMS):
+        self.max_items = max_items
+        self._masks = OrderedDict()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    async def get_mask(self, size: tuple, format: str = "png"):
+        """
+        Returns the mask of an image size.
+        Parameters:
+            size (tuple): (width, height) of the image, as read from its header.
+            format (str): Output format, a key of OUTPUT_FORMATS.
+        Returns:
+            tuple: The encoded mask bytes and their media type.
+        """
+        width, height = size
+        key = (width, height, format)
+        mask = self._masks.get(key)
+        if mask is not None:
+            self._masks.move_to_end(key)
+            self.counters["hits"] += 1
+        else:
+            self.counters["misses"] += 1
+            # PIL releases the GIL while compressing, a thread is enough here
+            mask = await asyncio.to_thread(encode_mask, width, height, format)
+            self._store(key, mask)
+        return mask
+
+    def _store(self, key, mask):
+        self._masks[key] = mask
+        self._masks.move_to_end(key)
+        while len(self._masks) > self.max_items:
+            self._masks.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "items": len(self._masks),
+            "bytes": sum(len(mask) for mask, _ in self._masks.values()),
+        }
+
+
+# Shared cache for the create-mask-image route
+mask_cache = MaskCache()
+register_metrics("mask_cache", mask_cache.stats)
@@ -0,0 +1,144 @@
+import io
+import time
+
+from PIL import Image, ImageOps
+
+from src.helpers.metrics import register_metrics
+from src.services.process_pool import ProcessPoolRejected, image_process_pool
+from src.utils.config import (
+    UPLOAD_JPEG_QUALITY,
+    UPLOAD_MAX_BYTES,
+    UPLOAD_MAX_SIDE,
+    UPLOAD_OPTIMIZE_ENABLED,
+)
+
+# EXIF tags carrying the orientation and image metadata that the API doesn't need
+EXIF_ORIENTATION = 0x0112
+METADATA_KEYS = ("exif", "xmp", "XML:com.adobe.xmp", "comment", "photoshop")
+# Formats kept lossless, they usually carry flat graphics or transparency
+LOSSLESS_FORMATS = ("PNG", "GIF")
+
+
+def optimize_image_bytes(
+    image_bytes, max_side=UPLOAD_MAX_SIDE, jpeg_quality=UPLOAD_JPEG_QUALITY
+):
+    """
+    Prepares an upload for the cutout API: applies the EXIF orientation, drops
+    metadata, downscales to max_side on the longest edge and re-encodes.
+    JPEG and other opaque photos are encoded as JPEG at jpeg_quality, images with
+    transparency and flat graphics as PNG. The ICC profile is kept so colors don't shift.
+    The original bytes are returned when there is nothing to do, or when only
+    metadata would be dropped and the re-encode isn't smaller.
+    Returns:
+        tuple: The image bytes to upload and their media type.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    source_format = image.format
+    width, height = image.size
+    scale = min(1.0, max_side / max(width, height))
+    orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+    has_metadata = any(key in image.info for key in METADATA_KEYS)
+    source_media_type = Image.MIME.get(source_format, "application/octet-stream")
+    if (
+        scale == 1.0
+        and orientation == 1
+        and not has_metadata
+        and len(image_bytes) <= UPLOAD_MAX_BYTES
+    ):
+        return image_bytes, source_media_type
+
+    if scale < 1.0:
+        # JPEG decodes straight at 1/2, 1/4 or 1/8 scale, skipping most of the pixels
+        image.draft(image.mode, (int(width * scale), int(height * scale)))
+    icc_profile = image.info.get("icc_profile")
+    image = ImageOps.exif_transpose(image)
+    if scale < 1.0:
+        image.thumbnail((max_side, max_side), Image.LANCZOS, reducing_gap=3.0)
+
+    has_alpha = "A" in image.getbands() or "transparency" in image.info
+    output = io.BytesIO()
+    if source_format in LOSSLESS_FORMATS or has_alpha:
+        image.save(output, format="PNG", icc_profile=icc_profile)
+        media_type = "image/png"
+    else:
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(
+            output,
+            format="JPEG",
+            quality=jpeg_quality,
+            optimize=True,
+            icc_profile=icc_profile,
+        )
+        media_type = "image/jpeg"
+    content = output.getvalue()
+    if (
+        scale == 1.0
+        and orientation == 1
+        and len(content) >= len(image_bytes)
+        and len(image_bytes) <= UPLOAD_MAX_BYTES
+    ):
+        return image_bytes, source_media_type
+    return content, media_type
+
+
+class UploadOptimizer:
+    """
+    Pre-upload stage in front of the upstream operations.
+    Runs optimize_image_bytes in the image process pool, reports the bytes saved
+    and the time spent for each call and keeps their totals. Any failure falls
+    back to the original bytes, the API then sees exactly what the client sent.
+    """
+
+    def __init__(self, enabled=UPLOAD_OPTIMIZE_ENABLED):
+        self.enabled = enabled
+        self.counters = {
+            "optimized": 0,
+            "unchanged": 0,
+            "skipped": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+            "bytes_saved": 0,
+            "seconds": 0.0,
+        }
+
+    async def optimize(self, image_bytes: bytes, max_side=UPLOAD_MAX_SIDE):
+        """
+        Returns the bytes to upload for an image.
+        Parameters:
+            image_bytes (bytes): The uploaded image.
+            max_side (int): Longest edge allowed by the operation.
+        Returns:
+            tuple: The optimized image, or image_bytes when it can't be improved,
+            and the call's report {"bytes_saved", "seconds"}, None when disabled.
+        """
+        if not self.enabled:
+            return image_bytes, None
+        started = time.perf_counter()
+        content = image_bytes
+        try:
+            content, _ = await image_process_pool.run(
+                optimize_image_bytes, image_bytes, max_side=max_side
+            )
+        except ProcessPoolRejected:
+            # No capacity to optimize, sending the original is better than failing
+            self.counters["skipped"] += 1
+        except Exception as e:
+            print(f"Failed to optimize upload. Error: {e}")
+            self.counters["skipped"] += 1
+        else:
+            self.counters["optimized" if content != image_bytes else "unchanged"] += 1
+            self.counters["bytes_in"] += len(image_bytes)
+            self.counters["bytes_out"] += len(content)
+            self.counters["bytes_saved"] += len(image_bytes) - len(content)
+        seconds = time.perf_counter() - started
+        self.counters["seconds"] += seconds
+        return content, {"bytes_saved": len(image_bytes) - len(content), "seconds": seconds}
+
+    def stats(self) -> dict:
+        return {**self.counters, "seconds": round(self.counters["seconds"], 3)}
+
+
+# Shared optimizer used by Preprocessing_Services before every upstream call
+upload_optimizer = UploadOptimizer()
+register_metrics("upload_optimizer", upload_optimizer.stats)
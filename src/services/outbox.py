@@ -0,0 +1,262 @@
+import asyncio
+import smtplib
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from jinja2 import Environment, FileSystemLoader, TemplateNotFound
+
+from src.helpers.metrics import register_metrics
+from src.utils.config import (
+    EMAIL_BACKEND,
+    EMAIL_MAX_ATTEMPTS,
+    EMAIL_QUEUE_SIZE,
+    EMAIL_RETRY_BACKOFF,
+    EMAIL_SENDER_ADDRESS,
+    EMAIL_SENDER_PASSWORD,
+    EMAIL_SENDERS,
+    EMAIL_SHUTDOWN_TIMEOUT,
+    EMAIL_SMTP_IDLE_TIMEOUT,
+    EMAIL_SMTP_PORT,
+    EMAIL_SMTP_SERVER,
+    EMAIL_SMTP_STARTTLS,
+    EMAIL_SMTP_TIMEOUT,
+    PASSWORD_RESET_TEMPLATE,
+    TEMPLATES_PATH,
+    VERIFY_TEMPLATE,
+)
+
+
+class EmailTemplates:
+    """
+    Email templates parsed and compiled once, at startup by the app lifespan,
+    instead of building a Jinja environment and parsing the file on every email.
+    """
+
+    def __init__(self, path=TEMPLATES_PATH, names=(VERIFY_TEMPLATE, PASSWORD_RESET_TEMPLATE)):
+        self.names = [name for name in names if name]
+        # auto_reload off: compiled templates are never checked against the files again
+        self.environment = Environment(loader=FileSystemLoader(path), auto_reload=False)
+        self._templates = {}
+
+    def load(self):
+        for name in self.names:
+            try:
+                self._templates[name] = self.environment.get_template(name)
+            except TemplateNotFound:
+                print(f"The email template {name} was not found.")
+
+    def render(self, name: str, data: dict):
+        """
+        Returns:
+            str: The rendered HTML, None when the template doesn't exist.
+        """
+        template = self._templates.get(name)
+        if template is None:
+            try:
+                template = self._templates[name] = self.environment.get_template(name)
+            except TemplateNotFound:
+                print(f"The email template {name} was not found.")
+                return None
+        return template.render(data)
+
+
+class SMTPEmailBackend:
+    """
+    One persistent authenticated SMTP connection, reused for every message of
+    the sender that owns it. It is reopened after EMAIL_SMTP_IDLE_TIMEOUT idle
+    seconds or when a send fails. send() blocks, senders run it in a thread.
+    """
+
+    def __init__(
+        self,
+        host=EMAIL_SMTP_SERVER,
+        port=EMAIL_SMTP_PORT,
+        username=EMAIL_SENDER_ADDRESS,
+        password=EMAIL_SENDER_PASSWORD,
+        starttls=EMAIL_SMTP_STARTTLS,
+        timeout=EMAIL_SMTP_TIMEOUT,
+        idle_timeout=EMAIL_SMTP_IDLE_TIMEOUT,
+    ):
+        self.host = host
+        self.port = int(port or 0)
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._smtp = None
+        self._last_used = 0.0
+        self.connects = 0
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.password:
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self.connects += 1
+        return smtp
+
+    def send(self, message):
+        if self._smtp is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            # The server has likely dropped it already
+            self.close()
+        if self._smtp is None:
+            self._smtp = self._connect()
+        try:
+            self._smtp.send_message(message)
+        except Exception:
+            # The connection state is unknown, the retry opens a new one
+            self.close()
+            raise
+        self._last_used = time.monotonic()
+
+    def close(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            self._smtp.close()
+        self._smtp = None
+
+
+class MemoryEmailBackend:
+    """
+    Local stand-in for the SMTP server, each sender's backend keeps the messages
+    it sent in sent (read them through email_outbox._backends).
+    """
+
+    def __init__(self):
+        self.connects = 0
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(message)
+
+    def close(self):
+        pass
+
+
+EMAIL_BACKENDS = {"smtp": SMTPEmailBackend, "memory": MemoryEmailBackend}
+
+
+class EmailOutbox:
+    """
+    Requests enqueue rendered messages and return right away, background senders
+    deliver them over pooled SMTP connections (one per sender). Failed sends are
+    retried with exponential backoff up to max_attempts, permanent refusals
+    (every recipient rejected) are not. The queue is bounded, messages that
+    don't fit are dropped and counted.
+    """
+
+    def __init__(
+        self,
+        backend=EMAIL_BACKEND,
+        senders=EMAIL_SENDERS,
+        queue_size=EMAIL_QUEUE_SIZE,
+        max_attempts=EMAIL_MAX_ATTEMPTS,
+        retry_backoff=EMAIL_RETRY_BACKOFF,
+        shutdown_timeout=EMAIL_SHUTDOWN_TIMEOUT,
+        sender_address=EMAIL_SENDER_ADDRESS,
+    ):
+        if backend not in EMAIL_BACKENDS:
+            raise ValueError(f"Unknown email backend {backend}.")
+        self.backend = backend
+        self.senders = senders
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.shutdown_timeout = shutdown_timeout
+        self.sender_address = sender_address
+        self._queue = asyncio.Queue(queue_size)
+        # Every backend opened, kept after close for the connects count
+        self._backends = []
+        self._tasks = []
+        self.counters = {"queued": 0, "sent": 0, "retries": 0, "failed": 0, "dropped": 0}
+
+    def send(self, recipient_email, subject, html_content=None) -> bool:
+        """
+        Queues a message, never waits.
+        Returns:
+            bool: False when the queue is full and the message was dropped.
+        """
+        message = MIMEMultipart("alternative")
+        message["Subject"] = subject
+        message["From"] = self.sender_address
+        message["To"] = recipient_email
+        if html_content:
+            message.attach(MIMEText(html_content, "html"))
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.counters["dropped"] += 1
+            print(f"Email outbox is full, dropped the message to {recipient_email}.")
+            return False
+        self.counters["queued"] += 1
+        return True
+
+    async def _deliver(self, backend, message):
+        for attempt in range(self.max_attempts):
+            try:
+                await asyncio.to_thread(backend.send, message)
+            except smtplib.SMTPRecipientsRefused as e:
+                print(f"Email to {message['To']} refused. Error: {e}")
+                break
+            except Exception as e:
+                if attempt + 1 == self.max_attempts:
+                    print(f"Failed to send email to {message['To']}. Error: {e}")
+                    break
+                self.counters["retries"] += 1
+                await asyncio.sleep(self.retry_backoff * 2**attempt)
+            else:
+                self.counters["sent"] += 1
+                return
+        self.counters["failed"] += 1
+
+    async def _run(self, backend):
+        while True:
+            message = await self._queue.get()
+            try:
+                await self._deliver(backend, message)
+            finally:
+                self._queue.task_done()
+
+    def start(self):
+        if self._tasks:
+            return
+        for _ in range(self.senders):
+            backend = EMAIL_BACKENDS[self.backend]()
+            self._backends.append(backend)
+            self._tasks.append(asyncio.create_task(self._run(backend)))
+
+    async def close(self):
+        """Gives the queued messages shutdown_timeout seconds, then stops the senders."""
+        if self._tasks:
+            try:
+                await asyncio.wait_for(self._queue.join(), self.shutdown_timeout)
+            except asyncio.TimeoutError:
+                print(f"Email outbox closed with {self._queue.qsize()} messages unsent.")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for backend in self._backends:
+            await asyncio.to_thread(backend.close)
+        self._tasks.clear()
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "queue": self._queue.qsize(),
+            "connects": sum(backend.connects for backend in self._backends),
+        }
+
+
+# Shared templates and outbox, loaded, started and closed by the app lifespan
+email_templates = EmailTemplates()
+email_outbox = EmailOutbox()
+register_metrics("email_outbox", email_outbox.stats)
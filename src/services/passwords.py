@@ -0,0 +1,89 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+from src.helpers.admission import BoundedAdmission
+from src.helpers.metrics import register_metrics
+from src.utils.config import (
+    BCRYPT_ROUNDS,
+    PASSWORD_HASH_QUEUE_SIZE,
+    PASSWORD_HASH_QUEUE_TIMEOUT,
+    PASSWORD_HASH_WORKERS,
+)
+
+
+class PasswordHashRejected(Exception):
+    """Raised when a password operation can't get a hashing thread in time."""
+
+
+class PasswordHasher:
+    """
+    Process-wide bcrypt hasher.
+    One CryptContext is shared by every service, and hash/verify run on a small
+    dedicated thread pool (bcrypt releases the GIL) so the event loop keeps
+    serving other requests. At most workers + queue_size operations are
+    admitted, the rest wait up to queue_timeout and are then rejected, a login
+    storm gets 503s instead of stalling the app.
+    """
+
+    def __init__(
+        self,
+        rounds=BCRYPT_ROUNDS,
+        workers=PASSWORD_HASH_WORKERS,
+        queue_size=PASSWORD_HASH_QUEUE_SIZE,
+        queue_timeout=PASSWORD_HASH_QUEUE_TIMEOUT,
+    ):
+        self.context = CryptContext(
+            schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds
+        )
+        self.admission = BoundedAdmission(
+            workers,
+            queue_size,
+            queue_timeout,
+            rejected_error=PasswordHashRejected,
+            rejected_message="Too many password operations, try again later.",
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="password-hash"
+        )
+        self.counters = {"hashes": 0, "verifies": 0, "rehashes": 0}
+
+    async def _run(self, function, *args):
+        async with self.admission.admit():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, function, *args)
+
+    async def hash(self, password: str) -> str:
+        """
+        Hashes a password with the configured cost.
+        Raises:
+            PasswordHashRejected: If the hashing queue is full.
+        """
+        self.counters["hashes"] += 1
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed: str):
+        """
+        Checks a password against its stored hash.
+        Returns:
+            tuple: Whether the password matches, and a new hash to store when the
+            stored one was made with another cost or scheme, None otherwise.
+        Raises:
+            PasswordHashRejected: If the hashing queue is full.
+        """
+        self.counters["verifies"] += 1
+        verified, new_hash = await self._run(
+            self.context.verify_and_update, password, hashed
+        )
+        if new_hash is not None:
+            self.counters["rehashes"] += 1
+        return verified, new_hash
+
+    def stats(self) -> dict:
+        return {**self.counters, **self.admission.stats()}
+
+
+# Shared hasher, every service uses the same context and threads
+password_hasher = PasswordHasher()
+register_metrics("password_hasher", password_hasher.stats)
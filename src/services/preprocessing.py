@@ -1,10 +1,29 @@
-import requests
 from fastapi import HTTPException, status
 from src.services.base import Base_Services
-from src.utils.config import API_BASE_URL, API_KEY
-from PIL import Image, ImageEnhance
-import io
+from src.services.cache import result_cache
+from src.services.credits import InsufficientCredits, credit_ledger
+from src.services.enhance import (
+    DEFAULT_BRIGHTNESS,
+    DEFAULT_COLOR,
+    DEFAULT_CONTRAST,
+    DEFAULT_SHARPNESS,
+    enhance_image_bytes,
+)
+from src.services.limiter import LimiterRejected, get_upstream_limiter
+from src.services.mask import mask_cache
+from src.services.optimize import upload_optimizer
+from src.services.process_pool import ProcessPoolRejected, image_process_pool
+from src.services.single_flight import single_flight
+from src.services.transcode import sniff_media_type, transcode_image_bytes
+from src.services.upstream import UpstreamError, upstream_client
+from src.utils.config import (
+    API_BASE_URL,
+    API_KEY,
+    UPLOAD_MAX_SIDE,
+    UPSTREAM_STREAM_CHUNK_SIZE,
+)
 import logging
+from functools import cached_property
 
 
 class Preprocessing_Services(Base_Services):
@@ -15,11 +34,131 @@ class Preprocessing_Services(Base_Services):
         self.api_base_url = API_BASE_URL
         self.api_key = API_KEY
         self.image = image_bytes
+        # Bytes saved and time spent optimizing this request's upload, None when
+        # it wasn't optimized here (cache hit, coalesced call, optimizer disabled)
+        self.upload_report = None
         self.image_formats = ["PNG", "JPEG", "GIF", "BMP", "TIFF", "ICO", "WEBP", "PDF", 
                               "EPS", "PCX", "PPM"]
-     
+
+    @cached_property
+    def cache_key(self):
+        return result_cache.make_key(self.endpoint, self.image)
+
+    @cached_property
+    def etag(self):
+        return result_cache.make_etag(self.cache_key)
+
+    def output_key(self, output):
+        # Transcoded variants are cached next to the result they were made from
+        if output is None:
+            return self.cache_key
+        variant = f"{output['format']}.{output['quality']}.{output['effort']}"
+        return result_cache.make_key(variant, self.cache_key.encode())
+
+    def output_etag(self, output):
+        return result_cache.make_etag(self.output_key(output))
+
+    async def render(self, content, output, media_type="application/octet-stream"):
+        """
+        Transcodes a result to the negotiated output format in the image process
+        pool, transcoded variants are cached like the results themselves.
+        When the pool is saturated or the result can't be decoded, it is served
+        in its produced format.
+        Parameters:
+            content (bytes): The result of the operation.
+            output (dict): Negotiated format, quality and effort, None to keep the format.
+            media_type (str): Media type used when the result isn't a known image.
+        Returns:
+            tuple: The response bytes and their media type.
+        """
+        if output is None:
+            return content, sniff_media_type(content, media_type)
+        key = self.output_key(output)
+        transcoded = await result_cache.get(key)
+        if transcoded is not None:
+            return transcoded, sniff_media_type(transcoded, media_type)
+        try:
+            transcoded, transcoded_type = await image_process_pool.run(
+                transcode_image_bytes, content, **output
+            )
+        except ProcessPoolRejected:
+            return content, sniff_media_type(content, media_type)
+        except Exception as e:
+            print(f"Failed to transcode {self.endpoint} result. Error: {e}")
+            return content, sniff_media_type(content, media_type)
+        await result_cache.set(key, transcoded)
+        return transcoded, transcoded_type
+
+    async def process(self):
+        """
+        Runs the upstream operation mapped to self.endpoint, serving repeated
+        submissions of the same image from the result cache.
+        Identical requests in flight at the same time share one upstream call.
+        Returns:
+            tuple: The result bytes and whether they came from the cache.
+        """
+        content = await result_cache.get(self.cache_key)
+        if content is not None:
+            return content, True
+        content = await single_flight.do(self.cache_key, self._run_upstream)
+        return content, False
+
+    async def _run_upstream(self):
+        # Fail fast when the credits can't cover the call, before optimizing the upload
+        credit_ledger.check(operation_credits[self.endpoint])
+        # The cache key stays on the original upload, only the bytes sent upstream change
+        self.image, self.upload_report = await upload_optimizer.optimize(
+            self.image, upload_max_sides[self.endpoint]
+        )
+        operation = getattr(self, upstream_operations[self.endpoint])
+        content = await operation()
+        await result_cache.set(self.cache_key, content)
+        return content
+
+    async def _post_upstream(self, operation):
+        # Reserve the credits, committed if the call succeeds, then hold a slot of
+        # the operation's adaptive limiter for the whole upstream call
+        async with credit_ledger.reserve(operation_credits[operation]):
+            async with get_upstream_limiter(operation).slot():
+                return await upstream_client.post_file(
+                    upstream_endpoints[operation], self.image
+                )
+
+    async def stream(self, upload, content_type):
+        """
+        Streaming mode: pipes the uploaded file chunk by chunk into the upstream
+        request and relays the upstream body as it arrives, so memory per request
+        stays bounded by the chunk size whatever the image size.
+        Bypasses the result cache and request coalescing, which need the full bytes.
+        Parameters:
+            upload (UploadFile): The uploaded image, read in chunks.
+            content_type (str): The content type of the uploaded image.
+        Returns:
+            tuple: The upstream response body (AsyncIterator[bytes]) and its
+            Content-Type, the result format can differ from the upload's.
+        Raises:
+            InsufficientCredits: If the credits left can't cover the call.
+            Exception: If the upstream request fails.
+        """
+
+        async def read_chunks():
+            await upload.seek(0)
+            while chunk := await upload.read(UPSTREAM_STREAM_CHUNK_SIZE):
+                yield chunk
+
+        try:
+            # Credits and the limiter slot are held until the upstream response headers arrive
+            async with credit_ledger.reserve(operation_credits[self.endpoint]):
+                async with get_upstream_limiter(self.endpoint).slot():
+                    response = await upstream_client.open_stream(
+                        upstream_endpoints[self.endpoint], read_chunks(), content_type
+                    )
+        except UpstreamError as e:
+            raise Exception(f"An error occurred in the {self.endpoint} stream: {e}")
+        media_type = response.headers.get("Content-Type", "application/octet-stream")
+        return upstream_client.iter_response(response), media_type
     
-    def photo_enhancer(self):
+    async def photo_enhancer(self):
         """
         Enhances the quality of photos that have issues such as bad focus, low resolution, blurriness, pixelation, or damage.
         Transforms every photo into a high-definition version with sharp focus.
@@ -27,18 +166,11 @@ class Preprocessing_Services(Base_Services):
             Exception: If the request to the enhancement API fails.
         """
         try:
-            endpoint = "/api/v1/photoEnhance"
-            response = requests.post(
-                self.api_base_url + endpoint,
-                files={"file": self.image},
-                headers={"APIKEY": self.api_key},
-            )
-            response.raise_for_status()  # This will raise an exception for HTTP error codes
-            return response.content
-        except requests.exceptions.RequestException as e:
+            return await self._post_upstream("enhance-photo")
+        except UpstreamError as e:
             raise Exception(f"An error occurred while enhancing the photo: {e}")
 
-    def remove_background(self,):
+    async def remove_background(self,):
         """
         Automatically recognizes the foreground in the image, separates it from the background,
         and returns a transparent image (foreground colors along with the alpha matte).
@@ -53,19 +185,12 @@ class Preprocessing_Services(Base_Services):
             Exception: If there's an error with the API request or if the input is not in the expected format.
         """
         try:
-            endpoint = "/api/v1/matting?mattingType=6"
-            response = requests.post(
-                self.api_base_url + endpoint,
-                files={"file": self.image},
-                headers={"APIKEY": self.api_key},
-                )
-            response.raise_for_status()  # Checks for HTTP errors and raises an exception if found
-            return response.content
-        except requests.exceptions.RequestException as e:
+            return await self._post_upstream("remove-background")
+        except UpstreamError as e:
             # Rethrow with a more descriptive error message
             raise Exception(f"An error occurred while removing the background: {e}")
 
-    def photo_colorizer(self,):
+    async def photo_colorizer(self,):
         """
         Colorizes black and white photos using advanced AI algorithms. This function is ideal for
         enhancing old family photos, historical figure portraits, and any black and white images that
@@ -80,18 +205,11 @@ class Preprocessing_Services(Base_Services):
             Exception: If there's an error with the API request.
         """
         try:
-            endpoint = "/api/v1/matting?mattingType=19"
-            response = requests.post(
-                self.api_base_url + endpoint,
-                files={"file": self.image},
-                headers={"APIKEY": self.api_key},
-            )
-            response.raise_for_status()  # This will raise an exception for HTTP error codes
-            return response.content
-        except requests.exceptions.RequestException as e:
+            return await self._post_upstream("photo-colorizer")
+        except UpstreamError as e:
             raise Exception(f"An error occurred while colorizing the photo: {e}")
 
-    def segment_face_and_hair(self,):
+    async def segment_face_and_hair(self,):
         """
         Segments the face and hair from a photo, returning the result as image data.
         This method is highly accurate and fast, making it suitable for various applications
@@ -103,21 +221,14 @@ class Preprocessing_Services(Base_Services):
         Raises:
             Exception: If the API call fails or there's a problem processing the image.
         """
-        endpoint = "/api/v1/matting?mattingType=3"
         try:
-            response = requests.post(
-                f"{self.api_base_url}{endpoint}",
-                files={"file": self.image},
-                headers={"APIKEY": self.api_key},
-            )
-            response.raise_for_status()  # Ensure the API request was successful
-            return response.content
-        except requests.exceptions.RequestException as e:
+            return await self._post_upstream("face-extraction")
+        except UpstreamError as e:
             raise Exception(
                 f"An error occurred during the face and hair segmentation process: {e}"
             )
 
-    def photo_color_correction(self):
+    async def photo_color_correction(self):
         """
         Apply AI-driven color correction to an image.
         This function communicates with a remote API to perform color correction on an image. 
@@ -128,81 +239,112 @@ class Preprocessing_Services(Base_Services):
         Returns:
             bytes: The corrected image data in binary format, which can also be saved locally.
         """
-        endpoint = "/api/v1/matting?mattingType=4"
         try:
             # Prepare and send a POST request to the API with the image data and API key
-            response = requests.post(
-                f"{self.api_base_url}{endpoint}",
-                files={"file": self.image},
-                headers={"APIKEY": self.api_key},
-            )
-            response.raise_for_status()  # Raises an HTTPError for bad requests (4XX or 5XX)
-            return response.content  # Return the binary content of the corrected image
-        except requests.exceptions.RequestException as e:
+            return await self._post_upstream("photo-color-correction")
+        except UpstreamError as e:
             # Handle exceptions from the request and provide a user-friendly message
             raise Exception(
                 f"An error occurred during the photo color correction process: {e}"
             )
 
-    def create_mask_image(self):
+    async def create_mask_image(self, size, output=None):
         """
         Creates a black mask image with the same dimensions as the input image.
+        The dimensions come from the image header and the encoded mask is cached
+        per size and format, so the image itself is never read or decoded.
+        Args:
+            size (tuple): (width, height) parsed from the upload by image_type_validate.
+            output (dict): Negotiated output format, a 1-bit PNG when None.
         Returns:
-            Image: A new black image of the same size as self.image.
+            tuple: The mask bytes and their media type.
         Raises:
             Exception: If there is an error during the image creation process.
         """
         try:
-            # Create a black image with the same dimensions as the input image
-            image = Image.open(io.BytesIO(self.image))
-            black_image= Image.new('RGB', image.size, (0, 0, 0))
-            # Prepare the image to send as a response
-            img_byte_arr = io.BytesIO()
-            black_image.save(img_byte_arr, format='PNG')
-            img_byte_arr = io.BytesIO(img_byte_arr.getvalue())
-            return img_byte_arr
-        except AttributeError as e:
-            # Handle exceptions related to image attribute access
+            format = output["format"] if output else "png"
+            return await mask_cache.get_mask(size, format)
+        except Exception as e:
             raise Exception(
                 f"An error occurred during the mask creation process: {str(e)}"
             )
-            
-    def enhance_image_local(self):
+
+    async def enhance_image_local(
+        self,
+        brightness=DEFAULT_BRIGHTNESS,
+        contrast=DEFAULT_CONTRAST,
+        sharpness=DEFAULT_SHARPNESS,
+        color=DEFAULT_COLOR,
+        output=None,
+    ):
         """
-        Converts byte data into a PIL Image object.
+        Enhances brightness, contrast, sharpness and color of the image locally
+        with the fused engine in src/services/enhance.py, run in the image process pool.
         Args:
-            byte_data (bytes): The image data in bytes.
+            brightness, contrast, sharpness, color (float): ImageEnhance factors, 1.0 keeps the image.
+            output (dict): Negotiated format, quality and effort, None to keep the input format.
         Returns:
-            Image: A PIL Image object if conversion is successful, None otherwise.
+            tuple: The enhanced image bytes and their media type, None if the image can't be processed.
+        Raises:
+            ProcessPoolRejected: If the image process pool is saturated.
         """
         try:
-            image = Image.open(io.BytesIO(self.image))
-         
-            # Brightness enhancement
-            enhancer = ImageEnhance.Brightness(image)
-            image = enhancer.enhance(1.2)  # Adjust the factor to taste
-            
-            # Contrast enhancement
-            enhancer = ImageEnhance.Contrast(image)
-            image = enhancer.enhance(1.5)  # Adjust the factor to taste
-            
-            # Sharpness enhancement
-            enhancer = ImageEnhance.Sharpness(image)
-            image = enhancer.enhance(2.0)  # Adjust the factor to taste
-
-            # Color balance (saturation)
-            enhancer = ImageEnhance.Color(image)
-            image = enhancer.enhance(1.5)  # Adjust the factor to taste
-        
-            # Prepare the image to send as a response
-            img_byte_arr = io.BytesIO()
-            image.save(img_byte_arr, format='PNG')
-            img_byte_arr = io.BytesIO(img_byte_arr.getvalue())
-            return img_byte_arr
+            return await image_process_pool.run(
+                enhance_image_bytes,
+                self.image,
+                brightness=brightness,
+                contrast=contrast,
+                sharpness=sharpness,
+                color=color,
+                **(output or {}),
+            )
+        except ProcessPoolRejected:
+            raise
         except Exception as e:
             print(f"Failed to convert bytes to image: {e}")
             return None
-    
+
+# Endpoint name -> Preprocessing_Services method calling the cutout API
+upstream_operations = {
+    "enhance-photo": "photo_enhancer",
+    "remove-background": "remove_background",
+    "photo-colorizer": "photo_colorizer",
+    "face-extraction": "segment_face_and_hair",
+    "photo-color-correction": "photo_color_correction",
+}
+
+# Endpoint name -> cutout API path
+upstream_endpoints = {
+    "enhance-photo": "/api/v1/photoEnhance",
+    "remove-background": "/api/v1/matting?mattingType=6",
+    "photo-colorizer": "/api/v1/matting?mattingType=19",
+    "face-extraction": "/api/v1/matting?mattingType=3",
+    "photo-color-correction": "/api/v1/matting?mattingType=4",
+}
+
+# Longest edge sent to the cutout API for each upstream operation. The enhancer
+# and colorizer return an image at the size they receive, so a lower cap would
+# lower their output resolution, only lower one after comparing the outputs.
+upload_max_sides = {
+    "enhance-photo": UPLOAD_MAX_SIDE,
+    "remove-background": UPLOAD_MAX_SIDE,
+    "photo-colorizer": UPLOAD_MAX_SIDE,
+    "face-extraction": UPLOAD_MAX_SIDE,
+    "photo-color-correction": UPLOAD_MAX_SIDE,
+}
+
+# Credits charged by the cutout API for each upstream operation
+operation_credits = {endpoint: 1 for endpoint in upstream_endpoints}
+
+
+def failure_status_code(error: Exception) -> int:
+    # Status recorded in tracking for an operation that raised error
+    if isinstance(error, InsufficientCredits):
+        return status.HTTP_402_PAYMENT_REQUIRED
+    if isinstance(error, LimiterRejected):
+        return status.HTTP_503_SERVICE_UNAVAILABLE
+    return status.HTTP_409_CONFLICT
+
 cutout_error_code={
     0: "Request succeeded",
     1001: "Request failed, used for unclassified errors, the “msg” field displays specific error information",
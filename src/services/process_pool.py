@@ -0,0 +1,156 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+
+from src.helpers.admission import BoundedAdmission
+from src.helpers.metrics import register_metrics
+from src.utils.config import (
+    IMAGE_POOL_QUEUE_SIZE,
+    IMAGE_POOL_QUEUE_TIMEOUT,
+    IMAGE_POOL_WORKERS,
+)
+
+
+class ProcessPoolRejected(Exception):
+    """Raised when an image task can't get into the pool within the queue bounds."""
+
+
+def _run_with_shared_memory(function, input_name, input_size, kwargs):
+    """
+    Runs in the pool process: reads the payload straight from shared memory and
+    writes the result into a new shared memory block owned by the caller.
+    """
+    source = SharedMemory(name=input_name)
+    try:
+        payload = source.buf[:input_size]
+        try:
+            content, media_type = function(payload, **kwargs)
+            # Copied before the payload is released, the function may return it as is
+            target = SharedMemory(create=True, size=max(1, len(content)))
+            target.buf[: len(content)] = content
+            target.close()
+            size = len(content)
+            del content
+        finally:
+            payload.release()
+    finally:
+        source.close()
+    return target.name, size, media_type
+
+
+def _discard_result(future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    target = SharedMemory(name=future.result()[0])
+    target.close()
+    target.unlink()
+
+
+class ImageProcessPool:
+    """
+    Managed process pool for CPU-bound image work.
+    Image bytes go to and come back from the processes through shared memory
+    instead of being pickled through a pipe. At most workers + queue_size tasks
+    are admitted, the rest wait up to queue_timeout and are then rejected.
+    """
+
+    def __init__(
+        self,
+        workers=IMAGE_POOL_WORKERS,
+        queue_size=IMAGE_POOL_QUEUE_SIZE,
+        queue_timeout=IMAGE_POOL_QUEUE_TIMEOUT,
+    ):
+        self.workers = workers
+        self.admission = BoundedAdmission(
+            workers,
+            queue_size,
+            queue_timeout,
+            rejected_error=ProcessPoolRejected,
+            rejected_message="Image processing queue is full.",
+        )
+        self._executor = None
+        self.counters = {"completed": 0, "failed": 0, "restarts": 0}
+
+    def start(self):
+        """Starts the processes, called once from the app lifespan."""
+        if self._executor is None:
+            # spawn: forking a process that runs an event loop and threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+    async def close(self):
+        """Stops the processes, dropping tasks that haven't started yet."""
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+
+    async def run(self, function, payload: bytes, **kwargs):
+        """
+        Runs function(payload, **kwargs) in a pool process.
+        The function must be importable at module level and return (bytes, media_type).
+        Raises:
+            ProcessPoolRejected: If the pool queue is full or the wait times out.
+        """
+        async with self.admission.admit():
+            return await self._submit(function, payload, kwargs)
+
+    def _restart(self, executor):
+        # A dead process (OOM kill, decoder crash) breaks the whole executor for
+        # good, drop it so the next task starts a fresh one. Tasks sharing the
+        # broken executor see the same error, only the first one replaces it.
+        if self._executor is executor:
+            self._executor = None
+            self.counters["restarts"] += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _submit(self, function, payload, kwargs):
+        source = SharedMemory(create=True, size=max(1, len(payload)))
+        try:
+            source.buf[: len(payload)] = payload
+            # A task that hit a broken pool is retried once on a fresh one
+            for retry in (False, True):
+                self.start()
+                executor = self._executor
+                future = None
+                try:
+                    future = executor.submit(
+                        _run_with_shared_memory, function, source.name, len(payload), kwargs
+                    )
+                    name, size, media_type = await asyncio.wrap_future(future)
+                    break
+                except asyncio.CancelledError:
+                    # The caller went away, free the result block once the task finishes
+                    if future is not None:
+                        future.add_done_callback(_discard_result)
+                    raise
+                except BrokenProcessPool:
+                    self._restart(executor)
+                    if retry:
+                        self.counters["failed"] += 1
+                        raise
+                except Exception:
+                    self.counters["failed"] += 1
+                    raise
+        finally:
+            source.close()
+            source.unlink()
+        target = SharedMemory(name=name)
+        try:
+            content = bytes(target.buf[:size])
+        finally:
+            target.close()
+            target.unlink()
+        self.counters["completed"] += 1
+        return content, media_type
+
+    def stats(self) -> dict:
+        return {**self.counters, **self.admission.stats()}
+
+
+# Shared pool for the local image routes, started and stopped by the app lifespan
+image_process_pool = ImageProcessPool()
+register_metrics("image_process_pool", image_process_pool.stats)
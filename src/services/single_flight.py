@@ -0,0 +1,50 @@
+import asyncio
+
+from src.helpers.metrics import register_metrics
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight calls so they share one execution.
+    The first caller for a key starts the call, every caller that arrives before it
+    finishes awaits the same task and receives the same result or exception.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.counters = {"calls": 0, "coalesced": 0}
+
+    async def do(self, key, fn):
+        """
+        Runs fn() once for all concurrent callers using the same key.
+        Parameters:
+            key (str): Identity of the call, e.g. the result cache key.
+            fn (callable): Coroutine function started by the first caller.
+        Returns:
+            The result of fn(), shared by every waiter.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            self.counters["calls"] += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.counters["coalesced"] += 1
+        # Shield so a disconnecting client doesn't cancel the call for the others
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved when every waiter has gone away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {**self.counters, "in_flight": len(self._calls)}
+
+
+# Shared coalescing layer in front of the upstream preprocessing operations
+single_flight = SingleFlight()
+register_metrics("single_flight", single_flight.stats)
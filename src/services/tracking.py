@@ -0,0 +1,361 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import defaultdict, deque
+from datetime import date, datetime, timezone
+
+from src.database.connection import DATABASE_UNAVAILABLE_ERRORS
+from src.database.database import new_uuid
+from src.helpers.metrics import register_metrics
+from src.queries.tracking import TrackingQuery
+from src.utils.config import (
+    TRACKING_BATCH_SIZE,
+    TRACKING_ENABLED,
+    TRACKING_FLUSH_INTERVAL,
+    TRACKING_MAX_ATTEMPTS,
+    TRACKING_OVERFLOW,
+    TRACKING_PARTITION_MONTHS_AHEAD,
+    TRACKING_QUEUE_SIZE,
+    TRACKING_SHUTDOWN_TIMEOUT,
+    TRACKING_SPILL_PATH,
+)
+
+OVERFLOW_POLICIES = ("drop_newest", "drop_oldest", "spill")
+
+
+class TrackingRecorder:
+    """
+    Records preprocessing calls in the tracking table without a database round
+    trip per request. record() appends to a bounded in-memory queue and a
+    background task writes it in batches (COPY) every flush_interval seconds or
+    as soon as batch_size records are waiting. Records only know the user's
+    email on the request path, user ids are looked up once per batch.
+    When the queue is full the overflow policy drops the new record, drops the
+    oldest one or spills the oldest batch to a JSON lines file replayed once
+    the database keeps up again. A batch the database rejects (rather than one
+    it couldn't be reached for) is split until the rejected records are alone,
+    the others are written. A rejected record is retried max_attempts times,
+    then spilled (its last chance is the replay) or dropped, so one bad record
+    can't hold back or take down the records around it.
+    """
+
+    def __init__(
+        self,
+        enabled=TRACKING_ENABLED,
+        queue_size=TRACKING_QUEUE_SIZE,
+        batch_size=TRACKING_BATCH_SIZE,
+        flush_interval=TRACKING_FLUSH_INTERVAL,
+        overflow=TRACKING_OVERFLOW,
+        spill_path=TRACKING_SPILL_PATH,
+        shutdown_timeout=TRACKING_SHUTDOWN_TIMEOUT,
+        max_attempts=TRACKING_MAX_ATTEMPTS,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown tracking overflow policy {overflow}.")
+        self.enabled = enabled
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.spill_path = spill_path
+        self.shutdown_timeout = shutdown_timeout
+        self.max_attempts = max_attempts
+        # [id, user_id, email, image, image_input, image_output, service_type,
+        #  response, status_code, credits, response_time, rejected attempts], oldest first
+        self._records = deque()
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        # First day of the month whose partitions were last ensured
+        self._partitions_month = None
+        self.counters = {
+            "recorded": 0,
+            "written": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "dropped": 0,
+            "abandoned": 0,
+            "spilled": 0,
+            "replayed": 0,
+            "unknown_users": 0,
+            "write_seconds": 0.0,
+        }
+
+    def record(
+        self,
+        service_type: str,
+        status_code: int,
+        credits: int,
+        image: str,
+        image_input: str,
+        image_output: str,
+        response: str = "OK",
+        email: str = None,
+        user_id=None,
+    ) -> bool:
+        """
+        Queues one call, never waits. The user is given by user_id or by email.
+        Returns:
+            bool: False when the record was dropped because the queue is full.
+        """
+        if not self.enabled:
+            return False
+        self.counters["recorded"] += 1
+        record = [
+            new_uuid(),
+            user_id,
+            email,
+            image,
+            image_input,
+            image_output,
+            service_type,
+            response,
+            status_code,
+            credits,
+            datetime.now(timezone.utc),
+            0,
+        ]
+        if len(self._records) >= self.queue_size:
+            if self.overflow == "drop_newest":
+                self.counters["dropped"] += 1
+                return False
+            if self.overflow == "spill":
+                # Move the oldest batch to disk at once, one file append per batch
+                count = min(self.batch_size, len(self._records))
+                self._spill([self._records.popleft() for _ in range(count)])
+            else:
+                self._records.popleft()
+                self.counters["dropped"] += 1
+        self._records.append(record)
+        if len(self._records) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    async def _write(self, records):
+        # Resolve the users given by email, then write the batch in one round trip
+        started = time.perf_counter()
+        try:
+            emails = {record[2] for record in records if record[1] is None}
+            user_ids = await TrackingQuery.get_user_ids(emails) if emails else {}
+            rows = []
+            # (user_id, UTC day, service_type) -> [calls, credits, errors]
+            usage = defaultdict(lambda: [0, 0, 0])
+            for record in records:
+                user_id = record[1] or user_ids.get(record[2])
+                # Skipped when the account was deleted in the meantime
+                if user_id is None:
+                    continue
+                # created_at is the time of the call, so its partition and rollup day match
+                rows.append((record[0], user_id, *record[3:11], record[10]))
+                totals = usage[(user_id, record[10].date(), record[6])]
+                totals[0] += 1
+                totals[1] += record[9]
+                totals[2] += int(record[8] >= 400)
+            usage_rows = [
+                {
+                    "user_id": user_id,
+                    "day": day,
+                    "service_type": service_type,
+                    "calls": calls,
+                    "credits": credits,
+                    "errors": errors,
+                }
+                for (user_id, day, service_type), (calls, credits, errors) in sorted(
+                    usage.items(), key=lambda item: (str(item[0][0]), *item[0][1:])
+                )
+            ]
+            if rows:
+                await TrackingQuery.add_tracking_batch(rows, usage_rows)
+        except Exception as e:
+            self.counters["failed_batches"] += 1
+            print(f"Failed to write {len(records)} tracking records. Error: {e}")
+            return e
+        self.counters["batches"] += 1
+        self.counters["written"] += len(rows)
+        self.counters["unknown_users"] += len(records) - len(rows)
+        self.counters["write_seconds"] += time.perf_counter() - started
+        return None
+
+    async def _write_isolating(self, records, written: set):
+        """
+        Writes records, halving a batch the database rejects until the records it
+        rejects are alone, so good records sharing a batch with a bad one are
+        written and only the bad one uses up an attempt. An unreachable database
+        stops the split, nothing is counted then.
+        Parameters:
+            written (set): Ids of the written records are added to it.
+        Returns:
+            tuple: The records left unwritten and whether the database was unreachable.
+        """
+        error = await self._write(records)
+        if error is None:
+            written.update(record[0] for record in records)
+            return [], False
+        if isinstance(error, DATABASE_UNAVAILABLE_ERRORS):
+            return records, True
+        if len(records) == 1:
+            records[0][11] += 1
+            return records, False
+        middle = len(records) // 2
+        failed, unavailable = await self._write_isolating(records[:middle], written)
+        if unavailable:
+            return failed + records[middle:], True
+        rest, unavailable = await self._write_isolating(records[middle:], written)
+        return failed + rest, unavailable
+
+    def _abandon(self, records):
+        self.counters["abandoned"] += len(records)
+        print(f"Gave up writing {len(records)} tracking records.")
+
+    def _requeue(self, records):
+        # A failed batch goes back in front of newer records, what doesn't fit overflows
+        room = max(self.queue_size - len(self._records), 0)
+        self._records.extendleft(reversed(records[:room]))
+        rest = records[room:]
+        if not rest:
+            return
+        if self.overflow == "spill":
+            self._spill(rest)
+        else:
+            self.counters["dropped"] += len(rest)
+
+    def _spill(self, records):
+        try:
+            os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+            with open(self.spill_path, "a") as spill_file:
+                for record in records:
+                    spill_file.write(json.dumps(record, default=str) + "\n")
+        except OSError as e:
+            self.counters["dropped"] += len(records)
+            print(f"Failed to spill tracking records. Error: {e}")
+            return
+        self.counters["spilled"] += len(records)
+
+    @staticmethod
+    def _load(line: str):
+        record = json.loads(line)
+        record[0] = uuid.UUID(record[0])
+        if record[1] is not None:
+            record[1] = uuid.UUID(record[1])
+        record[10] = datetime.fromisoformat(record[10])
+        # Spilled before attempts were counted
+        if len(record) < 12:
+            record.append(0)
+        return record
+
+    async def _replay_spill(self):
+        # Written in batches straight from the file, records still failing are spilled again
+        if self.overflow != "spill":
+            return
+        # A replay file left by an interrupted replay is finished first
+        replay_path = f"{self.spill_path}.replay"
+        if not os.path.exists(replay_path):
+            if not os.path.exists(self.spill_path):
+                return
+            os.replace(self.spill_path, replay_path)
+        with open(replay_path) as replay_file:
+            lines = iter(replay_file)
+            while batch := [self._load(line) for _, line in zip(range(self.batch_size), lines)]:
+                failed, unavailable = await self._write_isolating(batch, set())
+                self.counters["replayed"] += len(batch) - len(failed)
+                if unavailable:
+                    self._spill(failed)
+                    self._spill([self._load(line) for line in lines])
+                    break
+                # Rejected records out of attempts had their last chance, the
+                # others wait for the next replay
+                exhausted = [record for record in failed if record[11] >= self.max_attempts]
+                if exhausted:
+                    self._abandon(exhausted)
+                self._spill([record for record in failed if record[11] < self.max_attempts])
+        os.remove(replay_path)
+
+    async def flush(self):
+        """Writes every queued record, stops at the first failed batch."""
+        async with self._flush_lock:
+            while self._records:
+                count = min(self.batch_size, len(self._records))
+                batch = [self._records.popleft() for _ in range(count)]
+                written = set()
+                try:
+                    failed, unavailable = await self._write_isolating(batch, written)
+                except asyncio.CancelledError:
+                    # Shutdown timeout hit mid-write, keep what wasn't written for close()
+                    self._requeue([record for record in batch if record[0] not in written])
+                    raise
+                if not failed:
+                    continue
+                # Out of attempts: spilled for one more try on replay or given up,
+                # the other failed records go back to the queue
+                exhausted = [record for record in failed if record[11] >= self.max_attempts]
+                if exhausted:
+                    if self.overflow == "spill":
+                        self._spill(exhausted)
+                    else:
+                        self._abandon(exhausted)
+                self._requeue([record for record in failed if record[11] < self.max_attempts])
+                return
+            await self._replay_spill()
+
+    async def _ensure_partitions(self):
+        # Once per month (and until it succeeds), the current month and the next ones
+        month = datetime.now(timezone.utc).date().replace(day=1)
+        if month == self._partitions_month:
+            return
+        months = [month]
+        for _ in range(TRACKING_PARTITION_MONTHS_AHEAD):
+            month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+            months.append(month)
+        await TrackingQuery.ensure_partitions(months)
+        self._partitions_month = months[0]
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self._ensure_partitions()
+            except Exception as e:
+                print(f"Failed to create tracking partitions. Error: {e}")
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Failed to flush tracking records. Error: {e}")
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stops the background task and writes what is left, spilling it if that fails."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await asyncio.wait_for(self.flush(), self.shutdown_timeout)
+        except Exception as e:
+            print(f"Failed to flush tracking records on shutdown. Error: {e}")
+        if self._records:
+            records = list(self._records)
+            self._records.clear()
+            if self.overflow == "spill":
+                self._spill(records)
+            else:
+                self.counters["dropped"] += len(records)
+
+    def stats(self) -> dict:
+        return {**self.counters, "queued": len(self._records)}
+
+
+# Shared recorder, started and closed by the app lifespan and the job worker
+tracking_recorder = TrackingRecorder()
+register_metrics("tracking", tracking_recorder.stats)
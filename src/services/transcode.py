@@ -0,0 +1,129 @@
+import io
+from typing import Optional
+
+from PIL import Image
+
+from src.utils.config import TRANSCODE_EFFORT, TRANSCODE_QUALITY
+
+try:
+    # AVIF encoding comes from the optional pillow-avif-plugin package
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+# Output formats in order of preference when the client accepts several equally,
+# smallest output first
+OUTPUT_FORMATS = {
+    "avif": ("AVIF", "image/avif"),
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+}
+FORMAT_ALIASES = {"jpg": "jpeg"}
+# Highest value of the effort setting, the WebP "method" range
+MAX_EFFORT = 6
+
+
+def available_formats() -> list:
+    """Output formats the installed Pillow can encode."""
+    Image.init()
+    return [
+        name
+        for name, (pil_format, _) in OUTPUT_FORMATS.items()
+        if pil_format in Image.SAVE
+    ]
+
+
+def negotiate_format(
+    accept: Optional[str], requested: Optional[str] = None
+) -> Optional[str]:
+    """
+    Picks the output format of a response.
+    An explicit format query parameter wins, otherwise the image types listed in
+    the Accept header are ranked by q-value then by OUTPUT_FORMATS order.
+    Wildcards such as */* or image/* don't select anything.
+    Returns:
+        str: A key of OUTPUT_FORMATS, or None to keep the produced format.
+    """
+    formats = available_formats()
+    if requested:
+        requested = FORMAT_ALIASES.get(requested.lower(), requested.lower())
+        return requested if requested in formats else None
+    media_types = {OUTPUT_FORMATS[name][1]: name for name in formats}
+    best = None
+    for part in (accept or "").split(","):
+        media_type, *params = [item.strip() for item in part.split(";")]
+        name = media_types.get(media_type.lower())
+        if name is None:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        rank = (q, -formats.index(name))
+        if q > 0 and (best is None or rank > best[0]):
+            best = (rank, name)
+    return best[1] if best else None
+
+
+def sniff_media_type(content: bytes, default: str = "application/octet-stream") -> str:
+    """Media type of encoded image bytes, read from the header only."""
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            return Image.MIME.get(image.format, default)
+    except Exception:
+        return default
+
+
+def encode_image(
+    image: Image.Image, format: str, quality=TRANSCODE_QUALITY, effort=TRANSCODE_EFFORT
+):
+    """
+    Encodes an image in one of OUTPUT_FORMATS.
+    quality (1-100) drives the lossy formats, effort (0-6) trades encoding time
+    for size. Transparency is never dropped: JPEG can't hold it, so an image with
+    alpha asked as JPEG is encoded as PNG instead.
+    Returns:
+        tuple: The encoded bytes and their media type.
+    """
+    has_alpha = "A" in image.getbands() or "transparency" in image.info
+    if format == "jpeg" and has_alpha:
+        format = "png"
+    pil_format, media_type = OUTPUT_FORMATS[format]
+    output = io.BytesIO()
+    if format == "png":
+        compress_level = round(effort * 9 / MAX_EFFORT)
+        image.save(output, format=pil_format, compress_level=compress_level)
+    elif format == "jpeg":
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(output, format=pil_format, quality=quality, optimize=effort >= 4)
+    else:
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if has_alpha else "RGB")
+        if format == "webp":
+            image.save(output, format=pil_format, quality=quality, method=effort)
+        else:
+            # AVIF speed runs the other way, 10 is the fastest
+            image.save(output, format=pil_format, quality=quality, speed=10 - effort)
+    return output.getvalue(), media_type
+
+
+def transcode_image_bytes(
+    image_bytes, format: str, quality=TRANSCODE_QUALITY, effort=TRANSCODE_EFFORT
+):
+    """
+    Re-encodes an image in the negotiated format, meant for the image process pool.
+    Images already in that format are returned as they are.
+    Returns:
+        tuple: The encoded bytes and their media type.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    pil_format, media_type = OUTPUT_FORMATS[format]
+    if image.format == pil_format:
+        return bytes(image_bytes), media_type
+    return encode_image(image, format, quality, effort)
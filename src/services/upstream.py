@@ -0,0 +1,200 @@
+import asyncio
+from typing import AsyncIterable, AsyncIterator
+
+import aiohttp
+
+from src.utils.config import (
+    API_BASE_URL,
+    API_KEY,
+    UPSTREAM_CONNECT_TIMEOUT,
+    UPSTREAM_DNS_CACHE_TTL,
+    UPSTREAM_KEEPALIVE_TIMEOUT,
+    UPSTREAM_POOL_LIMIT,
+    UPSTREAM_POOL_LIMIT_PER_HOST,
+    UPSTREAM_READ_TIMEOUT,
+    UPSTREAM_STREAM_CHUNK_SIZE,
+    UPSTREAM_TOTAL_TIMEOUT,
+)
+
+
+# Cutout error codes and HTTP statuses meaning the API is over capacity
+OVERLOAD_ERROR_CODES = {5005}
+OVERLOAD_STATUS_CODES = {429, 503}
+
+
+class UpstreamError(Exception):
+    """Raised when a call to the cutout API fails or times out."""
+
+    def __init__(self, message, status_code=None, code=None, timeout=False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = code
+        self.timeout = timeout
+
+    @property
+    def overloaded(self) -> bool:
+        """True when the failure means the API has more work than it can take."""
+        return (
+            self.timeout
+            or self.code in OVERLOAD_ERROR_CODES
+            or self.status_code in OVERLOAD_STATUS_CODES
+        )
+
+
+class UpstreamClient:
+    """
+    App-lifetime async HTTP client for the cutout API.
+    One aiohttp session is shared by every request so TCP/TLS connections are
+    kept alive and reused, resolved hosts are cached, and every call has a timeout.
+    """
+
+    def __init__(self, base_url=API_BASE_URL, api_key=API_KEY):
+        self.base_url = base_url
+        self.api_key = api_key
+        self._session = None
+
+    def _create_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=UPSTREAM_POOL_LIMIT,
+            limit_per_host=UPSTREAM_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=UPSTREAM_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=UPSTREAM_DNS_CACHE_TTL,
+            use_dns_cache=True,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=UPSTREAM_TOTAL_TIMEOUT,
+            sock_connect=UPSTREAM_CONNECT_TIMEOUT,
+            sock_read=UPSTREAM_READ_TIMEOUT,
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            headers={"APIKEY": self.api_key or ""},
+        )
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # Created lazily so scripts that never run the app lifespan still work
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+        return self._session
+
+    async def start(self):
+        """Open the shared session, called once from the app lifespan."""
+        _ = self.session
+
+    async def close(self):
+        """Close the shared session and all pooled connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def post_file(self, endpoint: str, image_bytes: bytes) -> bytes:
+        """
+        Uploads an image as multipart form data and returns the response body.
+        Parameters:
+            endpoint (str): API path including the query string, e.g. "/api/v1/matting?mattingType=6".
+            image_bytes (bytes): The image data to upload.
+        Returns:
+            bytes: The raw response body.
+        Raises:
+            UpstreamError: If the request fails, times out or returns an HTTP error.
+        """
+        form = aiohttp.FormData()
+        form.add_field("file", image_bytes, filename="file")
+        try:
+            async with self.session.post(self.base_url + endpoint, data=form) as response:
+                response.raise_for_status()
+                await self._raise_for_error_body(response)
+                return await response.read()
+        except aiohttp.ClientResponseError as e:
+            raise UpstreamError(str(e), status_code=e.status)
+        except asyncio.TimeoutError as e:
+            raise UpstreamError(repr(e), timeout=True)
+        except aiohttp.ClientError as e:
+            raise UpstreamError(repr(e))
+
+    @staticmethod
+    async def _raise_for_error_body(response: aiohttp.ClientResponse):
+        # Image endpoints answer failures with a JSON body such as {"code": 5005, "msg": ...}
+        if response.content_type != "application/json":
+            return
+        try:
+            body = await response.json(content_type=None)
+        except ValueError:
+            return
+        code = body.get("code") if isinstance(body, dict) else None
+        if code:
+            response.release()
+            raise UpstreamError(
+                f"{code}, message='{body.get('msg')}'",
+                status_code=response.status,
+                code=code,
+            )
+
+    async def open_stream(
+        self,
+        endpoint: str,
+        chunks: AsyncIterable[bytes],
+        content_type: str = "application/octet-stream",
+    ) -> aiohttp.ClientResponse:
+        """
+        Uploads an image from an async chunk iterator without buffering it.
+        The returned response is open and must be consumed with iter_response(),
+        which releases the connection back to the pool.
+        Raises:
+            UpstreamError: If the request fails, times out or returns an HTTP error.
+        """
+        with aiohttp.MultipartWriter("form-data") as writer:
+            part = writer.append(chunks, {"Content-Type": content_type})
+            part.set_content_disposition("form-data", name="file", filename="file")
+        try:
+            response = await self.session.post(self.base_url + endpoint, data=writer)
+        except asyncio.TimeoutError as e:
+            raise UpstreamError(repr(e), timeout=True)
+        except aiohttp.ClientError as e:
+            raise UpstreamError(repr(e))
+        if response.status >= 400:
+            response.release()
+            raise UpstreamError(
+                f"{response.status}, message='{response.reason}'",
+                status_code=response.status,
+            )
+        try:
+            await self._raise_for_error_body(response)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            response.release()
+            raise UpstreamError(repr(e))
+        return response
+
+    @staticmethod
+    async def iter_response(
+        response: aiohttp.ClientResponse, chunk_size: int = UPSTREAM_STREAM_CHUNK_SIZE
+    ) -> AsyncIterator[bytes]:
+        """Relays an open response body chunk by chunk as it arrives."""
+        try:
+            async for chunk in response.content.iter_chunked(chunk_size):
+                yield chunk
+        finally:
+            response.release()
+
+    async def get_json(self, endpoint: str) -> dict:
+        """
+        Sends a GET request and returns the decoded JSON body.
+        Raises:
+            UpstreamError: If the request fails, times out or returns an HTTP error.
+        """
+        try:
+            async with self.session.get(self.base_url + endpoint) as response:
+                response.raise_for_status()
+                return await response.json(content_type=None)
+        except aiohttp.ClientResponseError as e:
+            raise UpstreamError(str(e), status_code=e.status)
+        except asyncio.TimeoutError as e:
+            raise UpstreamError(repr(e), timeout=True)
+        except aiohttp.ClientError as e:
+            raise UpstreamError(repr(e))
+
+
+# Shared client, opened and closed by the app lifespan in main.py
+upstream_client = UpstreamClient()
@@ -1,23 +1,29 @@
-import json
 import random
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
 
-import requests
 from fastapi import HTTPException, status
-from jinja2 import Environment, FileSystemLoader
 
+from src.queries.tracking import TrackingQuery
 from src.queries.users import UserQuery
 from src.services.base import Base_Services
+from src.services.credits import credit_ledger
+from src.services.outbox import email_templates
+from src.services.passwords import password_hasher
+from src.services.upstream import UpstreamError
 from src.utils.config import (
     API_BASE_URL,
     API_KEY,
     PASSWORD_RESET_TEMPLATE,
     PASSWORD_REST_OTP_EXPIRE_MINUTES,
-    TEMPLATES_PATH,
+    USAGE_SUMMARY_DEFAULT_DAYS,
+    USAGE_SUMMARY_MAX_DAYS,
 )
 from src.utils.map_helper import build_users_dict
 
 
+USER_NOT_FOUND = {"detail": "User doesn't Exist."}
+
+
 class User_Services(Base_Services):
     def __init__(self, endpoint):
         super().__init__()
@@ -25,9 +31,9 @@ class User_Services(Base_Services):
         self.api_base_url = API_BASE_URL
         self.api_key = API_KEY
 
-    def forget_password(self, email):
+    async def forget_password(self, email):
         # Check User Exist
-        user = UserQuery.get_user_data(email)
+        user = await UserQuery.get_user_data(email)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -42,7 +48,7 @@ class User_Services(Base_Services):
             minutes=PASSWORD_REST_OTP_EXPIRE_MINUTES
         )
         user_data["otp_expiration_time"] = expiration_time
-        user_result = UserQuery.update_user_data(user_data)
+        user_result = await UserQuery.update_user_data(user_data)
         if not user_result:
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
@@ -69,97 +75,125 @@ class User_Services(Base_Services):
             "otp": otp,
             "expire_minutes": PASSWORD_REST_OTP_EXPIRE_MINUTES,
         }
-        try:
-            # Set up the Jinja2 environment with the directory containing the HTML file
-            env = Environment(loader=FileSystemLoader(TEMPLATES_PATH))
-            # Load the HTML template
-            template = env.get_template(PASSWORD_RESET_TEMPLATE)
-            # Render the template with the data
-            rendered_html = template.render(data)
-        except FileNotFoundError:
-            print("The email template file was not found.")
-            return
-        try:
-            self.send_email(
-                recipient_email=recipient_email,
-                subject=subject,
-                html_content=rendered_html,
-            )
-        except Exception as e:
-            print(f"An error occurred: {e}")
+        # Render the template compiled at startup
+        rendered_html = email_templates.render(PASSWORD_RESET_TEMPLATE, data)
+        if rendered_html is None:
             return
+        # Queue the email, it is sent after the response
+        self.send_email(
+            recipient_email=recipient_email,
+            subject=subject,
+            html_content=rendered_html,
+        )
 
-    def UserInfo(self, email):
+    async def UserInfo(self, email):
         # Add your logic to store the user in your database
         # For demonstration, this is just a placeholder function call
-        user_result = UserQuery.get_user_data(email)
+        user_result = await UserQuery.get_user_data(email)
         if user_result:
             data = build_users_dict(user_result)
             return data, status.HTTP_200_OK
-        return {"detail": "User doesn't Exist."}, status.HTTP_406_NOT_ACCEPTABLE
+        return USER_NOT_FOUND, status.HTTP_406_NOT_ACCEPTABLE
 
-    def UpdateUserPassword(self, email, user_data):
+    async def UpdateUserPassword(self, email, user_data):
         if user_data.re_password == user_data.new_password:
             # Add your logic to store the user in your database
             # For demonstration, this is just a placeholder function call
-            hashed_password = self.pwd_context.hash(user_data.new_password)
+            hashed_password = await password_hasher.hash(user_data.new_password)
             user_data = dict()
             user_data["email"] = email
             user_data["password"] = hashed_password
-            user_result = UserQuery.update_user_data(user_data)
+            # Updates only an active user, no SELECT beforehand
+            user_result = await UserQuery.update_active_user(user_data)
             if user_result:
                 return build_users_dict(user_result, "update"), status.HTTP_200_OK
+            return USER_NOT_FOUND, status.HTTP_406_NOT_ACCEPTABLE
         return {
             "detail": "User doesn't Updated successfully."
         }, status.HTTP_400_BAD_REQUEST
 
-    def UpdateUserPasswordByOTP(self, email, user_data):
+    async def UpdateUserPasswordByOTP(self, email, user_data):
         if user_data.re_password == user_data.new_password:
             # Add your logic to store the user in your database
             # For demonstration, this is just a placeholder function call
-            hashed_password = self.pwd_context.hash(user_data.new_password)
-            user_data = dict()
-            user_data["email"] = email
-            user_data["password"] = hashed_password
-            user_data["otp"] = user_data.otp
-            user_data["is_verified"] = True
-            user_result = UserQuery.update_user_data(user_data)
+            hashed_password = await password_hasher.hash(user_data.new_password)
+            values = dict()
+            values["email"] = email
+            values["password"] = hashed_password
+            values["otp"] = user_data.otp
+            values["is_verified"] = True
+            # Updates only an active user, no SELECT beforehand
+            user_result = await UserQuery.update_active_user(values)
             if user_result:
                 return build_users_dict(user_result, "update"), status.HTTP_200_OK
+            return USER_NOT_FOUND, status.HTTP_406_NOT_ACCEPTABLE
         return {
             "detail": "User doesn't Updated successfully."
         }, status.HTTP_400_BAD_REQUEST
 
-    def DeleteUser(self, email):
+    async def DeleteUser(self, email):
         # Add your logic to store the user in your database
         # For demonstration, this is just a placeholder function call
         user_data = dict()
         user_data["email"] = email
         user_data["deleted_at"] = datetime.now(timezone.utc)
         user_data["is_verified"] = False
-        user_result = UserQuery.update_user_data(user_data)
+        # Soft deletes only an active user, no SELECT beforehand
+        user_result = await UserQuery.update_active_user(user_data)
         if user_result:
             return {
                 "detail": "User Account Deleted Successfully."
             }, status.HTTP_202_ACCEPTED
-        return {
-            "detail": "User Account doesn't Deleted successfully."
-        }, status.HTTP_400_BAD_REQUEST
+        return USER_NOT_FOUND, status.HTTP_406_NOT_ACCEPTABLE
 
-    def fetch_credit_balance(self):
+    async def fetch_credit_balance(self):
         """
-        Get current credit balance through API.
+        Get the current credit balance from the credit ledger, fetched from the
+        API only when the cached balance is older than CREDIT_BALANCE_TTL.
         """
         try:
-            endpoint = "/api/v1/mySubscription"
-            response = requests.get(
-                self.api_base_url + endpoint,
-                headers={"APIKEY": self.api_key},
-            )
-            response.raise_for_status()  # This will raise an exception for HTTP error codes
-            response_str = response.content.decode(encoding="utf-8")  #
-            balance = int(json.loads(response_str)["data"]["monthBalance"])
-            content = {"credits": balance}
+            content = await credit_ledger.get_balance()
             return content, status.HTTP_200_OK
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"An error occurred while enhancing the photo: {e}")
+        except UpstreamError as e:
+            raise Exception(f"An error occurred while fetching the credit balance: {e}")
+
+    async def usage_summary(self, email, start: date = None, end: date = None):
+        """
+        Sums the calls, credits and failed calls of a user per day and per service
+        type between two UTC days (inclusive), read from the daily rollup so the
+        cost doesn't grow with the tracking table.
+        Parameters:
+            email (str): The user's email.
+            start (date): First day, USAGE_SUMMARY_DEFAULT_DAYS before end when None.
+            end (date): Last day, today when None.
+        Returns:
+            tuple: The summary and the status code.
+        """
+        end = end or datetime.now(timezone.utc).date()
+        start = start or end - timedelta(days=USAGE_SUMMARY_DEFAULT_DAYS - 1)
+        if start > end or (end - start).days >= USAGE_SUMMARY_MAX_DAYS:
+            content = {
+                "detail": f"start must be before end and at most {USAGE_SUMMARY_MAX_DAYS} days apart."
+            }
+            return content, status.HTTP_400_BAD_REQUEST
+        rows = await TrackingQuery.get_usage(email, start, end)
+        totals = {"calls": 0, "credits": 0, "errors": 0}
+        services = dict()
+        days = []
+        for row in rows or ():
+            usage = {"calls": row.calls, "credits": row.credits, "errors": row.errors}
+            service = services.setdefault(row.service_type, dict.fromkeys(totals, 0))
+            for key, value in usage.items():
+                totals[key] += value
+                service[key] += value
+            days.append(
+                {"day": row.day.isoformat(), "service_type": row.service_type, **usage}
+            )
+        content = {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "totals": totals,
+            "services": services,
+            "days": days,
+        }
+        return content, status.HTTP_200_OK
@@ -1,10 +1,73 @@
-from fastapi import HTTPException
+import warnings
+
+from fastapi import HTTPException, status
+from PIL import Image
+
+from src.utils.config import UPLOAD_MAX_FILE_BYTES, UPLOAD_MAX_PIXELS
+
+# Accepted formats, the magic bytes their files start with and their media type
+IMAGE_SIGNATURES = {
+    "JPEG": b"\xff\xd8\xff",
+    "PNG": b"\x89PNG\r\n\x1a\n",
+}
+IMAGE_MEDIA_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png"}
+SIGNATURE_LENGTH = max(len(signature) for signature in IMAGE_SIGNATURES.values())
+
+
+def sniff_image_format(head: bytes):
+    """Returns the accepted format whose magic bytes start head, None otherwise."""
+    for image_format, signature in IMAGE_SIGNATURES.items():
+        if head.startswith(signature):
+            return image_format
+    return None
 
 
 def image_type_validate(image):
-    # Validate image format (for this example, we're only allowing JPEGs)
-    if image.content_type not in ["image/jpeg", "image/jpg", "image/png"]:
+    """
+    Preflight check of an upload before it is read or sent to the cutout API.
+    The real format comes from the magic bytes and the dimensions from the image
+    header, the client's content_type isn't trusted. Only the header is parsed,
+    the pixel data is never decoded.
+    Parameters:
+        image (UploadFile): The uploaded image, its file position is reset to 0.
+    Returns:
+        tuple: The sniffed format and the (width, height) of the image.
+    Raises:
+        HTTPException: 400 for an unsupported or corrupt image, 413 for a file
+        over UPLOAD_MAX_FILE_BYTES or an image over UPLOAD_MAX_PIXELS.
+    """
+    file = image.file
+    size = image.size
+    if size is None:
+        size = file.seek(0, 2)
+    if size > UPLOAD_MAX_FILE_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Image is larger than {UPLOAD_MAX_FILE_BYTES} bytes.",
+        )
+    file.seek(0)
+    image_format = sniff_image_format(file.read(SIGNATURE_LENGTH))
+    file.seek(0)
+    if image_format is None:
         raise HTTPException(
             status_code=400,
             detail="Unsupported image format. Please upload a JPEG, JPG, or PNG image.",
         )
+    try:
+        # PIL's own bomb check is replaced by the UPLOAD_MAX_PIXELS limit below
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            with Image.open(file, formats=[image_format]) as header:
+                width, height = header.size
+    except Image.DecompressionBombError:
+        width, height = None, None
+    except Exception:
+        raise HTTPException(status_code=400, detail="Image file is corrupt.")
+    finally:
+        file.seek(0)
+    if width is None or width * height > UPLOAD_MAX_PIXELS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Image has more than {UPLOAD_MAX_PIXELS} pixels.",
+        )
+    return image_format, (width, height)
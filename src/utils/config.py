@@ -1,4 +1,4 @@
-from os import getenv
+from os import cpu_count, getenv
 
 from dotenv.main import load_dotenv
 from termcolor import colored
@@ -49,6 +49,51 @@ if ACCESS_TOKEN_EXPIRE_MINUTES == 0 and ACCESS_TOKEN_EXPIRE_HOURS == 0:
         )
     )
 
+# ---------- Token Cache Config ----------
+
+# Cache verified bearer tokens until their exp instead of decoding them on every request
+TOKEN_CACHE_ENABLED = getenv("TOKEN_CACHE_ENABLED", "true").lower() == "true"
+TOKEN_CACHE_MAX_ITEMS = int(getenv("TOKEN_CACHE_MAX_ITEMS", 10000))
+
+# ---------- Metrics Config ----------
+
+# Token /metrics/ requires in the X-Metrics-Token header, the endpoint answers 403 when unset
+METRICS_TOKEN = getenv("METRICS_TOKEN")
+
+# ---------- Rate Limit Config ----------
+
+# Token buckets per user (JWT sub) and per client IP, checked before any route runs
+RATE_LIMIT_ENABLED = getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Burst size and refill in tokens per second, a request takes its route cost from both buckets
+RATE_LIMIT_USER_CAPACITY = float(getenv("RATE_LIMIT_USER_CAPACITY", 60))
+RATE_LIMIT_USER_RATE = float(getenv("RATE_LIMIT_USER_RATE", 1))
+RATE_LIMIT_IP_CAPACITY = float(getenv("RATE_LIMIT_IP_CAPACITY", 120))
+RATE_LIMIT_IP_RATE = float(getenv("RATE_LIMIT_IP_RATE", 2))
+# "[METHOD ]path prefix=cost" rules, the longest matching prefix wins, other routes cost 1
+# A batch is charged its route cost once per valid file, the files over the limit are refused
+RATE_LIMIT_ROUTE_COSTS = getenv(
+    "RATE_LIMIT_ROUTE_COSTS",
+    "POST /preprocessing/=10,POST /jobs/=10,POST /auth/=5,PUT /user/update-password/=5",
+)
+# Path prefixes never limited
+RATE_LIMIT_EXEMPT_PATHS = getenv("RATE_LIMIT_EXEMPT_PATHS", "/docs,/redoc,/openapi.json")
+# Bucket shards per worker, each holding at most RATE_LIMIT_MAX_BUCKETS / shards buckets
+RATE_LIMIT_SHARDS = int(getenv("RATE_LIMIT_SHARDS", 16))
+RATE_LIMIT_MAX_BUCKETS = int(getenv("RATE_LIMIT_MAX_BUCKETS", 100000))
+# Seconds a bucket may go unused before it is evicted, a full bucket loses nothing when evicted
+RATE_LIMIT_IDLE_SECONDS = float(getenv("RATE_LIMIT_IDLE_SECONDS", 300))
+# Take the client IP from the last X-Forwarded-For entry (set by our proxy) instead of the socket
+RATE_LIMIT_TRUST_FORWARDED = getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+
+# ---------- Password Hashing Config ----------
+
+# bcrypt cost, hashes made with another cost are upgraded on the next login
+BCRYPT_ROUNDS = int(getenv("BCRYPT_ROUNDS", 12))
+# Threads hashing and verifying passwords, per API worker
+PASSWORD_HASH_WORKERS = int(getenv("PASSWORD_HASH_WORKERS", 2))
+# Operations allowed to wait for a free thread, and how long they may wait in seconds
+PASSWORD_HASH_QUEUE_SIZE = int(getenv("PASSWORD_HASH_QUEUE_SIZE", 64))
+PASSWORD_HASH_QUEUE_TIMEOUT = float(getenv("PASSWORD_HASH_QUEUE_TIMEOUT", 5))
 
 # ---------- DataBase Config ----------
 
@@ -57,12 +102,134 @@ DB_PORT = getenv("DB_PORT")
 DB_PASSWORD = getenv("DB_PASSWORD")
 DB_NAME = getenv("DB_NAME")
 DB_USER = getenv("DB_USER")
+# Connection pool of each engine, per API worker
+DB_POOL_SIZE = int(getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(getenv("DB_MAX_OVERFLOW", 10))
+# Seconds to wait for a free connection before failing
+DB_POOL_TIMEOUT = float(getenv("DB_POOL_TIMEOUT", 30))
+# Seconds after which a connection is replaced, below the server/LB idle timeout
+DB_POOL_RECYCLE = int(getenv("DB_POOL_RECYCLE", 1800))
+# Test connections on checkout so ones dropped while idle are replaced transparently
+DB_POOL_PRE_PING = getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+# ---------- User Cache Config ----------
+
+# Cache user rows by email in front of the user queries
+USER_CACHE_ENABLED = getenv("USER_CACHE_ENABLED", "true").lower() == "true"
+# Seconds a row is served from memory, also bounds staleness across workers
+USER_CACHE_TTL = float(getenv("USER_CACHE_TTL", 30))
+USER_CACHE_MAX_ITEMS = int(getenv("USER_CACHE_MAX_ITEMS", 10000))
 
 # ---------- CutOut Config ----------
 
 API_BASE_URL = getenv("API_BASE_URL")
 API_KEY = getenv("API_KEY")
 
+# ---------- Upstream HTTP Client Config ----------
+
+# Total connections kept in the pool and the share allowed per upstream host
+UPSTREAM_POOL_LIMIT = int(getenv("UPSTREAM_POOL_LIMIT", 100))
+UPSTREAM_POOL_LIMIT_PER_HOST = int(getenv("UPSTREAM_POOL_LIMIT_PER_HOST", 30))
+# Seconds an idle keep-alive connection stays open and resolved hosts stay cached
+UPSTREAM_KEEPALIVE_TIMEOUT = float(getenv("UPSTREAM_KEEPALIVE_TIMEOUT", 30))
+UPSTREAM_DNS_CACHE_TTL = int(getenv("UPSTREAM_DNS_CACHE_TTL", 300))
+# Timeouts in seconds, the total timeout covers upload, processing and download
+UPSTREAM_CONNECT_TIMEOUT = float(getenv("UPSTREAM_CONNECT_TIMEOUT", 10))
+UPSTREAM_READ_TIMEOUT = float(getenv("UPSTREAM_READ_TIMEOUT", 60))
+UPSTREAM_TOTAL_TIMEOUT = float(getenv("UPSTREAM_TOTAL_TIMEOUT", 120))
+# Chunk size in bytes used when streaming uploads to and responses from the API
+UPSTREAM_STREAM_CHUNK_SIZE = int(getenv("UPSTREAM_STREAM_CHUNK_SIZE", 64 * 1024))
+
+# ---------- Upstream Concurrency Limiter Config ----------
+
+# Bounds of the adaptive in-flight limit kept per upstream operation
+UPSTREAM_LIMIT_INITIAL = int(getenv("UPSTREAM_LIMIT_INITIAL", 8))
+UPSTREAM_LIMIT_MIN = int(getenv("UPSTREAM_LIMIT_MIN", 1))
+UPSTREAM_LIMIT_MAX = int(getenv("UPSTREAM_LIMIT_MAX", 64))
+# Multiplier applied to the limit when the API reports overload (5005, 429, timeouts)
+UPSTREAM_LIMIT_BACKOFF = float(getenv("UPSTREAM_LIMIT_BACKOFF", 0.5))
+# Latency above baseline * tolerance counts as unhealthy and stops the limit growing
+UPSTREAM_LIMIT_LATENCY_TOLERANCE = float(getenv("UPSTREAM_LIMIT_LATENCY_TOLERANCE", 2.0))
+# Requests over the limit wait in a bounded queue for at most this many seconds
+UPSTREAM_LIMIT_QUEUE_SIZE = int(getenv("UPSTREAM_LIMIT_QUEUE_SIZE", 100))
+UPSTREAM_LIMIT_QUEUE_TIMEOUT = float(getenv("UPSTREAM_LIMIT_QUEUE_TIMEOUT", 30))
+
+# ---------- Result Cache Config ----------
+
+RESULT_CACHE_ENABLED = getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+# In-memory LRU tier, bounded by entry count and total bytes
+RESULT_CACHE_MEMORY_ITEMS = int(getenv("RESULT_CACHE_MEMORY_ITEMS", 256))
+RESULT_CACHE_MEMORY_BYTES = int(getenv("RESULT_CACHE_MEMORY_BYTES", 256 * 1024 * 1024))
+# On-disk tier, least recently used files are evicted above the size cap
+RESULT_CACHE_DISK_PATH = getenv("RESULT_CACHE_DISK_PATH", "src/static/cache")
+RESULT_CACHE_DISK_BYTES = int(getenv("RESULT_CACHE_DISK_BYTES", 2 * 1024 * 1024 * 1024))
+# Results bigger than this are never cached
+RESULT_CACHE_MAX_ITEM_BYTES = int(getenv("RESULT_CACHE_MAX_ITEM_BYTES", 32 * 1024 * 1024))
+
+# ---------- Batch Preprocessing Config ----------
+
+# Maximum files accepted per batch and files processed at the same time per batch
+BATCH_MAX_FILES = int(getenv("BATCH_MAX_FILES", 50))
+BATCH_CONCURRENCY = int(getenv("BATCH_CONCURRENCY", 4))
+
+# ---------- Local Enhancement Config ----------
+
+# Output encoding of /enhance-photo-local/, PNG level 1 is several times faster than the default 6
+ENHANCE_PNG_COMPRESS_LEVEL = int(getenv("ENHANCE_PNG_COMPRESS_LEVEL", 1))
+ENHANCE_JPEG_QUALITY = int(getenv("ENHANCE_JPEG_QUALITY", 92))
+# Rows enhanced per strip, bounds the temporary memory of the local engine
+ENHANCE_STRIP_ROWS = int(getenv("ENHANCE_STRIP_ROWS", 256))
+
+# ---------- Image Process Pool Config ----------
+
+# Processes decoding, transforming and encoding images off the event loop, per API worker
+IMAGE_POOL_WORKERS = int(getenv("IMAGE_POOL_WORKERS", max(1, (cpu_count() or 2) // 2)))
+# Tasks allowed to wait for a free process, and how long they may wait in seconds
+IMAGE_POOL_QUEUE_SIZE = int(getenv("IMAGE_POOL_QUEUE_SIZE", 32))
+IMAGE_POOL_QUEUE_TIMEOUT = float(getenv("IMAGE_POOL_QUEUE_TIMEOUT", 10))
+
+# ---------- Upload Validation Config ----------
+
+# Largest upload accepted, checked before the file is read
+UPLOAD_MAX_FILE_BYTES = int(getenv("UPLOAD_MAX_FILE_BYTES", 50 * 1024 * 1024))
+# Largest width x height accepted, guards against decompression bombs
+UPLOAD_MAX_PIXELS = int(getenv("UPLOAD_MAX_PIXELS", 100_000_000))
+
+# ---------- Upload Optimization Config ----------
+
+# Downscale, strip metadata and re-encode images before sending them to the cutout API
+UPLOAD_OPTIMIZE_ENABLED = getenv("UPLOAD_OPTIMIZE_ENABLED", "true").lower() == "true"
+# Default longest edge in pixels, operations can lower it in upload_max_sides
+UPLOAD_MAX_SIDE = int(getenv("UPLOAD_MAX_SIDE", 4096))
+# JPEG quality used when re-encoding photos
+UPLOAD_JPEG_QUALITY = int(getenv("UPLOAD_JPEG_QUALITY", 90))
+# Cutout API upload limit, larger files are always re-encoded
+UPLOAD_MAX_BYTES = int(getenv("UPLOAD_MAX_BYTES", 15 * 1024 * 1024))
+
+# ---------- Output Format Config ----------
+
+# Default quality (1-100) and effort (0-6) when a response is transcoded
+TRANSCODE_QUALITY = int(getenv("TRANSCODE_QUALITY", 80))
+TRANSCODE_EFFORT = int(getenv("TRANSCODE_EFFORT", 4))
+
+# ---------- Mask Cache Config ----------
+
+# Encoded masks kept in memory, keyed by width, height and format
+MASK_CACHE_ITEMS = int(getenv("MASK_CACHE_ITEMS", 512))
+
+# ---------- Job Queue Config ----------
+
+# Jobs each worker process runs at the same time
+JOB_WORKER_CONCURRENCY = int(getenv("JOB_WORKER_CONCURRENCY", 4))
+# Seconds an idle worker waits before polling the jobs table again
+JOB_POLL_INTERVAL = float(getenv("JOB_POLL_INTERVAL", 1))
+# Failed jobs are retried until they reach this number of attempts
+JOB_MAX_ATTEMPTS = int(getenv("JOB_MAX_ATTEMPTS", 3))
+# Seconds after which a running job of a crashed worker can be claimed again
+JOB_VISIBILITY_TIMEOUT = int(getenv("JOB_VISIBILITY_TIMEOUT", 300))
+# Seconds between sweeps failing the jobs a crashed worker left on their last attempt
+JOB_SWEEP_INTERVAL = float(getenv("JOB_SWEEP_INTERVAL", 60))
+
 
 def get_database_url():
     """It will Generate Database URL for PostgreSQL To connect with
@@ -73,6 +240,16 @@ def get_database_url():
     return f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
 
+def get_async_database_url():
+    """It will Generate Database URL for PostgreSQL with the asyncpg driver,
+    used by the application queries. Alembic keeps the sync URL.
+
+    Returns:
+        string: Database Url to open async connections with it
+    """
+    return f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+
 # ---------- Domain URL ----------
 Domain_BASE_URL = getenv("Domain_BASE_URL")
 
@@ -83,7 +260,57 @@ EMAIL_SENDER_PASSWORD = getenv("EMAIL_SENDER_PASSWORD")
 EMAIL_SMTP_SERVER = getenv("EMAIL_SMTP_SERVER")
 EMAIL_SMTP_PORT = getenv("EMAIL_SMTP_PORT")
 
+# ---------- Email Outbox Config ----------
+
+# smtp, or memory to keep sent messages in the process (tests, local runs)
+EMAIL_BACKEND = getenv("EMAIL_BACKEND", "smtp")
+# Upgrade with STARTTLS, disable for a local SMTP server without TLS
+EMAIL_SMTP_STARTTLS = getenv("EMAIL_SMTP_STARTTLS", "true").lower() == "true"
+EMAIL_SMTP_TIMEOUT = float(getenv("EMAIL_SMTP_TIMEOUT", 10))
+# Seconds a pooled SMTP connection may stay idle before it is reopened
+EMAIL_SMTP_IDLE_TIMEOUT = float(getenv("EMAIL_SMTP_IDLE_TIMEOUT", 60))
+# Senders per worker, each keeps one authenticated SMTP connection open
+EMAIL_SENDERS = int(getenv("EMAIL_SENDERS", 2))
+# Messages waiting to be sent, new ones are dropped when it is full
+EMAIL_QUEUE_SIZE = int(getenv("EMAIL_QUEUE_SIZE", 1000))
+# Attempts per message, retried after backoff * 2^attempt seconds
+EMAIL_MAX_ATTEMPTS = int(getenv("EMAIL_MAX_ATTEMPTS", 5))
+EMAIL_RETRY_BACKOFF = float(getenv("EMAIL_RETRY_BACKOFF", 1))
+# Seconds given to the queued messages on shutdown
+EMAIL_SHUTDOWN_TIMEOUT = float(getenv("EMAIL_SHUTDOWN_TIMEOUT", 10))
+
 # ---------- Templates Paths ----------
-TEMPLATES_PATH = "/home/CF-ClarityKit/ClarityKit-Backend/templates"
+TEMPLATES_PATH = getenv("TEMPLATES_PATH", "/home/CF-ClarityKit/ClarityKit-Backend/templates")
 VERIFY_TEMPLATE = getenv("VERIFY_TEMPLATE")
 PASSWORD_RESET_TEMPLATE = getenv("PASSWORD_RESET_TEMPLATE")
+
+# ---------- Tracking Config ----------
+
+# Record preprocessing calls in the tracking table, written in batches off the request path
+TRACKING_ENABLED = getenv("TRACKING_ENABLED", "true").lower() == "true"
+# Records held in memory per worker while waiting to be written
+TRACKING_QUEUE_SIZE = int(getenv("TRACKING_QUEUE_SIZE", 10000))
+# A batch is written when it reaches this many records or after this many seconds
+TRACKING_BATCH_SIZE = int(getenv("TRACKING_BATCH_SIZE", 500))
+TRACKING_FLUSH_INTERVAL = float(getenv("TRACKING_FLUSH_INTERVAL", 2))
+# What happens to records when the queue is full: drop_newest, drop_oldest or spill (to disk)
+TRACKING_OVERFLOW = getenv("TRACKING_OVERFLOW", "drop_newest")
+TRACKING_SPILL_PATH = getenv("TRACKING_SPILL_PATH", "src/static/tracking/spill.jsonl")
+# Writes the database rejects (not connection failures) before a record is spilled or dropped
+TRACKING_MAX_ATTEMPTS = int(getenv("TRACKING_MAX_ATTEMPTS", 5))
+# Monthly tracking partitions created ahead of the current month
+TRACKING_PARTITION_MONTHS_AHEAD = int(getenv("TRACKING_PARTITION_MONTHS_AHEAD", 2))
+# Seconds the final flush may take on shutdown
+TRACKING_SHUTDOWN_TIMEOUT = float(getenv("TRACKING_SHUTDOWN_TIMEOUT", 10))
+# Days covered by /user/usage-summary/ by default and at most
+USAGE_SUMMARY_DEFAULT_DAYS = int(getenv("USAGE_SUMMARY_DEFAULT_DAYS", 30))
+USAGE_SUMMARY_MAX_DAYS = int(getenv("USAGE_SUMMARY_MAX_DAYS", 366))
+
+# ---------- Credit Ledger Config ----------
+
+# Track the cutout API credits locally and reject calls the balance can't cover
+CREDIT_LEDGER_ENABLED = getenv("CREDIT_LEDGER_ENABLED", "true").lower() == "true"
+# Seconds the upstream balance is served from memory by /user/credit-balance/
+CREDIT_BALANCE_TTL = float(getenv("CREDIT_BALANCE_TTL", 30))
+# Seconds between background reconciliations with the upstream balance
+CREDIT_RECONCILE_INTERVAL = float(getenv("CREDIT_RECONCILE_INTERVAL", 60))
@@ -0,0 +1,75 @@
+import asyncio
+import signal
+
+from src.database.database import async_engine
+from src.queries.jobs import JobQuery
+from src.services.credits import credit_ledger
+from src.services.jobs import execute_job
+from src.services.process_pool import image_process_pool
+from src.services.tracking import tracking_recorder
+from src.services.upstream import upstream_client
+from src.utils.config import (
+    JOB_MAX_ATTEMPTS,
+    JOB_POLL_INTERVAL,
+    JOB_SWEEP_INTERVAL,
+    JOB_VISIBILITY_TIMEOUT,
+    JOB_WORKER_CONCURRENCY,
+)
+
+
+async def worker_loop(stop: asyncio.Event):
+    # Claim and run jobs one at a time until asked to stop
+    while not stop.is_set():
+        try:
+            job = await JobQuery.claim_job(JOB_VISIBILITY_TIMEOUT, JOB_MAX_ATTEMPTS)
+            if job:
+                await execute_job(job)
+                continue
+        except Exception as e:
+            print(f"Failed to run job. Error: {e}")
+        # Queue empty or database unavailable, wait before polling again
+        try:
+            await asyncio.wait_for(stop.wait(), JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def stale_job_sweeper(stop: asyncio.Event):
+    # Fail the jobs lost with a crashed worker on their last attempt
+    while not stop.is_set():
+        try:
+            failed = await JobQuery.fail_stale_jobs(JOB_VISIBILITY_TIMEOUT, JOB_MAX_ATTEMPTS)
+            if failed:
+                print(f"Marked {failed} stale jobs as failed.")
+        except Exception as e:
+            print(f"Failed to sweep stale jobs. Error: {e}")
+        try:
+            await asyncio.wait_for(stop.wait(), JOB_SWEEP_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_worker():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await upstream_client.start()
+    tracking_recorder.start()
+    credit_ledger.start()
+    try:
+        await asyncio.gather(
+            stale_job_sweeper(stop),
+            *(worker_loop(stop) for _ in range(JOB_WORKER_CONCURRENCY)),
+        )
+    finally:
+        await credit_ledger.close()
+        await tracking_recorder.close()
+        await image_process_pool.close()
+        await upstream_client.close()
+        await async_engine.dispose()
+
+
+# To run the job worker, scaled independently from the API: python worker.py
+if __name__ == "__main__":
+    asyncio.run(run_worker())